@@ -1,4 +1,5 @@
 from .checks import *
+from .common import *
 from gwmpy.bhp import *
 from gwmpy.broxml import *
 
@@ -1,5 +1,18 @@
 from gwmpy.checks import *
 from gwmpy.broxml import *
+from gwmpy.bhp.common import *
+from gwmpy.bhp.metrics import *
+from gwmpy.bhp.journal import *
+from gwmpy.bhp.ledger import *
+from gwmpy.bhp.ratelimit import *
+from gwmpy.bhp.scheduler import *
+from gwmpy.bhp.responses import *
 from gwmpy.bhp.connector import *
+from gwmpy.bhp.asyncconnector import *
+from gwmpy.bhp.validation import *
+from gwmpy.bhp.retrieval import *
+from gwmpy.bhp.planner import *
+from gwmpy.bhp.poller import *
+from gwmpy.bhp.pipeline import *
 
 
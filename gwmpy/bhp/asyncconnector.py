@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import base_urls, sourcedoc_added
+
+import asyncio
+import base64
+import json
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# asyncio counterpart of the connector. aiohttp is an optional dependency
+# (pip install gwmpy[async]), it is only imported when a client is opened.
+
+#%%
+
+def gen_basic_auth(token):
+
+    # Authorization header value of the token, as sent by the connector
+    # (requests encodes the credentials as latin-1)
+    credentials = '{}:{}'.format(token['user'], token['pass']).encode('latin-1')
+    return('Basic '+base64.b64encode(credentials).decode('ascii'))
+
+class bhp_async_response():
+
+    """
+    Response of the async client, with the attributes of requests.Response
+    used by the connector (status_code, headers, content, text, json).
+    """
+
+    def __init__(self, status_code, headers, content, url):
+
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self):
+
+        return(self.content.decode('utf8', errors='replace'))
+
+    def json(self):
+
+        return(json.loads(self.content))
+
+class bhp_async_client():
+
+    """
+    asyncio client for the bronhouderportaal api. All requests share one
+    aiohttp connection pool, and a semaphore limits the number of requests
+    in flight, so one event loop can drive many validations and deliveries
+    concurrently. Use as async context manager:
+
+        async with bhp_async_client(demo=True) as client:
+            info = await client.validate_sourcedoc(sourcedoc, token)
+    """
+
+    def __init__(self, demo=False, base_url=None, max_connections=100, max_concurrency=100):
+
+        """
+
+        Parameters
+        ----------
+        demo : Bool
+            Defaults to False. If true, the test environment
+            of the bronhouderportaal is selected for data exchange
+        base_url : string, optional
+            url of the api, overrides demo
+        max_connections : integer
+            size of the connection pool
+        max_concurrency : integer
+            maximum number of requests in flight
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if base_url is None:
+            base_url = base_urls['demo'] if demo==True else base_urls['production']
+
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.session = None
+        self.semaphore = None
+
+    async def open(self):
+
+        try:
+            import aiohttp
+        except ImportError:
+            raise Exception("Error: the async client requires aiohttp, install it with 'pip install aiohttp'")
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+
+        await self.open()
+        return(self)
+
+    async def __aexit__(self, *args):
+
+        await self.close()
+
+    async def request(self, method, url, token, **kwargs):
+
+        """
+        Sends a request with the shared session, at most max_concurrency at
+        the same time. All api calls of the client go through this method.
+        """
+
+        await self.open()
+
+        headers = dict(kwargs.pop('headers', None) or {}, Authorization=gen_basic_auth(token))
+
+        async with self.semaphore:
+            async with self.session.request(method, url, headers=headers, **kwargs) as res:
+                content = await res.read()
+                return(bhp_async_response(res.status, res.headers, content, str(res.url)))
+
+    # =============================================================================
+    # Validation
+    # =============================================================================
+
+    async def validate_sourcedoc(self, sourcedoc, token):
+
+        res = await self.request('POST', self.base_url+'/validatie', token,
+            data=sourcedoc,
+            headers={
+                "Content-Type": "application/xml"
+            },
+        )
+
+        return(res.json())
+
+    # =============================================================================
+    # Upload & delivery
+    # =============================================================================
+
+    async def create_upload(self, token):
+
+        res = await self.request('POST', self.base_url+'/uploads', token,
+            headers={
+                "Content-Type": "application/xml"
+            },
+        )
+
+        try:
+            return(res.headers['Location'])
+        except KeyError:
+            raise Exception('Error: {}'.format(res.text))
+
+    async def add_sourcedoc(self, upload_url, filename, sourcedoc, token):
+
+        res = await self.request('POST', upload_url+'/brondocumenten', token,
+            data=sourcedoc,
+            headers={'Content-type': 'application/xml'},
+            params={'filename':filename},
+        )
+
+        return(res)
+
+    async def add_sourcedocs(self, upload_url, sourcedocs, token):
+
+        """
+        Adds all source documents concurrently (limited by max_concurrency),
+        returns per filename the status code or the error message. A
+        sourcedoc is an XML string, bytes, a binary file object or a
+        function without arguments returning one of these (see
+        bhp_client.add_sourcedocs).
+
+        max_concurrency workers take the documents one by one from
+        sourcedocs, which may be an iterator: documents are only opened
+        when a worker sends them, so at most max_concurrency documents are
+        open or in memory at the same time.
+        """
+
+        if type(sourcedocs)==dict:
+            sourcedocs = sourcedocs.items()
+        sourcedocs = iter(sourcedocs)
+
+        codes = {}
+
+        async def add(filename, sourcedoc):
+            opened = callable(sourcedoc)
+            try:
+                if opened:
+                    sourcedoc = sourcedoc()
+                return((await self.add_sourcedoc(upload_url, filename, sourcedoc, token)).status_code)
+            except Exception as e:
+                return('Error: {}'.format(e))
+            finally:
+                if opened and hasattr(sourcedoc, 'close'):
+                    sourcedoc.close()
+
+        async def worker():
+            # Workers share the iterator, next() never runs concurrently
+            # within the event loop
+            for filename, sourcedoc in sourcedocs:
+                codes[filename] = await add(filename, sourcedoc)
+
+        await asyncio.gather(*[worker() for i in range(self.max_concurrency)])
+
+        return(codes)
+
+    async def deliver_upload(self, upload_url, token):
+
+        upload_id = upload_url.split('/')[-1]
+        payload = {'upload':int(upload_id)}
+
+        endresponse = await self.request('POST', self.base_url+'/leveringen', token,
+            data=json.dumps(payload),
+            headers={'Content-type': 'application/json'},
+        )
+
+        delivery_url_id = endresponse.headers['Location']
+        delivery = await self.request('GET', delivery_url_id, token)
+
+        return(delivery)
+
+    async def upload_sourcedocs_from_dict(self, sourcedocs, token):
+
+        """
+        Async counterpart of upload_sourcedocs_from_dict. The documents are
+        added concurrently, the upload is only delivered if all of them
+        were added successfully.
+        """
+
+        # Step 1: Create upload
+        try:
+            upload_url_id = await self.create_upload(token)
+        except Exception as e:
+            print('Error: unable to create an upload ({})'.format(e))
+            return('Error')
+
+        # Step 2: Add source documents to upload
+        status = await self.add_sourcedocs(upload_url_id, sourcedocs, token)
+
+        failed = dict((filename, code) for filename, code in status.items() if not sourcedoc_added(code))
+        if len(failed) > 0:
+            print('Error: Cannot add source documents to upload, upload not delivered: {}'.format(failed))
+            return('Error')
+
+        # Step 3: Deliver upload
+        try:
+            delivery = await self.deliver_upload(upload_url_id, token)
+        except:
+            print('Error: failed to deliver upload')
+            return('Error')
+
+        return(delivery)
+
+    # =============================================================================
+    # Status & retrieval
+    # =============================================================================
+
+    async def check_delivery_status(self, identifier, token):
+
+        return(await self.request('GET', self.base_url+'/leveringen/{}'.format(identifier), token))
+
+    async def get_sourcedocument(self, identifier, token):
+
+        return(await self.request('GET', self.base_url+'/brondocumenten/{}'.format(identifier), token))
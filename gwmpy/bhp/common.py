@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import sqlite3
+import threading
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# SQLite storage shared by the stores of the connector (upload journal,
+# delivery ledger, caches).
+
+#%%
+
+class sqlite_store():
+
+    """
+    Base class of the SQLite stores of the connector, e.g. upload_journal.
+    One connection is shared by all threads, every statement holds the
+    lock.
+    """
+
+    def __init__(self, path, tables=()):
+
+        """
+
+        Parameters
+        ----------
+        path : string
+            path of the SQLite database, created if it does not exist
+        tables : list, optional
+            CREATE TABLE / CREATE INDEX statements of the store
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in tables:
+                self.connection.execute(statement)
+
+    def close(self):
+
+        with self.lock:
+            self.connection.close()
+
+    def execute(self, sql, parameters=()):
+
+        with self.lock:
+            return(self.connection.execute(sql, parameters).fetchall())
+
+    @contextlib.contextmanager
+    def transaction(self):
+
+        """
+        Holds the lock and runs the statements of the block in one
+        transaction, which is rolled back if the block raises:
+
+            with self.transaction() as connection:
+                connection.executemany(...)
+        """
+
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                yield(self.connection)
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
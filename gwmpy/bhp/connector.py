@@ -4,10 +4,703 @@ Created on Wed Nov  3 11:41:54 2021
 
 """
 
+from gwmpy.common import submit_bounded
+from gwmpy.bhp.journal import upload_journal, gen_content_hash
+from gwmpy.bhp.ledger import delivery_ledger, gen_sourcedoc_info
+from gwmpy.bhp.ratelimit import adaptive_limiter, gen_request_key
+from gwmpy.bhp.metrics import start_span, end_span
+from gwmpy.bhp.responses import parse_validation_response, parse_delivery_response
+
 import requests
 import requests.auth
+import requests.adapters
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+import functools
+import io
 import json
 import os
+import re
+import threading
+import zlib
+
+# =============================================================================
+# Client
+# =============================================================================
+
+base_urls = {'demo':'https://demo.bronhouderportaal-bro.nl/api',
+             'production':'https://www.bronhouderportaal-bro.nl/api'}
+
+# zlib wbits of the supported Content-Encodings (HTTP deflate is zlib format)
+compression_wbits = {'gzip':16+zlib.MAX_WBITS,
+                     'deflate':zlib.MAX_WBITS}
+
+class bhp_client():
+
+    """
+    Client for the bronhouderportaal api. All requests go through one
+    requests.Session, so connections are pooled and kept alive between
+    calls instead of doing a new TCP+TLS handshake for every request.
+    """
+
+    def __init__(self, demo=False, base_url=None, pool_connections=10, pool_maxsize=10, max_retries=0,
+                 compression=None, compresslevel=6, limiter=None, instruments=None):
+
+        """
+
+        Parameters
+        ----------
+        demo : Bool
+            Defaults to False. If true, the test environment
+            of the bronhouderportaal is selected for data exchange
+        base_url : string, optional
+            url of the api, overrides demo (e.g. for a local stand-in server)
+        pool_connections : integer
+            number of connection pools (hosts) kept by the session
+        pool_maxsize : integer
+            maximum number of connections kept alive per host, should be at
+            least the number of threads using the client concurrently
+        max_retries : integer
+            number of retries of failed connections (not of failed requests)
+        compression : string, optional
+            'gzip' or 'deflate'. If given, source documents sent for
+            validation or added to an upload are compressed (Content-Encoding).
+            If an endpoint rejects the encoding of a compressed document
+            (415, or 400 with a message about the content encoding), the
+            document is sent again uncompressed and compression is switched
+            off for that endpoint. Other errors are returned as they are.
+        compresslevel : integer
+            zlib compression level, 1 (fast) to 9 (small)
+        limiter : adaptive_limiter, optional
+            limiter of the rate and concurrency of the requests, which may be
+            shared with other clients (see configure_limiter). Throttled
+            requests (429, 503) are retried by the limiter.
+        instruments : list, optional
+            request_instrument objects notified of every request of the
+            client, next to the instruments of the process (see
+            add_instrument)
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if base_url is None:
+            base_url = base_urls['demo'] if demo==True else base_urls['production']
+
+        if compression is not None and compression not in compression_wbits.keys():
+            raise Exception("Error: compression should be one of {}".format(list(compression_wbits.keys())))
+
+        self.base_url = base_url.rstrip('/')
+        self.limiter = limiter
+        self.scheduler = None # see request_scheduler.client
+        self.priority = 'normal'
+        self.account = None
+        self.instruments = list(instruments) if instruments is not None else []
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.compression_supported = {}
+        self.transfer_lock = threading.Lock()
+        self.transfer = {'documents':0, 'compressed':0, 'fallbacks':0, 'bytes':0, 'bytes_sent':0}
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                pool_maxsize=pool_maxsize,
+                                                max_retries=max_retries)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, token, **kwargs):
+
+        """
+        Sends a request with the session of the client. All api calls of the
+        client go through this method.
+        """
+
+        data = kwargs.get('data')
+        span = start_span(self.instruments, method, url, gen_body_size(data) if data is not None else 0)
+
+        def send():
+            if span is not None:
+                span['attempts'] += 1
+            return(self.session.request(method, url, auth=(token['user'],token['pass']), **kwargs))
+
+        def limited():
+            if self.limiter is None:
+                return(send())
+            # A file object that was sent has to be read again for a retry
+            rewind = None
+            if hasattr(data, 'seek'):
+                position = data.tell()
+                rewind = lambda: data.seek(position)
+            return(self.limiter.send(gen_request_key(method, url), send, rewind))
+
+        try:
+            if self.scheduler is None:
+                res = limited()
+            else:
+                # The scheduler slot is taken before the limiter slot, so a
+                # request waiting for its turn (or its time window) holds no
+                # limiter slot and its wait does not count as latency
+                with self.scheduler.slot(self.priority, self.account if self.account is not None else token['user']):
+                    res = limited()
+        except Exception as e:
+            if span is not None:
+                end_span(span, error=e)
+            raise
+
+        if span is not None:
+            end_span(span, response=res, streamed=kwargs.get('stream', False))
+
+        return(res)
+
+    def close(self):
+
+        self.session.close()
+
+    def post_sourcedoc(self, url, endpoint, sourcedoc, token, **kwargs):
+
+        """
+        Posts a source document, compressed if compression is set and the
+        endpoint ('validatie' or 'brondocumenten') has not rejected it.
+        """
+
+        headers = {'Content-Type': 'application/xml'}
+        size = gen_body_size(sourcedoc)
+
+        if self.compression is not None and self.compression_supported.get(endpoint, True):
+
+            position = sourcedoc.tell() if hasattr(sourcedoc, 'read') else None
+            body = compress_sourcedoc(sourcedoc, self.compression, self.compresslevel)
+
+            res = self.request('POST', url, token, data=body,
+                               headers=dict(headers, **{'Content-Encoding':self.compression}), **kwargs)
+
+            if not is_encoding_rejected(res, self.compression):
+                self.count_transfer(size, len(body), compressed=True)
+                self.compression_supported[endpoint] = True
+                return(res)
+
+            # Rejected, send again without compression and stop compressing
+            # for this endpoint
+            if position is not None:
+                sourcedoc.seek(position)
+
+            res = self.request('POST', url, token, data=sourcedoc, headers=headers, **kwargs)
+            self.count_transfer(size, len(body)+size, fallback=True)
+            self.compression_supported[endpoint] = False
+
+            return(res)
+
+        res = self.request('POST', url, token, data=sourcedoc, headers=headers, **kwargs)
+        self.count_transfer(size, size)
+
+        return(res)
+
+    def count_transfer(self, size, sent, compressed=False, fallback=False):
+
+        with self.transfer_lock:
+            self.transfer['documents'] += 1
+            self.transfer['compressed'] += int(compressed)
+            self.transfer['fallbacks'] += int(fallback)
+            self.transfer['bytes'] += size
+            self.transfer['bytes_sent'] += sent
+
+    def transfer_stats(self):
+
+        """
+        Returns the number of source documents sent, how many of them were
+        compressed or sent again uncompressed (fallbacks), their total size
+        ('bytes'), the number of bytes actually sent, the bytes saved and
+        the compression ratio.
+        """
+
+        with self.transfer_lock:
+            stats = dict(self.transfer)
+
+        stats['bytes_saved'] = stats['bytes']-stats['bytes_sent']
+        stats['ratio'] = stats['bytes']/stats['bytes_sent'] if stats['bytes_sent'] > 0 else None
+
+        return(stats)
+
+    # =============================================================================
+    # Validation
+    # =============================================================================
+
+    def validate_sourcedoc(self, sourcedoc, token):
+
+        res = self.post_sourcedoc(self.base_url+'/validatie', 'validatie', sourcedoc, token)
+
+        return(res.json())
+
+    def validate_sourcedoc_summary(self, sourcedoc, token, max_errors=None, max_message=200):
+
+        """
+        Validates a source document like validate_sourcedoc, but reads the
+        validation report as a stream and returns a compact summary of the
+        errors (see parse_validation_response).
+        """
+
+        res = self.post_sourcedoc(self.base_url+'/validatie', 'validatie', sourcedoc, token, stream=True)
+
+        try:
+            return(parse_validation_response(res, max_errors=max_errors, max_message=max_message))
+        finally:
+            res.close()
+
+    # =============================================================================
+    # Upload & delivery
+    # =============================================================================
+
+    def create_upload(self, token):
+
+        """
+        Creates an upload, returns the url of the upload.
+        """
+
+        res = self.request('POST', self.base_url+'/uploads', token,
+            headers={
+                "Content-Type": "application/xml"
+            },
+        )
+
+        try:
+            return(res.headers['Location'])
+        except KeyError:
+            raise Exception('Error: {}'.format(res.text))
+
+    def add_sourcedoc(self, upload_url, filename, sourcedoc, token):
+
+        """
+        Adds a source document to the upload, returns the request response.
+        """
+
+        res = self.post_sourcedoc(upload_url+'/brondocumenten', 'brondocumenten', sourcedoc, token,
+            params={'filename':filename},
+        )
+
+        return(res)
+
+    def start_delivery(self, upload_url, token):
+
+        """
+        Delivers the upload, returns the url of the delivery.
+        """
+
+        upload_id = upload_url.split('/')[-1]
+        payload = {'upload':int(upload_id)}
+
+        endresponse = self.request('POST', self.base_url+'/leveringen', token,
+            data=json.dumps(payload),
+            headers={'Content-type': 'application/json'},
+        )
+
+        return(endresponse.headers['Location'])
+
+    def deliver_upload(self, upload_url, token):
+
+        """
+        Delivers the upload, returns the request response of the delivery.
+        """
+
+        delivery_url_id = self.start_delivery(upload_url, token)
+        delivery = self.request('GET', delivery_url_id, token)
+
+        return(delivery)
+
+    def add_sourcedocs(self, upload_url, sourcedocs, token, max_workers=1, journal=None, name=None):
+
+        """
+        Adds source documents to the upload, with at most max_workers
+        documents being added at the same time.
+
+        Parameters
+        ----------
+        upload_url : string
+            url of the upload (see create_upload)
+        sourcedocs : dictionary or iterable
+            filenames with source documents, as dictionary or as (filename,
+            sourcedoc) pairs, e.g. a generator. A sourcedoc is an XML string,
+            bytes or a binary file object (streamed from disk). It may also
+            be a function without arguments returning one of these, which is
+            then called just before the document is sent; file objects
+            opened by such a function are closed after sending.
+        token : dictionary
+            dictionary with authentication data
+        max_workers : integer
+            maximum number of concurrent requests. Keep it within the
+            limits of the portal and at most the pool_maxsize of the client.
+        journal : upload_journal, optional
+            journal in which added documents are recorded under name.
+            Documents recorded earlier with the same content are skipped.
+        name : string, optional
+            name of the upload job in the journal
+
+        Returns
+        -------
+        dictionary with per filename the status code of the request, or the
+        error message if the request failed
+
+        """
+
+        if type(sourcedocs)==dict:
+            sourcedocs = sourcedocs.items()
+
+        def add(filename, sourcedoc):
+            opened = callable(sourcedoc)
+            try:
+                if opened:
+                    sourcedoc = sourcedoc()
+                if journal is not None:
+                    hash = gen_content_hash(sourcedoc)
+                    status = journal.added(name, filename, hash)
+                    if status is not None:
+                        return(status)
+                status = self.add_sourcedoc(upload_url, filename, sourcedoc, token).status_code
+                if journal is not None and sourcedoc_added(status):
+                    journal.set_added(name, filename, hash, status)
+                return(status)
+            except Exception as e:
+                return('Error: {}'.format(e))
+            finally:
+                if opened and hasattr(sourcedoc, 'close'):
+                    sourcedoc.close()
+
+        status = {}
+        if max_workers == 1:
+            for filename, sourcedoc in sourcedocs:
+                status[filename] = add(filename, sourcedoc)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for (filename, sourcedoc), future in submit_bounded(executor, lambda item: add(*item), sourcedocs):
+                    status[filename] = future.result()
+
+        return(status)
+
+    def upload_sourcedocs(self, sourcedocs, token, max_workers=1, journal=None, name=None, ledger=None):
+
+        """
+        Creates an upload, adds the source documents (see add_sourcedocs)
+        and delivers the upload. The upload is only delivered if all
+        documents were added successfully.
+
+        If a journal (upload_journal or path of one) is given, the upload
+        url, the added documents (as they are added) and the delivery url
+        are recorded under name, which defaults to a name derived from the
+        filenames. Without a name, an iterator of documents is read into a
+        list first to derive the name; with a name it is streamed. A re-run
+        with the same name resumes the upload: documents that were already
+        added are not sent again, and an upload that was already delivered
+        is not delivered again (the delivery is returned).
+
+        If a ledger (delivery_ledger or path of one) is given, the delivery
+        is recorded with the filename, content hash, broId and
+        requestReference of every document. A journal or ledger given as a
+        path is closed when the upload returns.
+        """
+
+        if type(ledger)==str or type(journal)==str:
+            # Stores given as a path are opened for this upload only
+            opened = []
+            if type(ledger)==str:
+                ledger = delivery_ledger(ledger)
+                opened.append(ledger)
+            if type(journal)==str:
+                journal = upload_journal(journal)
+                opened.append(journal)
+            try:
+                return(self.upload_sourcedocs(sourcedocs, token, max_workers=max_workers, journal=journal, name=name, ledger=ledger))
+            finally:
+                for store in opened:
+                    store.close()
+
+        if type(sourcedocs)==dict:
+            sourcedocs = sourcedocs.items()
+
+        if ledger is not None:
+            documents = []
+            sourcedocs = ((filename, gen_ledger_loader(filename, sourcedoc, documents)) for filename, sourcedoc in sourcedocs)
+
+        if journal is not None:
+            if name is None:
+                # The default name is derived from all filenames, so an
+                # iterator is read first. Give a name to stream it.
+                if iter(sourcedocs) is sourcedocs:
+                    sourcedocs = list(sourcedocs)
+                name = gen_journal_name([filename for filename, sourcedoc in sourcedocs])
+
+        # Step 1: Create upload
+        upload_url_id = journal.upload_url(name) if journal is not None else None
+
+        if upload_url_id is None:
+            try:
+                upload_url_id = self.create_upload(token)
+            except Exception as e:
+                print('Error: unable to create an upload ({})'.format(e))
+                return('Error')
+            if journal is not None:
+                journal.set_upload_url(name, upload_url_id)
+
+        elif journal.delivery_url(name) is not None:
+            print('Upload {} already delivered'.format(name))
+            return(self.request('GET', journal.delivery_url(name), token))
+
+        # Step 2: Add source documents to upload
+        status = self.add_sourcedocs(upload_url_id, sourcedocs, token, max_workers=max_workers, journal=journal, name=name)
+
+        failed = dict((filename, code) for filename, code in status.items() if not sourcedoc_added(code))
+        if len(failed) > 0:
+            print('Error: Cannot add source documents to upload, upload not delivered: {}'.format(failed))
+            return('Error')
+
+        # Step 3: Deliver upload
+        try:
+            delivery_url_id = self.start_delivery(upload_url_id, token)
+            if journal is not None:
+                journal.set_delivery_url(name, delivery_url_id)
+            if ledger is not None:
+                ledger.record_delivery(delivery_url_id, documents, upload_url=upload_url_id)
+            delivery = self.request('GET', delivery_url_id, token)
+            if ledger is not None and delivery.status_code == 200:
+                ledger.update_status(delivery_url_id.rstrip('/').split('/')[-1], delivery.json().get('status'), delivery.json())
+        except:
+            print('Error: failed to deliver upload')
+            return('Error')
+
+        return(delivery)
+
+    def upload_sourcedocs_from_dict(self, sourcedocs, token, max_workers=1, journal=None, name=None, ledger=None):
+
+        return(self.upload_sourcedocs(sourcedocs, token, max_workers=max_workers, journal=journal, name=name, ledger=ledger))
+
+    def upload_sourcedocs_from_dir(self, input_folder, token, specific_file=None, max_workers=1, journal=None, name=None,
+                                   glob='*', pattern=None, recursive=False, ledger=None):
+
+        if specific_file == None:
+            sourcedocs = scan_sourcedocs(input_folder, glob=glob, pattern=pattern, recursive=recursive)
+        else:
+            # Files are opened when they are sent
+            sourcedocs = [(specific_file, functools.partial(open_sourcedoc, os.path.join(input_folder,specific_file)))]
+
+        return(self.upload_sourcedocs(sourcedocs, token, max_workers=max_workers, journal=journal, name=name, ledger=ledger))
+
+    # =============================================================================
+    # Status & retrieval
+    # =============================================================================
+
+    def check_delivery_status(self, identifier, token, etag=None):
+
+        """
+        Returns the request response of the delivery. If the etag of an
+        earlier response is given, the request is conditional and the
+        portal may answer 304 (not modified) without a body.
+        """
+
+        headers = {'If-None-Match':etag} if etag is not None else {}
+
+        return(self.request('GET', self.base_url+'/leveringen/{}'.format(identifier), token, headers=headers))
+
+    def check_delivery_summary(self, identifier, token, max_errors=None, max_message=200):
+
+        """
+        Returns a compact summary of the delivery and the errors of its
+        source documents, read as a stream (see parse_delivery_response).
+        """
+
+        res = self.request('GET', self.base_url+'/leveringen/{}'.format(identifier), token, stream=True)
+
+        try:
+            if res.status_code != 200:
+                raise Exception("Error: status code {}: {}".format(res.status_code, res.text))
+            return(parse_delivery_response(res, max_errors=max_errors, max_message=max_message))
+        finally:
+            res.close()
+
+    def get_sourcedocument(self, identifier, token):
+
+        return(self.request('GET', self.base_url+'/brondocumenten/{}'.format(identifier), token))
+
+#%%
+
+def sourcedoc_added(status):
+
+    # status code or error message of add_sourcedoc
+    return(type(status)==int and 200 <= status < 300)
+
+def gen_ledger_loader(filename, sourcedoc, documents):
+
+    # Function returning the source document, recording its ledger info
+    # (see gen_sourcedoc_info) in documents when it is sent
+    def load():
+        document = sourcedoc() if callable(sourcedoc) else sourcedoc
+        documents.append(gen_sourcedoc_info(filename, document))
+        return(document)
+
+    return(load)
+
+def gen_journal_name(filenames):
+
+    # Name of an upload job in the journal, derived from its documents
+    return('upload_'+gen_content_hash('\n'.join(sorted(filenames)))[:16])
+
+def gen_body_size(sourcedoc):
+
+    # Number of bytes of a source document (string, bytes or file object)
+    if hasattr(sourcedoc, 'read'):
+        try:
+            return(os.fstat(sourcedoc.fileno()).st_size-sourcedoc.tell())
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return(len(sourcedoc.getvalue())-sourcedoc.tell() if hasattr(sourcedoc, 'getvalue') else 0)
+    if type(sourcedoc)==str:
+        return(len(sourcedoc.encode('utf8')))
+    return(len(sourcedoc))
+
+def compress_sourcedoc(sourcedoc, compression, compresslevel=6):
+
+    """
+    Returns the source document (string, bytes or file object) compressed
+    with 'gzip' or 'deflate'. File objects are compressed in blocks.
+    """
+
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, compression_wbits[compression])
+
+    if hasattr(sourcedoc, 'read'):
+        blocks = []
+        for block in iter(lambda: sourcedoc.read(1<<16), sourcedoc.read(0)):
+            blocks.append(compressor.compress(block.encode('utf8') if type(block)==str else block))
+        blocks.append(compressor.flush())
+        return(b''.join(blocks))
+
+    if type(sourcedoc)==str:
+        sourcedoc = sourcedoc.encode('utf8')
+
+    return(compressor.compress(sourcedoc)+compressor.flush())
+
+def is_encoding_rejected(res, compression):
+
+    # 415 Unsupported Media Type is the answer to an unsupported
+    # Content-Encoding (RFC 7231), some servers answer 400 with a message
+    # naming the encoding instead. Any other 400 is about the document.
+    if res.status_code == 415:
+        return(True)
+    if res.status_code != 400:
+        return(False)
+
+    message = res.text.lower()
+    return('content-encoding' in message or compression in message)
+
+def open_sourcedoc(xmlfile):
+
+    return(open(xmlfile, 'rb'))
+
+def scan_sourcedocs(input_folder, glob='*', pattern=None, recursive=False):
+
+    """
+    Scans input_folder with os.scandir, yields (filename, function opening
+    the file) pairs, so that the folder is read lazily and every file is
+    streamed from disk when it is sent.
+
+    Parameters
+    ----------
+    input_folder : string
+        folder with source documents
+    glob : string
+        shell-style pattern the filenames should match, e.g. '*.xml'
+    pattern : string, optional
+        regular expression the filenames should match (re.search)
+    recursive : Bool
+        if True, subfolders are scanned too. Filenames are then relative
+        to input_folder.
+
+    """
+
+    regex = re.compile(pattern) if pattern is not None else None
+
+    folders = [(input_folder, '')]
+    while len(folders) > 0:
+        folder, prefix = folders.pop()
+        try:
+            entries = os.scandir(folder)
+        except OSError:
+            print('Error: No source documents found in {}'.format(folder))
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        folders.append((entry.path, prefix+entry.name+'/'))
+                    continue
+                if not fnmatch.fnmatch(entry.name, glob):
+                    continue
+                if regex is not None and regex.search(entry.name) is None:
+                    continue
+                yield((prefix+entry.name, functools.partial(open_sourcedoc, entry.path)))
+
+#%%
+
+# One shared client per environment, created on first use
+clients = {}
+clients_lock = threading.Lock()
+shared_limiter = None
+
+def get_client(demo=False):
+
+    """
+    Returns the shared client of the environment (demo or production),
+    used by the module level functions of the connector.
+    """
+
+    environment = 'demo' if demo==True else 'production'
+
+    with clients_lock:
+        if environment not in clients.keys():
+            clients[environment] = bhp_client(demo=demo, limiter=shared_limiter)
+        return(clients[environment])
+
+def configure_client(demo=False, **kwargs):
+
+    """
+    Replaces the shared client of the environment (demo or production) by a
+    client with the given bhp_client arguments (base_url, pool_maxsize, ...).
+    The client uses the shared limiter (see configure_limiter), unless a
+    limiter is given.
+
+    Returns
+    -------
+    the new client
+
+    """
+
+    environment = 'demo' if demo==True else 'production'
+
+    with clients_lock:
+        if environment in clients.keys():
+            clients[environment].close()
+        clients[environment] = bhp_client(demo=demo, **dict({'limiter':shared_limiter}, **kwargs))
+        return(clients[environment])
+
+def configure_limiter(enabled=True, **kwargs):
+
+    """
+    Sets one adaptive_limiter, with the given arguments (rate, concurrency,
+    max_concurrency, ...), for all shared clients of the process, so that
+    all module level functions of the connector are limited together.
+    If enabled is False, the shared limiter is removed.
+
+    Returns
+    -------
+    the new limiter
+
+    """
+
+    global shared_limiter
+
+    with clients_lock:
+        shared_limiter = adaptive_limiter(**kwargs) if enabled else None
+        for client in clients.values():
+            client.limiter = shared_limiter
+        return(shared_limiter)
 
 # =============================================================================
 # Validation
@@ -34,39 +727,52 @@ def validate_sourcedoc(sourcedoc, token, demo=False):
     None.
 
     """
-    
-    if demo==True:
-        upload_url = 'https://demo.bronhouderportaal-bro.nl/api/validatie'
-    else:
-        upload_url = 'https://www.bronhouderportaal-bro.nl/api/validatie'
-    
 
-    payload = sourcedoc
-    
-    res = requests.post(upload_url,
-        data=payload,
-        headers={
-            "Content-Type": "application/xml"
-        },
-        cookies={},
-        auth=(token['user'],token['pass']),
-    ) 
-    
-    requestinfo = res.json()
+    return(get_client(demo).validate_sourcedoc(sourcedoc, token))
+
+def validate_sourcedoc_summary(sourcedoc, token, demo=False, max_errors=None, max_message=200):
+    """
     
-    return(requestinfo)
+
+    Parameters
+    ----------
+    sourcedoc : string
+        XML string containing the request.
+    token : dictionary
+        dictionary with authentication data. keys:
+            - user
+            - pass
+    demo : Bool
+        Defaults to False. If true, the test environment
+        of the bronhouderportaal is selected for data exchange
+    max_errors : integer, optional
+        maximum number of errors kept, the others are only counted
+    max_message : integer, optional
+        maximum length of an error message
+
+    Returns
+    -------
+    dictionary with the status, the number of errors ('count') and the
+    errors as validation_error tuples (code, xpath, message). The report is
+    read as a stream, so large reports are never held in memory.
+
+    """
+
+    return(get_client(demo).validate_sourcedoc_summary(sourcedoc, token, max_errors=max_errors, max_message=max_message))
 
 
-def upload_sourcedocs_from_dict(sourcedocs, token, demo=False):
+def upload_sourcedocs_from_dict(sourcedocs, token, demo=False, max_workers=1, journal=None, name=None, ledger=None):
     """
     
 
     Parameters
     ----------
-    sourcedocs : dictionary
+    sourcedocs : dictionary or iterable
         dictionary containing:
             keys: filenames
             values: XML strings containing the requests.
+        or an iterable (e.g. a generator) of (filename, sourcedoc) pairs,
+        where sourcedoc is an XML string, bytes or a binary file object
     token : dictionary
         dictionary with authentication data. keys:
             - user
@@ -74,86 +780,32 @@ def upload_sourcedocs_from_dict(sourcedocs, token, demo=False):
     demo : Bool
         Defaults to False. If true, the test environment
         of the bronhouderportaal is selected for data exchange
+    max_workers : integer
+        Defaults to 1. Maximum number of source documents added to the
+        upload concurrently. The upload is only delivered if all
+        documents were added successfully.
+    journal : upload_journal or string, optional
+        journal (or path of the SQLite journal) in which the upload is
+        recorded, so that an interrupted upload can be resumed by calling
+        the function again
+    name : string, optional
+        name of the upload in the journal, defaults to a name derived from
+        the filenames
+    ledger : delivery_ledger or string, optional
+        ledger (or path of the SQLite ledger) in which the delivery and its
+        documents are recorded
 
     Returns
     -------
     Request response.
 
-    """    
-    
-    if demo==True:
-        base_url = 'https://demo.bronhouderportaal-bro.nl/api'
-    else:
-        base_url = 'https://www.bronhouderportaal-bro.nl/api'
-    
-    # Step 1: Create upload
-    upload_url = base_url+'/uploads'
-    
-    try:
-        res = requests.post(upload_url,
-            headers={
-                "Content-Type": "application/xml"
-            },
-            cookies={},
-            auth=(token['user'],token['pass']),
-        )         
-    except:
-        print('Error: unable to create an upload')
-        return('Error')
-    
-    try:
-        upload_url_id = res.headers['Location']
-    except:
-        print('Error: {}'.format(res.text))
-
-    # Step 2: Add source documents to upload
-    try:        
-        try: 
-            
-            for sourcedoc in sourcedocs.keys():
-                headers = {'Content-type': 'application/xml'}
-                params = {'filename':sourcedoc}
-                payload = sourcedocs[sourcedoc]
-                res = requests.post(upload_url_id+'/brondocumenten',
-                    data=payload,
-                    headers=headers,
-                    cookies={},
-                    auth=(token['user'],token['pass']),
-                    params = params
-                )         
-        except:
-            print('Error: Cannot add source documents to upload')                   
-    
-    except:
-        print('Error: No source documents found')
-        return('Error')
-            
-        
-    # Step 3: Deliver upload
-    try:
-        upload_id = upload_url_id.split('/')[len(upload_url_id.split('/'))-1]    
-        delivery_url = os.path.join(base_url,'leveringen')
-        payload = {'upload':int(upload_id)}
-        headers = {'Content-type': 'application/json'}
-        endresponse = requests.post(delivery_url,
-            data=json.dumps(payload),
-            headers=headers,
-            cookies={},
-            auth=(token['user'],token['pass']),
-        )  
-        delivery_url_id = endresponse.headers['Location']
-        delivery = requests.get(url=delivery_url_id,
-            auth=(token['user'],token['pass']),
-        ) 
-    except:
-        print('Error: failed to deliver upload')
-        return('Error')
+    """
 
-    
-    return(delivery)
+    return(get_client(demo).upload_sourcedocs_from_dict(sourcedocs, token, max_workers=max_workers, journal=journal, name=name, ledger=ledger))
 
 
-def upload_sourcedocs_from_dir(input_folder, token, specific_file = None,demo=False):
+def upload_sourcedocs_from_dir(input_folder, token, specific_file = None,demo=False, max_workers=1, journal=None, name=None,
+                               glob='*', pattern=None, recursive=False, ledger=None):
     """
     
     Parameters
@@ -169,106 +821,41 @@ def upload_sourcedocs_from_dir(input_folder, token, specific_file = None,demo=Fa
         parameter is left empty, all sourcedocuments in the input folder 
         will be loaded
 
+    max_workers : integer
+        Defaults to 1. Maximum number of source documents added to the
+        upload concurrently.
+
+    journal : upload_journal or string, optional
+        journal (or path of the SQLite journal) in which the upload is
+        recorded. If the upload is interrupted, calling the function again
+        resumes it without sending the added documents again.
+
+    name : string, optional
+        name of the upload in the journal, defaults to a name derived from
+        the filenames
+
+    glob : string
+        Defaults to '*'. Shell-style pattern of the filenames to upload,
+        e.g. '*.xml'
+
+    pattern : string, optional
+        regular expression the filenames to upload should match
+
+    recursive : Bool
+        Defaults to False. If True, subfolders are uploaded too
+
+    ledger : delivery_ledger or string, optional
+        ledger (or path of the SQLite ledger) in which the delivery and its
+        documents are recorded
+
     Returns
     -------
     Json string containing information about the delivery (bronhouderportaal api)
 
     """
 
-    # Step 1: Create upload
-    if demo==True:
-        base_url = 'https://demo.bronhouderportaal-bro.nl/api'
-    else:
-        base_url = 'https://www.bronhouderportaal-bro.nl/api'    
-    
-    
-    upload_url = base_url+'/uploads'
-    
-    try:
-        res = requests.post(upload_url,
-            headers={
-                "Content-Type": "application/xml"
-            },
-            cookies={},
-            auth=(token['user'],token['pass']),
-        )          
-    except:
-        print('Error: unable to create an upload')
-    
-    upload_url_id = res.headers['Location']
-
-    # Step 2: Add source documents to upload
-    if specific_file == None:
-        try:
-            source_documents = os.listdir(input_folder) 
-            
-            try: 
-                
-                for source_document in source_documents:
-                    print(source_document)
-                    xmlfile = os.path.join(input_folder,source_document)
-                    with open(xmlfile, 'r') as file:
-                        payload = file.read()
-                    headers = {'Content-type': 'application/xml'}
-                    params = {'filename':source_document}
-                    res = requests.post(upload_url_id+'/brondocumenten',
-                        data=payload,
-                        headers=headers,
-                        cookies={},
-                        auth=(token['user'],token['pass']),
-                        params = params
-                    )             
-            except:
-                print('Error: Cannot add source documents to upload')                   
-        
-        except:
-            print('Error: No source documents found')
-            
-    else:
-        
-        try:
-
-            xmlfile = os.path.join(input_folder,specific_file)
-            print(xmlfile)            
-            
-            try:
-                with open(xmlfile, 'r') as file:
-                    payload = file.read()
-                    headers = {'Content-type': 'application/xml'}
-                    params = {'filename':specific_file}
-                    res = requests.post(upload_url_id+'/brondocumenten',
-                        data=payload,
-                        headers=headers,
-                        cookies={},
-                        auth=(token['user'],token['pass']),
-                        params = params
-                    )
-            except:
-                print('Error: Cannot add source documents to upload')    
-        except:
-            print('Error: No source documents found')
-                        
-           
-    # Step 3: Deliver upload
-    try:
-        upload_id = upload_url_id.split('/')[len(upload_url_id.split('/'))-1]    
-        delivery_url = os.path.join(base_url,'leveringen')
-        payload = {'upload':int(upload_id)}
-        headers = {'Content-type': 'application/json'}
-        endresponse = requests.post(delivery_url,
-            data=json.dumps(payload),
-            headers=headers,
-            cookies={},
-            auth=(token['user'],token['pass']),
-        )  
-        delivery_url_id = endresponse.headers['Location']
-        delivery = requests.get(url=delivery_url_id,
-            auth=(token['user'],token['pass']),
-        ) 
-    except:
-        print('Error: failed to deliver upload')
-    
-    return(delivery)
+    return(get_client(demo).upload_sourcedocs_from_dir(input_folder, token, specific_file=specific_file, max_workers=max_workers, journal=journal, name=name,
+                                                       glob=glob, pattern=pattern, recursive=recursive, ledger=ledger))
 
 
 def check_delivery_status(identifier, token, demo=False):
@@ -290,20 +877,40 @@ def check_delivery_status(identifier, token, demo=False):
     -------
     Request response.
 
-    """    
-    
-    if demo==True:
-        base_url = 'https://demo.bronhouderportaal-bro.nl/api'
-    else:
-        base_url = 'https://www.bronhouderportaal-bro.nl/api'
-    
-    delivery_url_id = base_url+'/leveringen/{}'.format(identifier)
-    delivery = requests.get(url=delivery_url_id,
-        auth=(token['user'],token['pass']),
-    )     
-    return(delivery)
+    """
+
+    return(get_client(demo).check_delivery_status(identifier, token))
+
+
+def check_delivery_summary(identifier, token, demo=False, max_errors=None, max_message=200):
+    """
     
 
+    Parameters
+    ----------
+    identifier : string
+    token : dictionary
+        dictionary with authentication data. keys:
+            - user
+            - pass
+    demo : Bool
+        Defaults to False. If true, the test environment
+        of the bronhouderportaal is selected for data exchange
+    max_errors : integer, optional
+        maximum number of errors kept per source document
+    max_message : integer, optional
+        maximum length of an error message
+
+    Returns
+    -------
+    dictionary with the status of the delivery and per source document its
+    id, filename, status and errors (see parse_delivery_response)
+
+    """
+
+    return(get_client(demo).check_delivery_summary(identifier, token, max_errors=max_errors, max_message=max_message))
+
+
 def get_sourcedocument(identifier, token, demo=False):
     """
     
@@ -323,16 +930,6 @@ def get_sourcedocument(identifier, token, demo=False):
     -------
     Request response.
 
-    """    
-    
-    if demo==True:
-        base_url = 'https://demo.bronhouderportaal-bro.nl/api'
-    else:
-        base_url = 'https://www.bronhouderportaal-bro.nl/api'
-    
-    delivery_url_id = base_url+'/brondocumenten/{}'.format(identifier)
-    delivery = requests.get(url=delivery_url_id,
-        auth=(token['user'],token['pass']),
-    )     
-    return(delivery)
-     
\ No newline at end of file
+    """
+
+    return(get_client(demo).get_sourcedocument(identifier, token))
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.common import sqlite_store
+
+import hashlib
+import time
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# On-disk journal of uploads to the bronhouderportaal. The journal records
+# the url of an upload, every source document added to it (by content hash)
+# and the delivery, so that an interrupted upload can be resumed without
+# creating a new upload or sending documents twice.
+
+#%%
+
+def gen_content_hash(sourcedoc):
+
+    """
+    Returns the sha256 of a source document (string, bytes or file object).
+    File objects are read in blocks and put back at their position.
+    """
+
+    if hasattr(sourcedoc, 'read'):
+        position = sourcedoc.tell()
+        hash = hashlib.sha256()
+        for block in iter(lambda: sourcedoc.read(1<<16), sourcedoc.read(0)):
+            hash.update(block.encode('utf8') if type(block)==str else block)
+        sourcedoc.seek(position)
+        return(hash.hexdigest())
+
+    if type(sourcedoc)==str:
+        sourcedoc = sourcedoc.encode('utf8')
+
+    return(hashlib.sha256(sourcedoc).hexdigest())
+
+class upload_journal(sqlite_store):
+
+    """
+    SQLite journal of uploads. Every upload job has a name (e.g. the input
+    folder), a re-run with the same name resumes the job. Use as:
+
+        journal = upload_journal('uploads.sqlite')
+        upload_sourcedocs_from_dir(folder, token, journal=journal)
+    """
+
+    def __init__(self, path):
+
+        """
+
+        Parameters
+        ----------
+        path : string
+            path of the SQLite database, created if it does not exist
+
+        Returns
+        -------
+        None.
+
+        """
+
+        tables = ["""CREATE TABLE IF NOT EXISTS uploads (
+                       name TEXT PRIMARY KEY,
+                       upload_url TEXT,
+                       delivery_url TEXT,
+                       created REAL,
+                       delivered REAL)""",
+                  """CREATE TABLE IF NOT EXISTS documents (
+                       name TEXT,
+                       filename TEXT,
+                       hash TEXT,
+                       status INTEGER,
+                       added REAL,
+                       PRIMARY KEY (name, filename, hash))"""]
+
+        sqlite_store.__init__(self, path, tables)
+
+    # =============================================================================
+    # Uploads
+    # =============================================================================
+
+    def upload_url(self, name):
+
+        rows = self.execute('SELECT upload_url FROM uploads WHERE name=?', (name,))
+        return(rows[0][0] if len(rows) > 0 else None)
+
+    def set_upload_url(self, name, upload_url):
+
+        self.execute('INSERT OR REPLACE INTO uploads (name, upload_url, created) VALUES (?,?,?)',
+                     (name, upload_url, time.time()))
+
+    def delivery_url(self, name):
+
+        rows = self.execute('SELECT delivery_url FROM uploads WHERE name=?', (name,))
+        return(rows[0][0] if len(rows) > 0 else None)
+
+    def delivery_id(self, name):
+
+        delivery_url = self.delivery_url(name)
+        return(delivery_url.split('/')[-1] if delivery_url is not None else None)
+
+    def set_delivery_url(self, name, delivery_url):
+
+        self.execute('UPDATE uploads SET delivery_url=?, delivered=? WHERE name=?',
+                     (delivery_url, time.time(), name))
+
+    def forget(self, name):
+
+        """
+        Removes an upload job from the journal, the next run with the same
+        name starts a new upload.
+        """
+
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM documents WHERE name=?', (name,))
+            connection.execute('DELETE FROM uploads WHERE name=?', (name,))
+
+    # =============================================================================
+    # Documents
+    # =============================================================================
+
+    def added(self, name, filename, hash):
+
+        """
+        Returns the status code with which the document was added to the
+        upload of the job, or None if it was not added yet.
+        """
+
+        rows = self.execute('SELECT status FROM documents WHERE name=? AND filename=? AND hash=?',
+                            (name, filename, hash))
+        return(rows[0][0] if len(rows) > 0 else None)
+
+    def set_added(self, name, filename, hash, status):
+
+        self.execute('INSERT OR REPLACE INTO documents (name, filename, hash, status, added) VALUES (?,?,?,?,?)',
+                     (name, filename, hash, status, time.time()))
+
+    def documents(self, name):
+
+        """
+        Returns the (filename, hash) pairs of all documents added to the
+        upload of the job.
+        """
+
+        return(self.execute('SELECT filename, hash FROM documents WHERE name=? ORDER BY added', (name,)))
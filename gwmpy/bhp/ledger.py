@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.common import sqlite_store
+from gwmpy.bhp.journal import gen_content_hash
+
+import re
+import time
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Local ledger of deliveries to the bronhouderportaal. Every delivery is
+# recorded with its source documents (filename, content hash, broId,
+# requestReference and referenced broIds) and the latest polled status, in
+# an indexed SQLite database, so that questions like "which tubes have an
+# unfinished delivery" are answered without parsing responses or logs.
+
+#%%
+
+# Statuses of a delivery after which it does not change anymore
+terminal_statuses = ['DOORGELEVERD','AFGEKEURD','MISLUKT']
+
+header_pattern = re.compile(r'<(?:[\w.-]+:)?(broId|requestReference)>\s*([^<\s]+)\s*<')
+sourcedocument_pattern = re.compile(r'<(?:[\w.-]+:)?sourceDocument[\s/>]')
+
+def gen_sourcedoc_head(sourcedoc, headsize=65536):
+
+    """
+    Returns the first headsize bytes of a source document (string, bytes or
+    file object) as string. File objects are put back at their position.
+    """
+
+    if hasattr(sourcedoc, 'read'):
+        position = sourcedoc.tell()
+        head = sourcedoc.read(headsize)
+        sourcedoc.seek(position)
+    else:
+        head = sourcedoc[:headsize]
+    if type(head)==bytes:
+        head = head.decode('utf8', errors='replace')
+
+    return(head)
+
+def gen_header_ids(head):
+
+    """
+    Returns the broId and requestReference of the registration request and
+    the broIds referred to in its source document. The broId of the request
+    (before the sourceDocument) is the object the document is about, None
+    for the registration of a new object. The broIds in the source document
+    are other objects, e.g. the monitoring nets and tube of a GLD
+    StartRegistration.
+    """
+
+    match = sourcedocument_pattern.search(head)
+    request, sourcedocument = (head[:match.start()], head[match.start():]) if match is not None else (head, '')
+
+    ids = {'broId':None, 'requestReference':None}
+    for field, value in header_pattern.findall(request):
+        if ids[field] is None:
+            ids[field] = value
+
+    references = []
+    for field, value in header_pattern.findall(sourcedocument):
+        if field == 'broId' and value not in references and value != ids['broId']:
+            references.append(value)
+
+    return(ids['broId'], ids['requestReference'], references)
+
+def gen_sourcedoc_info(filename, sourcedoc, headsize=65536):
+
+    """
+    Returns the filename, content hash, broId, requestReference and
+    referenced broIds (see gen_header_ids) of a source document (string,
+    bytes or file object). The ids are taken from the first headsize bytes,
+    where the registration request puts them.
+    """
+
+    broId, requestReference, references = gen_header_ids(gen_sourcedoc_head(sourcedoc, headsize))
+
+    return({'filename':filename,
+            'hash':gen_content_hash(sourcedoc),
+            'broId':broId,
+            'requestReference':requestReference,
+            'references':references})
+
+class delivery_ledger(sqlite_store):
+
+    """
+    SQLite ledger of deliveries and their source documents. Use as:
+
+        ledger = delivery_ledger('deliveries.sqlite')
+        upload_sourcedocs_from_dir(folder, token, ledger=ledger)
+        poller = delivery_poller(token, ledger=ledger)
+        poller.add(ledger.unfinished())
+    """
+
+    def __init__(self, path):
+
+        """
+
+        Parameters
+        ----------
+        path : string
+            path of the SQLite database, created if it does not exist
+
+        Returns
+        -------
+        None.
+
+        """
+
+        tables = ["""CREATE TABLE IF NOT EXISTS deliveries (
+                       delivery_id TEXT PRIMARY KEY,
+                       delivery_url TEXT,
+                       upload_url TEXT,
+                       status TEXT,
+                       finished INTEGER,
+                       created REAL,
+                       updated REAL)""",
+                  """CREATE TABLE IF NOT EXISTS documents (
+                       delivery_id TEXT,
+                       filename TEXT,
+                       hash TEXT,
+                       broId TEXT,
+                       requestReference TEXT,
+                       status TEXT,
+                       referencedBroIds TEXT,
+                       PRIMARY KEY (delivery_id, filename))"""]
+        for index in ['deliveries (status)', 'deliveries (finished, created)', 'deliveries (created)',
+                      'documents (broId)', 'documents (requestReference)', 'documents (hash)']:
+            name = 'ledger_'+re.sub(r'\W+', '_', index).strip('_')
+            tables.append('CREATE INDEX IF NOT EXISTS {} ON {}'.format(name, index))
+
+        sqlite_store.__init__(self, path, tables)
+
+    # =============================================================================
+    # Recording
+    # =============================================================================
+
+    def record_delivery(self, delivery_url, documents, upload_url=None, status=None):
+
+        """
+        Records a delivery with its documents (dictionaries as returned by
+        gen_sourcedoc_info). Returns the delivery id.
+        """
+
+        delivery_id = str(delivery_url).rstrip('/').split('/')[-1]
+        now = time.time()
+
+        with self.transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO deliveries VALUES (?,?,?,?,?,?,?)',
+                               (delivery_id, delivery_url, upload_url, status,
+                                int(status in terminal_statuses), now, now))
+            connection.executemany('''INSERT OR REPLACE INTO documents (delivery_id, filename, hash, broId, requestReference, referencedBroIds)
+                                      VALUES (?,?,?,?,?,?)''',
+                                   [(delivery_id, document['filename'], document['hash'], document['broId'], document['requestReference'],
+                                     ','.join(document.get('references', [])) or None) for document in documents])
+
+        return(delivery_id)
+
+    def update_statuses(self, updates):
+
+        """
+        Updates the status of many deliveries in one transaction.
+
+        Parameters
+        ----------
+        updates : list
+            (delivery id, status, delivery) tuples, where delivery is the
+            polled delivery (json) or None. The statuses of the source
+            documents are taken from its 'brondocumenten'.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        now = time.time()
+        deliveries = []
+        documents = []
+        for delivery_id, status, delivery in updates:
+            deliveries.append((status, int(status in terminal_statuses), now, str(delivery_id)))
+            if type(delivery)==dict:
+                for document in delivery.get('brondocumenten', []) or []:
+                    if 'filename' in document and 'status' in document:
+                        documents.append((document['status'], str(delivery_id), document['filename']))
+
+        with self.transaction() as connection:
+            connection.executemany('UPDATE deliveries SET status=?, finished=?, updated=? WHERE delivery_id=?', deliveries)
+            connection.executemany('UPDATE documents SET status=? WHERE delivery_id=? AND filename=?', documents)
+
+    def update_status(self, delivery_id, status, delivery=None):
+
+        self.update_statuses([(delivery_id, status, delivery)])
+
+    # =============================================================================
+    # Queries
+    # =============================================================================
+
+    def deliveries(self, broId=None, status=None, since=None, until=None, unfinished=False, referenced=False):
+
+        """
+        Returns the deliveries (dictionaries) with a document of broId, the
+        given status (or list of statuses), created between since and until
+        (unix times), and/or not finished yet. If referenced is True,
+        documents referring to broId (e.g. the GLD StartRegistration of a
+        tube) count as documents of broId.
+        """
+
+        conditions, parameters = [], []
+        if broId is not None and referenced:
+            conditions.append("""delivery_id IN (SELECT delivery_id FROM documents WHERE broId=?
+                                 OR ','||referencedBroIds||',' LIKE '%,'||?||',%')""")
+            parameters.extend([broId, broId])
+        elif broId is not None:
+            conditions.append('delivery_id IN (SELECT delivery_id FROM documents WHERE broId=?)')
+            parameters.append(broId)
+        if status is not None:
+            status = [status] if type(status)==str else list(status)
+            conditions.append('status IN ({})'.format(','.join('?'*len(status))))
+            parameters.extend(status)
+        if since is not None:
+            conditions.append('created >= ?')
+            parameters.append(since)
+        if until is not None:
+            conditions.append('created < ?')
+            parameters.append(until)
+        if unfinished:
+            conditions.append('finished = 0')
+
+        sql = 'SELECT delivery_id, delivery_url, upload_url, status, created, updated FROM deliveries'
+        if len(conditions) > 0:
+            sql += ' WHERE '+' AND '.join(conditions)
+
+        return([dict(zip(['delivery_id','delivery_url','upload_url','status','created','updated'], row))
+                for row in self.execute(sql+' ORDER BY created', parameters)])
+
+    def documents(self, delivery_id=None, broId=None, requestReference=None):
+
+        conditions, parameters = [], []
+        for column, value in [('delivery_id', delivery_id), ('broId', broId), ('requestReference', requestReference)]:
+            if value is not None:
+                conditions.append('{}=?'.format(column))
+                parameters.append(str(value))
+
+        sql = 'SELECT delivery_id, filename, hash, broId, requestReference, status, referencedBroIds FROM documents'
+        if len(conditions) > 0:
+            sql += ' WHERE '+' AND '.join(conditions)
+
+        return([dict(zip(['delivery_id','filename','hash','broId','requestReference','status'], row[:-1]),
+                     references=row[-1].split(',') if row[-1] else [])
+                for row in self.execute(sql, parameters)])
+
+    def unfinished(self):
+
+        """
+        Returns the ids of all deliveries that are not finished yet, e.g. to
+        add them to a delivery_poller.
+        """
+
+        return([row[0] for row in self.execute('SELECT delivery_id FROM deliveries WHERE finished = 0 ORDER BY created')])
+
+    def unfinished_broids(self, referenced=False):
+
+        """
+        Returns the broIds with an unfinished delivery. If referenced is
+        True, the broIds referred to by the documents of unfinished
+        deliveries are included.
+        """
+
+        broIds = [row[0] for row in self.execute("""SELECT DISTINCT documents.broId FROM documents
+                                                    JOIN deliveries ON deliveries.delivery_id = documents.delivery_id
+                                                    WHERE deliveries.finished = 0 AND documents.broId IS NOT NULL""")]
+        if referenced:
+            for row in self.execute("""SELECT DISTINCT documents.referencedBroIds FROM documents
+                                       JOIN deliveries ON deliveries.delivery_id = documents.delivery_id
+                                       WHERE deliveries.finished = 0 AND documents.referencedBroIds IS NOT NULL"""):
+                broIds.extend(broId for broId in row[0].split(',') if broId not in broIds)
+
+        return(broIds)
+
+    def status_counts(self):
+
+        return(dict(self.execute('SELECT status, COUNT(*) FROM deliveries GROUP BY status')))
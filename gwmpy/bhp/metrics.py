@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import threading
+import time
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Instrumentation of the requests of the connector. Every request is
+# described by a span (a dictionary with method, endpoint, status, bytes,
+# duration, retries and error) that is passed to the instruments of the
+# client and to the instruments registered for the whole process:
+#
+#     metrics = request_metrics()
+#     add_instrument(metrics)
+#     ...
+#     print(metrics.to_prometheus())
+
+#%%
+
+# Instruments of all clients in the process
+instruments = []
+instruments_lock = threading.Lock()
+
+def add_instrument(instrument):
+
+    with instruments_lock:
+        if instrument not in instruments:
+            instruments.append(instrument)
+
+def remove_instrument(instrument):
+
+    with instruments_lock:
+        if instrument in instruments:
+            instruments.remove(instrument)
+
+def gen_endpoint(url):
+
+    # 'validatie', 'uploads', 'brondocumenten' or 'leveringen'
+    parts = [part for part in url.split('?')[0].split('/') if part != '' and not part.isdigit()]
+    return(parts[-1] if len(parts) > 0 else '')
+
+class request_instrument():
+
+    """
+    Base class of instruments. request_start is called before a request is
+    sent, request_end after the response (or error), both with the span of
+    the request. The span gets the keys 'status', 'bytes_received',
+    'duration', 'retries' and 'error' at the end.
+    """
+
+    def request_start(self, span):
+
+        pass
+
+    def request_end(self, span):
+
+        pass
+
+def start_span(client_instruments, method, url, bytes_sent):
+
+    """
+    Returns the span of a new request with the instruments to notify, or
+    None if there are no instruments.
+    """
+
+    active = list(client_instruments)+list(instruments)
+    if len(active) == 0:
+        return(None)
+
+    span = {'method':method,
+            'endpoint':gen_endpoint(url),
+            'url':url,
+            'bytes_sent':bytes_sent,
+            'attempts':0,
+            'start':time.time(),
+            'instruments':active}
+    notify(span, 'request_start')
+    span['started'] = time.monotonic()
+
+    return(span)
+
+def end_span(span, response=None, error=None, streamed=False):
+
+    span['duration'] = time.monotonic()-span.pop('started')
+    span['status'] = response.status_code if response is not None else None
+    span['bytes_received'] = gen_response_size(response, streamed) if response is not None else 0
+    span['retries'] = max(span['attempts']-1, 0)
+    span['error'] = type(error).__name__ if error is not None else None
+    notify(span, 'request_end')
+
+def gen_response_size(response, streamed=False):
+
+    # Size of the body as sent (Content-Length). Without the header, the
+    # body of a streamed response (stream=True) is not read here and
+    # counts as 0, any other body was already read.
+    size = response.headers.get('Content-Length')
+    if size is not None and size.isdigit():
+        return(int(size))
+    if streamed:
+        return(0)
+    return(len(response.content))
+
+def notify(span, hook):
+
+    for instrument in span['instruments']:
+        try:
+            getattr(instrument, hook)(span)
+        except Exception as e:
+            print('Error: instrument {} failed ({})'.format(type(instrument).__name__, e))
+
+#%%
+
+# Upper bounds in seconds of the duration histogram
+duration_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.]
+
+class request_metrics(request_instrument):
+
+    """
+    In-memory metrics of requests per method, endpoint and status: a
+    histogram of durations and counters of requests, bytes, retries and
+    errors. to_prometheus returns them in the Prometheus text format.
+    """
+
+    def __init__(self, buckets=None, prefix='gwmpy_bhp'):
+
+        """
+
+        Parameters
+        ----------
+        buckets : list, optional
+            upper bounds in seconds of the duration histogram, defaults to
+            duration_buckets
+        prefix : string
+            prefix of the metric names
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.buckets = sorted(buckets) if buckets is not None else list(duration_buckets)
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def request_end(self, span):
+
+        labels = (span['method'], span['endpoint'], str(span['status']) if span['status'] is not None else span['error'])
+
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {'buckets':[0]*(len(self.buckets)+1),
+                                                'sum':0., 'count':0,
+                                                'bytes_sent':0, 'bytes_received':0, 'retries':0}
+            series['buckets'][bisect.bisect_left(self.buckets, span['duration'])] += 1
+            series['sum'] += span['duration']
+            series['count'] += 1
+            series['bytes_sent'] += span['bytes_sent']
+            series['bytes_received'] += span['bytes_received']
+            series['retries'] += span['retries']
+
+    def clear(self):
+
+        with self.lock:
+            self.series = {}
+
+    def quantile(self, q, method=None, endpoint=None, status=None):
+
+        """
+        Estimates the q quantile (0-1) of the duration of the requests with
+        the given method, endpoint and status (all if None), by linear
+        interpolation within the histogram bucket.
+        """
+
+        with self.lock:
+            counts = [0]*(len(self.buckets)+1)
+            for (series_method, series_endpoint, series_status), series in self.series.items():
+                if method in [None, series_method] and endpoint in [None, series_endpoint] and status in [None, series_status]:
+                    counts = [a+b for a, b in zip(counts, series['buckets'])]
+
+        total = sum(counts)
+        if total == 0:
+            return(None)
+
+        rank = q*total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative+count >= rank and count > 0:
+                if i == len(self.buckets):
+                    return(self.buckets[-1])
+                lower = self.buckets[i-1] if i > 0 else 0.
+                return(lower+(self.buckets[i]-lower)*(rank-cumulative)/count)
+            cumulative += count
+
+        return(self.buckets[-1])
+
+    def summary(self):
+
+        """
+        Returns per (method, endpoint, status) the number of requests, the
+        mean, median and 95th percentile duration, bytes and retries.
+        """
+
+        with self.lock:
+            series = dict((labels, dict(values)) for labels, values in self.series.items())
+
+        summary = {}
+        for (method, endpoint, status), values in series.items():
+            summary[(method, endpoint, status)] = {'count':values['count'],
+                                                   'mean':values['sum']/values['count'],
+                                                   'p50':self.quantile(0.5, method, endpoint, status),
+                                                   'p95':self.quantile(0.95, method, endpoint, status),
+                                                   'bytes_sent':values['bytes_sent'],
+                                                   'bytes_received':values['bytes_received'],
+                                                   'retries':values['retries']}
+
+        return(summary)
+
+    def to_prometheus(self):
+
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+
+        name = self.prefix+'_request'
+
+        with self.lock:
+            series = sorted((labels, dict(values, buckets=list(values['buckets']))) for labels, values in self.series.items())
+
+        def gen_labels(labels, **extra):
+            pairs = list(zip(['method','endpoint','status'], labels))+list(extra.items())
+            return('{'+','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in pairs)+'}')
+
+        lines = ['# HELP {}_duration_seconds Duration of requests to the bronhouderportaal'.format(name),
+                 '# TYPE {}_duration_seconds histogram'.format(name)]
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets+['+Inf'], values['buckets']):
+                cumulative += count
+                lines.append('{}_duration_seconds_bucket{} {}'.format(name, gen_labels(labels, le=bound), cumulative))
+            lines.append('{}_duration_seconds_sum{} {}'.format(name, gen_labels(labels), repr(values['sum'])))
+            lines.append('{}_duration_seconds_count{} {}'.format(name, gen_labels(labels), values['count']))
+
+        for counter, description in [('bytes_sent', 'Bytes sent in request bodies'),
+                                     ('bytes_received', 'Bytes received in response bodies'),
+                                     ('retries', 'Retries of throttled requests')]:
+            lines.append('# HELP {}_{}_total {}'.format(name, counter, description))
+            lines.append('# TYPE {}_{}_total counter'.format(name, counter))
+            for labels, values in series:
+                lines.append('{}_{}_total{} {}'.format(name, counter, gen_labels(labels), values[counter]))
+
+        return('\n'.join(lines)+'\n')
+
+    def write_prometheus(self, path):
+
+        """
+        Writes the metrics in the Prometheus text format to path, e.g. for
+        the textfile collector of the node exporter.
+        """
+
+        with open(path, 'w') as file:
+            file.write(self.to_prometheus())
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.common import submit_bounded
+from gwmpy.bhp.connector import get_client
+from gwmpy.bhp.validation import validation_cache, validate_sourcedoc_cached
+
+from lxml import etree
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import queue
+import threading
+import time
+import traceback
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Pipeline from registration requests to deliveries: requests are generated
+# in a process pool, optionally validated (locally or by the portal) and
+# added to uploads, with bounded queues between the stages. A slow stage
+# blocks the stages before it (backpressure), so at most queue_size
+# documents per queue are held in memory. Documents are never written to
+# disk.
+
+#%%
+
+def generate_pipeline_job(job):
+
+    """
+    Generates one registration request, runs in a worker process of the
+    pipeline. A job is a request object (gld_registration_request, ...), a
+    (filename, request object) pair or a (filename, XML) pair.
+    """
+
+    started = time.monotonic()
+
+    try:
+        if type(job) in [tuple, list]:
+            filename, request = job
+        else:
+            filename, request = '{}.xml'.format(job.kwargs['requestReference']), job
+
+        if type(request) in [str, bytes]:
+            return({'filename':filename, 'sourcedoc':request, 'error':None, 'busy':time.monotonic()-started})
+
+        request.generate()
+        return({'filename':filename, 'sourcedoc':request.request, 'error':None, 'busy':time.monotonic()-started})
+
+    except Exception:
+        return({'filename':filename if 'filename' in locals() else None, 'sourcedoc':None, 'error':traceback.format_exc(),
+                'busy':time.monotonic()-started})
+
+def generate_pipeline_item(item):
+
+    # (index, job) pair of the pipeline, see generate_pipeline_job
+    return(generate_pipeline_job(item[1]))
+
+class pipeline_stage():
+
+    """
+    Counts the documents and bytes that passed a stage, the errors and the
+    time the stage was busy.
+    """
+
+    def __init__(self, name):
+
+        self.name = name
+        self.lock = threading.Lock()
+        self.documents = 0
+        self.bytes = 0
+        self.errors = 0
+        self.busy = 0.
+        self.start = None
+        self.end = None
+
+    def count(self, size=0, error=False, busy=0.):
+
+        with self.lock:
+            now = time.monotonic()
+            self.start = now if self.start is None else self.start
+            self.end = now
+            self.documents += int(not error)
+            self.errors += int(error)
+            self.bytes += size
+            self.busy += busy
+
+    def report(self):
+
+        with self.lock:
+            duration = self.end-self.start if self.start is not None else 0.
+            return({'documents':self.documents,
+                    'errors':self.errors,
+                    'bytes':self.bytes,
+                    'busy':self.busy,
+                    'duration':duration,
+                    'documents_per_second':self.documents/duration if duration > 0 else None,
+                    'bytes_per_second':self.bytes/duration if duration > 0 else None})
+
+class delivery_pipeline():
+
+    """
+    Generates, validates and delivers registration requests:
+
+        pipeline = delivery_pipeline(token, demo=True, validate='remote')
+        report = pipeline.run(requests)
+    """
+
+    def __init__(self, token, client=None, demo=False, max_generators=None, executor=None,
+                 validate=None, schema=None, cache=None, normalize_ids=True, max_validators=4,
+                 upload_size=100, max_uploads=2, max_workers=4, queue_size=100, ledger=None):
+
+        """
+
+        Parameters
+        ----------
+        token : dictionary
+            dictionary with authentication data. keys:
+                - user
+                - pass
+        client : bhp_client, optional
+            client to use, defaults to the shared client of the environment
+        demo : Bool
+            Defaults to False. If true, the test environment
+            of the bronhouderportaal is selected for data exchange
+        max_generators : integer, optional
+            number of processes generating requests, defaults to the number
+            of processors. Ignored if executor is given.
+        executor : concurrent.futures.Executor, optional
+            executor to generate the requests with, e.g. a ThreadPoolExecutor
+            for small requests. It is not shut down afterwards.
+        validate : string, optional
+            'local' (well-formed XML, and valid against schema if given) or
+            'remote' (validation by the portal, see validate_sourcedoc).
+            Invalid documents are not uploaded. Defaults to no validation.
+        schema : string or lxml.etree.XMLSchema, optional
+            XSD used for local validation
+        cache : validation_cache or string, optional
+            cache of remote validation results (see validate_sourcedocs)
+        normalize_ids : Bool
+            Defaults to True. Generated documents that only differ in their
+            (random) gml:ids share their cached result (see
+            gen_canonical_hash)
+        max_validators : integer
+            number of concurrent validations
+        upload_size : integer
+            number of documents per upload (and delivery)
+        max_uploads : integer
+            maximum number of uploads running at the same time
+        max_workers : integer
+            maximum number of documents added concurrently within one upload
+        queue_size : integer
+            maximum number of documents waiting between two stages
+        ledger : delivery_ledger or string, optional
+            ledger in which the deliveries are recorded
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if validate not in [None, 'local', 'remote']:
+            raise Exception("Error: validate should be None, 'local' or 'remote'")
+
+        self.token = token
+        self.client = client if client is not None else get_client(demo)
+        self.max_generators = max_generators
+        self.executor = executor
+        self.validate = validate
+        self.schema = etree.XMLSchema(etree.parse(schema)) if type(schema)==str else schema
+        self.cache = validation_cache(cache) if type(cache)==str else cache
+        self.normalize_ids = normalize_ids
+        self.max_validators = max_validators
+        self.upload_size = upload_size
+        self.max_uploads = max_uploads
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.ledger = ledger
+
+    # =============================================================================
+    # Stages
+    # =============================================================================
+
+    def generate(self, jobs, output, stage, failed):
+
+        executor = self.executor
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=self.max_generators)
+
+        try:
+            for (index, job), future in submit_bounded(executor, generate_pipeline_item, enumerate(jobs)):
+                try:
+                    result = future.result()
+                except Exception: # the worker itself failed, e.g. killed process
+                    result = {'filename':None, 'sourcedoc':None, 'error':traceback.format_exc(), 'busy':0.}
+                if result['error'] is not None:
+                    # Without a filename, the failure is kept under the
+                    # index of the job
+                    key = result['filename'] if result['filename'] is not None else 'job {}'.format(index)
+                    failed[key] = 'Error: generation failed\n'+result['error']
+                    stage.count(error=True)
+                    continue
+                stage.count(len(result['sourcedoc']), busy=result['busy'])
+                output.put((result['filename'], result['sourcedoc'])) # blocks while the queue is full
+        finally:
+            if self.executor is None:
+                executor.shutdown()
+
+    def check(self, sourcedoc):
+
+        """
+        Returns the validation errors of a document (empty if valid).
+        """
+
+        if self.validate == 'local':
+            try:
+                root = etree.fromstring(sourcedoc)
+            except etree.XMLSyntaxError as e:
+                return([str(e)])
+            if self.schema is not None and not self.schema.validate(root):
+                return([str(error) for error in self.schema.error_log])
+            return([])
+
+        result = validate_sourcedoc_cached(self.client, sourcedoc, self.token, self.cache, self.normalize_ids)
+
+        if result.get('status') == 'VALIDE':
+            return([])
+        return(result.get('errors') or [result.get('status')])
+
+    def validator(self, source, output, stage, failed):
+
+        while True:
+            item = source.get()
+            if item is None:
+                break
+            filename, sourcedoc = item
+            started = time.monotonic()
+            try:
+                errors = self.check(sourcedoc)
+            except Exception as e:
+                errors = ['Error: {}'.format(e)]
+            if len(errors) > 0:
+                failed[filename] = 'Error: not valid: {}'.format(errors)
+                stage.count(error=True, busy=time.monotonic()-started)
+                continue
+            stage.count(len(sourcedoc), busy=time.monotonic()-started)
+            output.put(item)
+
+    def deliver(self, batch, stage, deliveries, failed):
+
+        started = time.monotonic()
+        try:
+            delivery = self.client.upload_sourcedocs(batch, self.token, max_workers=self.max_workers, ledger=self.ledger)
+        except Exception as e:
+            print('Error: upload failed ({})'.format(e))
+            delivery = 'Error'
+
+        delivered = not (type(delivery)==str and delivery=='Error')
+        deliveries.append({'filenames':[filename for filename, sourcedoc in batch],
+                           'delivery':delivery,
+                           'delivered':delivered})
+        for filename, sourcedoc in batch:
+            if not delivered:
+                failed[filename] = 'Error: upload not delivered'
+            stage.count(len(sourcedoc), error=not delivered, busy=(time.monotonic()-started)/len(batch))
+
+    def uploader(self, source, stage, deliveries, failed):
+
+        # Bounded number of running uploads: a full uploader blocks the
+        # queue before it
+        slots = threading.Semaphore(self.max_uploads)
+
+        def run(batch):
+            try:
+                self.deliver(batch, stage, deliveries, failed)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_uploads) as executor:
+            batch = []
+            while True:
+                item = source.get()
+                if item is not None:
+                    batch.append(item)
+                if len(batch) > 0 and (len(batch) >= self.upload_size or item is None):
+                    slots.acquire()
+                    executor.submit(run, batch)
+                    batch = []
+                if item is None:
+                    break
+
+    # =============================================================================
+    # Run
+    # =============================================================================
+
+    def run(self, jobs):
+
+        """
+
+        Parameters
+        ----------
+        jobs : iterable
+            request objects (not yet generated), (filename, request object)
+            pairs or (filename, XML) pairs, consumed lazily
+
+        Returns
+        -------
+        dictionary with keys
+            'stages': per stage ('generate', 'validate', 'upload') the
+                number of documents, errors, bytes, busy time, duration and
+                throughput
+            'deliveries': per upload the filenames, the delivery (request
+                response or 'Error') and whether it was delivered
+            'failed': per failed document (filename, or 'job <index>' if
+                the filename is unknown) the reason
+
+        """
+
+        stages = dict((name, pipeline_stage(name)) for name in ['generate', 'validate', 'upload'])
+        failed = {}
+        deliveries = []
+
+        generated = queue.Queue(maxsize=self.queue_size)
+        valid = queue.Queue(maxsize=self.queue_size) if self.validate is not None else generated
+
+        threads = []
+        if self.validate is not None:
+            validators = [threading.Thread(target=self.validator, args=(generated, valid, stages['validate'], failed))
+                          for i in range(self.max_validators)]
+            threads.extend(validators)
+        uploader = threading.Thread(target=self.uploader, args=(valid, stages['upload'], deliveries, failed))
+        threads.append(uploader)
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            self.generate(jobs, generated, stages['generate'], failed)
+        finally:
+            # Stop the stages in order, each one after it is drained
+            if self.validate is not None:
+                for validator in validators:
+                    generated.put(None)
+                for validator in validators:
+                    validator.join()
+            valid.put(None)
+            uploader.join()
+
+        return({'stages':dict((name, stage.report()) for name, stage in stages.items()),
+                'deliveries':deliveries,
+                'failed':failed})
+
+def run_pipeline(jobs, token, demo=False, **kwargs):
+    """
+
+
+    Parameters
+    ----------
+    jobs : iterable
+        request objects (not yet generated), (filename, request object)
+        pairs or (filename, XML) pairs
+    token : dictionary
+        dictionary with authentication data. keys:
+            - user
+            - pass
+    demo : Bool
+        Defaults to False. If true, the test environment
+        of the bronhouderportaal is selected for data exchange
+    **kwargs : -
+        other arguments of delivery_pipeline (validate, upload_size,
+        max_uploads, queue_size, ...)
+
+    Returns
+    -------
+    report of the pipeline (see delivery_pipeline.run)
+
+    """
+
+    return(delivery_pipeline(token, demo=demo, **kwargs).run(jobs))
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import get_client, gen_body_size
+from gwmpy.bhp.ledger import gen_sourcedoc_head, gen_header_ids
+
+from concurrent.futures import ThreadPoolExecutor
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Planning of large sets of source documents over multiple uploads. Every
+# upload is delivered separately, so one bad document only fails its own
+# upload, and the portal processes several smaller deliveries instead of one
+# very large one.
+
+#%%
+
+def gen_sourcedoc_broid(filename, head):
+
+    """
+    Returns the broId of the registration request in the head of a source
+    document (see gen_header_ids), or the filename if the request has no
+    broId (the registration of a new object, e.g. a GLD StartRegistration).
+    """
+
+    broId = gen_header_ids(head)[0]
+
+    return(broId if broId is not None else filename)
+
+def gen_sourcedoc_size(sourcedoc):
+
+    """
+    Returns the size in bytes of a source document without reading it. A
+    function returning the document is called, and a file object it opened
+    is closed again.
+    """
+
+    if not callable(sourcedoc):
+        return(gen_body_size(sourcedoc))
+
+    document = sourcedoc()
+    try:
+        return(gen_body_size(document))
+    finally:
+        if hasattr(document, 'close'):
+            document.close()
+
+def plan_uploads(sourcedocs, maxdocs=None, maxbytes=None, key=None, headsize=65536):
+
+    """
+
+    Parameters
+    ----------
+    sourcedocs : dictionary or iterable
+        filenames with XML strings (or bytes), as dictionary or as
+        (filename, sourcedoc) pairs. A sourcedoc may also be a file object,
+        or a function without arguments returning the XML or a file object.
+        Of those only the size and the first headsize bytes are read, they
+        are returned as they are, so documents are only loaded when they are
+        uploaded.
+    maxdocs : integer, optional
+        maximum number of documents per upload
+    maxbytes : integer, optional
+        maximum total size in bytes of the documents in an upload
+    key : function, optional
+        function of (filename, head) returning the group of a document,
+        where head is the start of the document (string). Defaults to the
+        broId of the registration request (see gen_sourcedoc_broid).
+    headsize : integer
+        number of bytes read from the start of every document
+
+    Returns
+    -------
+    list of uploads, each a list of (filename, sourcedoc) pairs. Documents
+    of the same group are kept in the same upload, in their original order.
+    A group that exceeds maxdocs or maxbytes on its own is split over
+    consecutive uploads of its own, in order; deliver these with
+    max_uploads=1 to keep their order. A single document larger than
+    maxbytes raises an exception.
+
+    """
+
+    if type(sourcedocs)==dict:
+        sourcedocs = sourcedocs.items()
+
+    if key is None:
+        key = gen_sourcedoc_broid
+
+    # Group documents, groups in order of first appearance
+    groups = {}
+    for filename, sourcedoc in sourcedocs:
+        document = sourcedoc() if callable(sourcedoc) else sourcedoc
+        try:
+            head = gen_sourcedoc_head(document, headsize)
+            size = gen_body_size(document)
+        finally:
+            if callable(sourcedoc) and hasattr(document, 'close'):
+                document.close()
+        if maxbytes is not None and size > maxbytes:
+            raise Exception("Error: {} ({} bytes) is larger than maxbytes ({})".format(filename, size, maxbytes))
+        group = groups.setdefault(key(filename, head), {'docs':[], 'bytes':0, 'sizes':[]})
+        group['docs'].append((filename, sourcedoc))
+        group['sizes'].append(size)
+        group['bytes'] += size
+
+    def fits(upload, docs, size):
+        return((maxdocs is None or len(upload['docs'])+docs <= maxdocs) and
+               (maxbytes is None or upload['bytes']+size <= maxbytes))
+
+    # First fit: each group goes to the first upload it still fits in
+    uploads = []
+    for group in groups.values():
+        if not fits({'docs':[], 'bytes':0}, len(group['docs']), group['bytes']):
+            # Too large for one upload, split in order over new uploads
+            upload = {'docs':[], 'bytes':0}
+            uploads.append(upload)
+            for doc, size in zip(group['docs'], group['sizes']):
+                if not fits(upload, 1, size):
+                    upload = {'docs':[], 'bytes':0}
+                    uploads.append(upload)
+                upload['docs'].append(doc)
+                upload['bytes'] += size
+            continue
+        for upload in uploads:
+            if fits(upload, len(group['docs']), group['bytes']):
+                upload['docs'].extend(group['docs'])
+                upload['bytes'] += group['bytes']
+                break
+        else:
+            uploads.append({'docs':list(group['docs']), 'bytes':group['bytes']})
+
+    return([upload['docs'] for upload in uploads])
+
+#%%
+
+def deliver_uploads(uploads, token, client=None, demo=False, max_uploads=1, max_workers=1):
+
+    """
+
+    Parameters
+    ----------
+    uploads : list
+        uploads as returned by plan_uploads
+    token : dictionary
+        dictionary with authentication data. keys:
+            - user
+            - pass
+    client : bhp_client, optional
+        client to use, defaults to the shared client of the environment
+    demo : Bool
+        Defaults to False. If true, the test environment
+        of the bronhouderportaal is selected for data exchange
+    max_uploads : integer
+        maximum number of uploads running at the same time
+    max_workers : integer
+        maximum number of documents added concurrently within one upload
+
+    Returns
+    -------
+    list with per upload (in the order of uploads) a dictionary with keys
+    'filenames', 'bytes', 'delivery' (request response, or 'Error') and
+    'delivered' (Bool)
+
+    """
+
+    if client is None:
+        client = get_client(demo)
+
+    def deliver(upload):
+        size = sum(gen_sourcedoc_size(sourcedoc) for filename, sourcedoc in upload)
+        try:
+            delivery = client.upload_sourcedocs(upload, token, max_workers=max_workers)
+        except Exception as e:
+            print('Error: upload failed ({})'.format(e))
+            delivery = 'Error'
+        return({'filenames':[filename for filename, sourcedoc in upload],
+                'bytes':size,
+                'delivery':delivery,
+                'delivered':not (type(delivery)==str and delivery=='Error')})
+
+    if max_uploads == 1:
+        return([deliver(upload) for upload in uploads])
+
+    with ThreadPoolExecutor(max_workers=max_uploads) as executor:
+        return(list(executor.map(deliver, uploads)))
+
+def upload_sourcedocs_planned(sourcedocs, token, demo=False, maxdocs=None, maxbytes=None,
+                              key=None, max_uploads=1, max_workers=1, client=None):
+    """
+
+
+    Parameters
+    ----------
+    sourcedocs : dictionary or iterable
+        filenames with source documents (see plan_uploads)
+    token : dictionary
+        dictionary with authentication data. keys:
+            - user
+            - pass
+    demo : Bool
+        Defaults to False. If true, the test environment
+        of the bronhouderportaal is selected for data exchange
+    maxdocs : integer, optional
+        maximum number of documents per upload
+    maxbytes : integer, optional
+        maximum total size in bytes of the documents in an upload
+    key : function, optional
+        grouping of documents that must be delivered in the same upload,
+        defaults to the broId (see plan_uploads)
+    max_uploads : integer
+        Defaults to 1. Maximum number of uploads running at the same time.
+    max_workers : integer
+        Defaults to 1. Maximum number of documents added concurrently
+        within one upload.
+    client : bhp_client, optional
+        client to use, defaults to the shared client of the environment
+
+    Returns
+    -------
+    dictionary with keys 'uploads' (see deliver_uploads), 'delivered' and
+    'failed' (lists of filenames)
+
+    """
+
+    uploads = deliver_uploads(plan_uploads(sourcedocs, maxdocs, maxbytes, key), token,
+                              client=client, demo=demo, max_uploads=max_uploads, max_workers=max_workers)
+
+    return({'uploads':uploads,
+            'delivered':[filename for upload in uploads if upload['delivered'] for filename in upload['filenames']],
+            'failed':[filename for upload in uploads if not upload['delivered'] for filename in upload['filenames']]})
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import get_client
+from gwmpy.bhp.ledger import terminal_statuses
+
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import random
+import time
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Polling of the status of many deliveries at once. Every delivery is polled
+# on its own schedule with exponential backoff and jitter, so that thousands
+# of deliveries can be tracked without flooding the portal.
+
+#%%
+
+def delivery_finished(delivery):
+
+    return(delivery.get('status') in terminal_statuses)
+
+class delivery_poller():
+
+    """
+    Tracks the status of many deliveries. Deliveries are added with add(),
+    completed deliveries are returned by iterating over the poller (or
+    passed to callback).
+
+        poller = delivery_poller(token, demo=True)
+        poller.add(identifiers)
+        for result in poller:
+            print(result['identifier'], result['status'])
+    """
+
+    def __init__(self, token, client=None, demo=False, interval=1., max_interval=60., backoff=2.,
+                 jitter=0.5, timeout=None, finished=None, callback=None, max_workers=1, ledger=None):
+
+        """
+
+        Parameters
+        ----------
+        token : dictionary
+            dictionary with authentication data. keys:
+                - user
+                - pass
+        client : bhp_client, optional
+            client to use, defaults to the shared client of the environment
+        demo : Bool
+            Defaults to False. If true, the test environment
+            of the bronhouderportaal is selected for data exchange
+        interval : float
+            seconds until the first poll of a delivery (less jitter), and
+            between polls after a change of the delivery
+        max_interval : float
+            maximum number of seconds between two polls of a delivery
+        backoff : float
+            factor by which the interval grows after every poll without a
+            change of the delivery. The interval is reset on a change.
+        jitter : float
+            fraction of the interval that is randomly subtracted, so that
+            deliveries added at the same time are not polled in bursts
+        timeout : float, optional
+            seconds after which a delivery that has not finished is given up
+        finished : function, optional
+            function of the delivery (json) returning True if it reached a
+            terminal state, defaults to delivery_finished
+        callback : function, optional
+            called with every completed result, next to it being yielded
+        max_workers : integer
+            number of deliveries that are polled concurrently
+        ledger : delivery_ledger, optional
+            ledger in which the changed statuses of every polling round are
+            updated in one transaction
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.token = token
+        self.client = client if client is not None else get_client(demo)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.timeout = timeout
+        self.finished = finished if finished is not None else delivery_finished
+        self.callback = callback
+        self.max_workers = max_workers
+        self.ledger = ledger
+
+        self.deliveries = {}
+        self.schedule = [] # heap of (time of next poll, counter, identifier)
+        self.counter = itertools.count()
+        self.requests = 0
+
+    def __len__(self):
+
+        return(len(self.deliveries))
+
+    def add(self, identifiers):
+
+        """
+        Adds one delivery identifier or a list of identifiers.
+        """
+
+        if type(identifiers) in [str, int]:
+            identifiers = [identifiers]
+
+        now = time.monotonic()
+        for identifier in identifiers:
+            if identifier in self.deliveries.keys():
+                continue
+            self.deliveries[identifier] = {'identifier':identifier,
+                                           'status':None,
+                                           'delivery':None,
+                                           'etag':None,
+                                           'polls':0,
+                                           'attempt':0,
+                                           'added':now,
+                                           'error':None}
+            self.plan(identifier, now+self.delay(0))
+
+    def delay(self, attempt):
+
+        delay = min(self.max_interval, self.interval*self.backoff**attempt)
+        return(delay*(1-self.jitter*random.random()))
+
+    def plan(self, identifier, at):
+
+        heapq.heappush(self.schedule, (at, next(self.counter), identifier))
+
+    def check(self, identifier):
+
+        """
+        Polls one delivery, returns True if the delivery is completed.
+        """
+
+        state = self.deliveries[identifier]
+        state['polls'] += 1
+        self.requests += 1
+
+        try:
+            res = self.client.check_delivery_status(identifier, self.token, etag=state['etag'])
+        except Exception as e:
+            state['error'] = 'Error: {}'.format(e)
+            state['attempt'] += 1
+            return(False)
+
+        if res.status_code == 304:
+            # Not modified since the last poll
+            state['attempt'] += 1
+            return(False)
+
+        if res.status_code == 429 or res.status_code >= 500:
+            state['error'] = 'Error: status code {}'.format(res.status_code)
+            state['attempt'] += 1
+            retry = res.headers.get('Retry-After')
+            if retry is not None and retry.isdigit():
+                state['retry'] = float(retry)
+            return(False)
+
+        if res.status_code != 200:
+            # e.g. unknown delivery, polling again will not help
+            state['error'] = 'Error: status code {}: {}'.format(res.status_code, res.text)
+            return(True)
+
+        delivery = res.json()
+        state['etag'] = res.headers.get('ETag')
+        state['error'] = None
+
+        if delivery != state['delivery']:
+            state['attempt'] = 0
+            state['changed'] = True
+        else:
+            state['attempt'] += 1
+        state['delivery'] = delivery
+        state['status'] = delivery.get('status')
+
+        return(self.finished(delivery))
+
+    def complete(self, identifier):
+
+        state = self.deliveries.pop(identifier)
+        result = dict((key, state[key]) for key in ['identifier','status','delivery','polls','error'])
+        if self.callback is not None:
+            self.callback(result)
+
+        return(result)
+
+    def poll(self):
+
+        """
+        Polls until all deliveries are completed, yields a dictionary with
+        keys 'identifier', 'status', 'delivery' (json), 'polls' and 'error'
+        for every delivery as soon as it is completed.
+        """
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+
+        try:
+            while len(self.schedule) > 0:
+
+                wait = self.schedule[0][0]-time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+
+                # All deliveries that are due
+                now = time.monotonic()
+                due = []
+                while len(self.schedule) > 0 and self.schedule[0][0] <= now:
+                    due.append(heapq.heappop(self.schedule)[2])
+
+                if executor is None:
+                    done = [self.check(identifier) for identifier in due]
+                else:
+                    done = list(executor.map(self.check, due))
+
+                if self.ledger is not None:
+                    self.ledger.update_statuses([(identifier, self.deliveries[identifier]['status'], self.deliveries[identifier]['delivery'])
+                                                 for identifier in due if self.deliveries[identifier].pop('changed', False)])
+
+                now = time.monotonic()
+                for identifier, finished in zip(due, done):
+                    state = self.deliveries[identifier]
+                    if finished:
+                        yield(self.complete(identifier))
+                    elif self.timeout is not None and now-state['added'] >= self.timeout:
+                        state['error'] = state['error'] or 'Error: delivery not finished within timeout'
+                        yield(self.complete(identifier))
+                    else:
+                        self.plan(identifier, now+max(self.delay(state['attempt']), state.pop('retry', 0)))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def __iter__(self):
+
+        return(self.poll())
+
+    def run(self):
+
+        """
+        Polls until all deliveries are completed, returns the list of results.
+        """
+
+        return(list(self.poll()))
+
+def poll_deliveries(identifiers, token, demo=False, callback=None, **kwargs):
+    """
+
+
+    Parameters
+    ----------
+    identifiers : list
+        identifiers of the deliveries
+    token : dictionary
+        dictionary with authentication data. keys:
+            - user
+            - pass
+    demo : Bool
+        Defaults to False. If true, the test environment
+        of the bronhouderportaal is selected for data exchange
+    callback : function, optional
+        called with the result of every completed delivery
+    **kwargs : -
+        other arguments of delivery_poller (interval, max_interval, timeout,
+        max_workers, ...)
+
+    Returns
+    -------
+    generator yielding the result of every delivery as soon as it is
+    completed (see delivery_poller.poll)
+
+    """
+
+    poller = delivery_poller(token, demo=demo, callback=callback, **kwargs)
+    poller.add(identifiers)
+
+    return(poller.poll())
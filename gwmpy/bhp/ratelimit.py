@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.metrics import gen_endpoint
+
+import threading
+import time
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Adaptive rate limiting of requests to the bronhouderportaal. A token bucket
+# caps the request rate, and the number of concurrent requests is adapted
+# with AIMD (additive increase, multiplicative decrease): it grows while the
+# portal answers quickly and is cut on throttling (429, 503) or latency
+# spikes. Throttled requests are retried after Retry-After.
+
+#%%
+
+throttle_codes = [429, 503]
+
+def gen_request_key(method, url):
+
+    # Endpoint of a request, latency is tracked per endpoint
+    return('{} {}'.format(method, gen_endpoint(url)))
+
+class adaptive_limiter():
+
+    """
+    Limiter shared by all threads using a client (or all clients, see
+    configure_limiter). Every request waits for a free slot within the
+    current concurrency limit and for a token of the bucket.
+    """
+
+    def __init__(self, rate=None, burst=10, concurrency=4, min_concurrency=1, max_concurrency=64,
+                 increase=1., decrease=0.5, latency_factor=4., retries=5, backoff=1., max_backoff=60.):
+
+        """
+
+        Parameters
+        ----------
+        rate : float, optional
+            maximum number of requests per second, None for no maximum
+        burst : integer
+            number of requests allowed at once above rate
+        concurrency : float
+            initial maximum number of concurrent requests
+        min_concurrency, max_concurrency : float
+            bounds of the concurrency limit
+        increase : float
+            growth of the limit per round of healthy responses (one round is
+            as many responses as the limit)
+        decrease : float
+            factor of the limit after throttling or a latency spike
+        latency_factor : float
+            a response slower than latency_factor times the usual latency
+            of the endpoint counts as a latency spike
+        retries : integer
+            number of times a throttled request is sent again
+        backoff : float
+            seconds to wait before a retry if the portal sends no
+            Retry-After, doubled for every retry
+        max_backoff : float
+            maximum number of seconds to wait before a retry
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.condition = threading.Condition()
+        self.inflight = 0
+        self.tokens = float(burst)
+        self.tokens_time = time.monotonic()
+        self.paused_until = 0.
+        self.last_decrease = 0.
+        self.latency = {}
+        self.counts = {'requests':0, 'throttled':0, 'spikes':0, 'decreases':0, 'retries':0}
+
+    # =============================================================================
+    # Slots & tokens
+    # =============================================================================
+
+    def acquire(self):
+
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if self.rate is not None:
+                    self.tokens = min(self.burst, self.tokens+(now-self.tokens_time)*self.rate)
+                    self.tokens_time = now
+
+                wait = self.paused_until-now
+                if wait <= 0 and self.inflight >= int(self.limit):
+                    wait = None # until a request is released
+                elif wait <= 0 and self.rate is not None and self.tokens < 1:
+                    wait = (1-self.tokens)/self.rate
+                elif wait <= 0:
+                    break
+
+                self.condition.wait(wait)
+
+            self.inflight += 1
+            if self.rate is not None:
+                self.tokens -= 1
+            self.counts['requests'] += 1
+
+    def release(self, key, status_code, latency):
+
+        """
+        Frees the slot of a request and adapts the concurrency limit to its
+        status code (None if the request failed) and latency.
+        """
+
+        with self.condition:
+            self.inflight -= 1
+            now = time.monotonic()
+
+            usual = self.latency.get(key)
+            throttled = status_code in throttle_codes
+            spike = usual is not None and latency > self.latency_factor*usual
+
+            if throttled or spike:
+                self.counts['throttled'] += int(throttled)
+                self.counts['spikes'] += int(spike and not throttled)
+                # At most one decrease per round trip, the other responses
+                # of the same round saw the same overload
+                if now-self.last_decrease > (usual or latency):
+                    self.limit = max(self.min_concurrency, self.limit*self.decrease)
+                    self.last_decrease = now
+                    self.counts['decreases'] += 1
+            elif status_code is not None:
+                self.limit = min(self.max_concurrency, self.limit+self.increase/self.limit)
+
+            if status_code is not None and not throttled:
+                # Moving average of the latency of healthy responses
+                self.latency[key] = latency if usual is None else 0.9*usual+0.1*min(latency, self.latency_factor*usual)
+
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+
+        """
+        Holds all requests for the given number of seconds (Retry-After).
+        """
+
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic()+seconds)
+
+    # =============================================================================
+    # Requests
+    # =============================================================================
+
+    def send(self, key, function, rewind=None):
+
+        """
+        Calls function (sending a request, returning the response) within
+        the limits, and calls it again after a pause if the response is
+        throttled. rewind is called before a retry, e.g. to seek back a
+        file object that was sent.
+        """
+
+        for attempt in range(self.retries+1):
+
+            self.acquire()
+            start = time.monotonic()
+            try:
+                res = function()
+            except Exception:
+                self.release(key, None, time.monotonic()-start)
+                raise
+            self.release(key, res.status_code, time.monotonic()-start)
+
+            if res.status_code not in throttle_codes or attempt == self.retries:
+                return(res)
+
+            retry = res.headers.get('Retry-After', '')
+            wait = float(retry) if retry.isdigit() else self.backoff*2**attempt
+            # Return the connection of the throttled response to the pool
+            res.close()
+            self.pause(min(wait, self.max_backoff))
+            self.counts['retries'] += 1
+            if rewind is not None:
+                rewind()
+
+        return(res)
+
+    def stats(self):
+
+        with self.condition:
+            return(dict(self.counts, limit=self.limit, inflight=self.inflight,
+                        latency=dict(self.latency)))
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+
+import codecs
+import collections
+import json
+import re
+import types
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Streaming parse of large json responses of the bronhouderportaal. The
+# errors of a validation report (or the source documents of a delivery) are
+# decoded one at a time while the response is read, and reduced to a
+# compact summary, so the full json tree is never held in memory.
+
+#%%
+
+validation_error = collections.namedtuple('validation_error', ['code','xpath','message'])
+
+# Keys in which an error item may hold its code, location and message
+error_fields = {'code':['code','errorCode','foutcode','type'],
+                'xpath':['xpath','xPath','path','location','locatie','element'],
+                'message':['message','description','omschrijving','melding','text']}
+
+code_pattern = re.compile(r'^\s*([\w.-]+)\s*:\s*(.*)$', re.S)
+
+decoder = json.JSONDecoder()
+
+# Characters that may end a value, within a string and within an object or
+# array (see json_stream.scan)
+scalar_end_pattern = re.compile(r'[,\]}\s]')
+string_pattern = re.compile(r'["\\]')
+structure_pattern = re.compile(r'["{}\[\]]')
+
+def gen_chunks(source, chunksize=65536):
+
+    """
+    Returns an iterator of text chunks of a response (read with
+    stream=True), a file object, bytes, a string or an iterable of chunks.
+    """
+
+    if hasattr(source, 'iter_content'):
+        chunks = source.iter_content(chunksize)
+    elif hasattr(source, 'read'):
+        chunks = iter(lambda: source.read(chunksize), source.read(0))
+    elif type(source) in [str, bytes]:
+        chunks = [source]
+    else:
+        chunks = source
+
+    utf8 = codecs.getincrementaldecoder('utf8')(errors='replace')
+    for chunk in chunks:
+        yield(utf8.decode(chunk) if type(chunk)==bytes else chunk)
+    yield(utf8.decode(b'', final=True))
+
+class json_stream():
+
+    """
+    Minimal incremental json reader over text chunks, reading one value at
+    a time from a buffer that only holds the current value.
+    """
+
+    def __init__(self, chunks):
+
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.position = 0
+        self.exhausted = False
+
+    def fill(self):
+
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            return(False)
+        self.buffer = self.buffer[self.position:]+chunk
+        self.position = 0
+        return(True)
+
+    def peek(self):
+
+        # Next non-whitespace character, None at the end of the stream
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n':
+                self.position += 1
+            if self.position < len(self.buffer):
+                return(self.buffer[self.position])
+            if not self.fill():
+                return(None)
+
+    def expect(self, characters):
+
+        character = self.peek()
+        if character is None or character not in characters:
+            raise Exception("Error: invalid json response, expected {} but found {}".format(repr(characters), repr(character)))
+        self.position += 1
+        return(character)
+
+    def scan(self, text, position, state):
+
+        """
+        Scans text from position for the end of the current value, with
+        state the strings and nesting seen so far. Returns the position
+        after the value, or None if the value continues in the next chunk.
+        """
+
+        if state['scalar']:
+            # Numbers, true, false and null end at a delimiter
+            match = scalar_end_pattern.search(text, position)
+            return(match.start() if match is not None else None)
+
+        while True:
+            if state['escape']:
+                if position >= len(text):
+                    return(None)
+                position += 1
+                state['escape'] = False
+            elif state['string']:
+                match = string_pattern.search(text, position)
+                if match is None:
+                    return(None)
+                position = match.end()
+                if match.group() == '\\':
+                    state['escape'] = True
+                else:
+                    state['string'] = False
+                    if state['depth'] == 0:
+                        return(position)
+            else:
+                match = structure_pattern.search(text, position)
+                if match is None:
+                    return(None)
+                position = match.end()
+                if match.group() == '"':
+                    state['string'] = True
+                elif match.group() in '{[':
+                    state['depth'] += 1
+                else:
+                    state['depth'] -= 1
+                    if state['depth'] == 0:
+                        return(position)
+
+    def value(self):
+
+        """
+        Decodes the next json value. Chunks are scanned once for the end of
+        the value and collected, the value is decoded when it is complete.
+        """
+
+        if self.peek() is None:
+            raise Exception("Error: invalid json response, unexpected end")
+
+        text, start = self.buffer, self.position
+        state = {'scalar':text[start] not in '"{[', 'string':False, 'escape':False, 'depth':0}
+        parts = []
+
+        end = self.scan(text, start, state)
+        while end is None:
+            parts.append(text[start:])
+            text, start = next(self.chunks, None), 0
+            if text is None:
+                # Only a number, true, false or null may end the stream
+                self.exhausted = True
+                text, end = '', 0
+                if not state['scalar']:
+                    raise Exception("Error: invalid json response, unexpected end in {}".format(repr(''.join(parts)[:40])))
+            else:
+                end = self.scan(text, 0, state)
+
+        parts.append(text[start:end])
+        self.buffer, self.position = text, end
+
+        try:
+            return(decoder.decode(''.join(parts)))
+        except json.JSONDecodeError:
+            raise Exception("Error: invalid json response at {}".format(repr(''.join(parts)[:40])))
+
+    def items(self):
+
+        """
+        Yields the items of the array that starts at the current position.
+        """
+
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield(self.value())
+            if self.expect(',]') == ']':
+                return
+
+    def members(self, arrays):
+
+        """
+        Yields (key, value) pairs of the object that starts at the current
+        position. The values of keys in arrays are not decoded but yielded
+        as an iterator of their items, which must be consumed before the
+        next member.
+        """
+
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key in arrays and self.peek() == '[':
+                yield((key, self.items()))
+            else:
+                yield((key, self.value()))
+            if self.expect(',}') == '}':
+                return
+
+#%%
+
+def gen_error_summary(error, max_message=None):
+
+    """
+    Reduces an error of a validation report (dictionary or string) to a
+    validation_error. For string errors like 'cvc-type.3.1.3: ...', the code
+    is the text before the colon.
+    """
+
+    if type(error)==dict:
+        fields = {}
+        for field, keys in error_fields.items():
+            fields[field] = next((error[key] for key in keys if error.get(key) not in [None, '']), None)
+        if fields['message'] is None:
+            fields['message'] = json.dumps(error)
+        if type(fields['xpath']) == dict:
+            fields['xpath'] = json.dumps(fields['xpath'])
+    else:
+        match = code_pattern.match(str(error))
+        fields = {'code':match.group(1) if match is not None else None,
+                  'xpath':None,
+                  'message':match.group(2) if match is not None else str(error)}
+
+    message = str(fields['message'])
+    if max_message is not None and len(message) > max_message:
+        message = message[:max_message]+'...'
+
+    return(validation_error(str(fields['code']) if fields['code'] is not None else None,
+                            str(fields['xpath']) if fields['xpath'] is not None else None,
+                            message))
+
+def parse_validation_response(source, max_errors=None, max_message=200):
+
+    """
+
+    Parameters
+    ----------
+    source : requests.Response, file object, bytes or string
+        validation report of the portal. Responses should be requested
+        with stream=True (see bhp_client.validate_sourcedoc_summary).
+    max_errors : integer, optional
+        maximum number of errors kept, the others are only counted
+    max_message : integer, optional
+        maximum length of an error message
+
+    Returns
+    -------
+    dictionary with the status, the number of errors ('count'), the errors
+    as validation_error tuples (code, xpath, message) and the other top
+    level fields of the report ('fields')
+
+    """
+
+    summary = {'status':None, 'count':0, 'errors':[], 'fields':{}}
+
+    stream = json_stream(gen_chunks(source))
+    for key, value in stream.members(['errors']):
+        if key == 'errors' and type(value)==types.GeneratorType:
+            for error in value:
+                summary['count'] += 1
+                if max_errors is None or len(summary['errors']) < max_errors:
+                    summary['errors'].append(gen_error_summary(error, max_message))
+        elif key == 'status':
+            summary['status'] = value
+        else:
+            summary['fields'][key] = value
+
+    return(summary)
+
+def parse_delivery_response(source, max_errors=None, max_message=200):
+
+    """
+    Streaming parse of a delivery (see check_delivery_status). Source
+    documents are decoded one at a time.
+
+    Returns
+    -------
+    dictionary with the status of the delivery, the other top level fields
+    ('fields') and per source document ('brondocumenten') its id, filename,
+    status, number of errors and errors as validation_error tuples
+
+    """
+
+    summary = {'status':None, 'fields':{}, 'brondocumenten':[]}
+
+    stream = json_stream(gen_chunks(source))
+    for key, value in stream.members(['brondocumenten']):
+        if key == 'brondocumenten' and type(value)==types.GeneratorType:
+            for document in value:
+                errors = document.get('errors') or document.get('fouten') or []
+                summary['brondocumenten'].append({'id':document.get('id'),
+                                                  'filename':document.get('filename') or document.get('bestandsnaam'),
+                                                  'status':document.get('status'),
+                                                  'count':len(errors),
+                                                  'errors':[gen_error_summary(error, max_message) for error in errors[:max_errors]]})
+        elif key == 'status':
+            summary['status'] = value
+        else:
+            summary['fields'][key] = value
+
+    return(summary)
+
+#%%
+
+class error_table():
+
+    """
+    Aggregates error summaries of many documents (and batches) into one
+    table with a row per error:
+
+        table = error_table()
+        table.add('file.xml', client.validate_sourcedoc_summary(sourcedoc, token))
+        table.to_dataframe()
+    """
+
+    columns = ['filename','status','code','xpath','message']
+
+    def __init__(self):
+
+        self.rows = []
+        self.documents = {}
+
+    def add(self, filename, summary):
+
+        """
+        Adds the summary of a validation response (parse_validation_response)
+        or of a delivery response (parse_delivery_response, one entry per
+        source document) of filename.
+        """
+
+        if 'brondocumenten' in summary.keys():
+            for document in summary['brondocumenten']:
+                self.add(document['filename'] or document['id'], document)
+            return
+
+        self.documents[filename] = {'status':summary['status'], 'count':summary['count']}
+        for error in summary['errors']:
+            self.rows.append((filename, summary['status'])+tuple(error))
+
+    def extend(self, summaries):
+
+        """
+        Adds a dictionary (or iterable of pairs) of filenames with summaries,
+        e.g. the results of one batch.
+        """
+
+        if type(summaries)==dict:
+            summaries = summaries.items()
+        for filename, summary in summaries:
+            self.add(filename, summary)
+
+    def records(self):
+
+        return([dict(zip(self.columns, row)) for row in self.rows])
+
+    def to_dataframe(self):
+
+        import pandas as pd
+
+        return(pd.DataFrame(self.rows, columns=self.columns))
+
+    def counts(self):
+
+        """
+        Returns per error code the number of errors and of documents with
+        the error, most frequent first.
+        """
+
+        counts = {}
+        for filename, status, code, xpath, message in self.rows:
+            count = counts.setdefault(code, {'errors':0, 'documents':set()})
+            count['errors'] += 1
+            count['documents'].add(filename)
+
+        return(dict(sorted(((code, {'errors':count['errors'], 'documents':len(count['documents'])})
+                            for code, count in counts.items()), key=lambda item: -item[1]['errors'])))
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.common import submit_bounded
+from gwmpy.bhp.common import sqlite_store
+from gwmpy.bhp.connector import get_client
+
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Retrieval of many source documents from the bronhouderportaal at once,
+# with a local cache. Source documents do not change once delivered, so a
+# document that was fetched before is served from disk.
+
+#%%
+
+class sourcedoc_cache(sqlite_store):
+
+    """
+    Content-addressed cache of source documents on disk. Every distinct
+    content is stored once, gzip compressed, as <directory>/<sha256[:2]>/
+    <sha256>.xml.gz. An SQLite index maps identifiers to contents.
+    Identifiers are only unique within a portal, so they are kept per
+    environment (base url of the api). The least recently used contents
+    are removed when the cache exceeds maxbytes.
+    """
+
+    def __init__(self, directory, maxbytes=1024**3, compresslevel=6):
+
+        """
+
+        Parameters
+        ----------
+        directory : string
+            directory of the cache, created if it does not exist
+        maxbytes : integer, optional
+            maximum size on disk of the (compressed) contents, None for no
+            limit
+        compresslevel : integer
+            gzip compression level, 1 (fast) to 9 (small)
+
+        Returns
+        -------
+        None.
+
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.compresslevel = compresslevel
+        self.hits = 0
+        self.misses = 0
+
+        tables = ["""CREATE TABLE IF NOT EXISTS identifiers (
+                       base_url TEXT,
+                       identifier TEXT,
+                       hash TEXT,
+                       fetched REAL,
+                       PRIMARY KEY (base_url, identifier))""",
+                  """CREATE TABLE IF NOT EXISTS contents (
+                       hash TEXT PRIMARY KEY,
+                       size INTEGER,
+                       accessed REAL)""",
+                  'CREATE INDEX IF NOT EXISTS identifiers_hash ON identifiers (hash)',
+                  'CREATE INDEX IF NOT EXISTS contents_accessed ON contents (accessed)']
+
+        sqlite_store.__init__(self, os.path.join(directory, 'index.sqlite'), tables)
+
+    def content_path(self, hash):
+
+        return(os.path.join(self.directory, hash[:2], hash+'.xml.gz'))
+
+    def get(self, base_url, identifier):
+
+        """
+        Returns the cached content (bytes) of the source document with the
+        given identifier at the api at base_url (client.base_url), or None.
+        """
+
+        with self.lock:
+            rows = self.connection.execute('SELECT hash FROM identifiers WHERE base_url=? AND identifier=?',
+                                           (base_url, str(identifier))).fetchall()
+            if len(rows) == 0:
+                self.misses += 1
+                return(None)
+            hash = rows[0][0]
+            self.connection.execute('UPDATE contents SET accessed=? WHERE hash=?', (time.time(), hash))
+
+        try:
+            with gzip.open(self.content_path(hash), 'rb') as file:
+                content = file.read()
+        except OSError:
+            # Removed from disk (e.g. by an eviction in another process)
+            with self.transaction() as connection:
+                connection.execute('DELETE FROM identifiers WHERE hash=?', (hash,))
+                connection.execute('DELETE FROM contents WHERE hash=?', (hash,))
+                self.misses += 1
+            return(None)
+
+        with self.lock:
+            self.hits += 1
+
+        return(content)
+
+    def put(self, base_url, identifier, content):
+
+        """
+        Stores the content (bytes) of the source document with the given
+        identifier at the api at base_url, returns its hash.
+        """
+
+        hash = hashlib.sha256(content).hexdigest()
+        path = self.content_path(hash)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first, so no half written content is
+            # ever read
+            temporary = '{}.{}.{}'.format(path, os.getpid(), threading.get_ident())
+            with open(temporary, 'wb') as file:
+                file.write(gzip.compress(content, self.compresslevel))
+            os.replace(temporary, path)
+
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO contents (hash, size, accessed) VALUES (?,?,?)',
+                               (hash, os.path.getsize(path), now))
+            connection.execute('INSERT OR REPLACE INTO identifiers (base_url, identifier, hash, fetched) VALUES (?,?,?,?)',
+                               (base_url, str(identifier), hash, now))
+
+        return(hash)
+
+    def size(self):
+
+        return(self.execute('SELECT COALESCE(SUM(size), 0) FROM contents')[0][0])
+
+    def evict(self):
+
+        """
+        Removes the least recently used contents until the cache is within
+        maxbytes. Returns the number of removed contents.
+        """
+
+        if self.maxbytes is None:
+            return(0)
+
+        with self.transaction() as connection:
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM contents').fetchone()[0]
+            hashes = []
+            for hash, size in connection.execute('SELECT hash, size FROM contents ORDER BY accessed').fetchall():
+                if total <= self.maxbytes:
+                    break
+                hashes.append(hash)
+                total -= size
+
+            connection.executemany('DELETE FROM identifiers WHERE hash=?', [(hash,) for hash in hashes])
+            connection.executemany('DELETE FROM contents WHERE hash=?', [(hash,) for hash in hashes])
+
+        for hash in hashes:
+            try:
+                os.remove(self.content_path(hash))
+            except OSError:
+                pass
+
+        return(len(hashes))
+
+#%%
+
+def fetch_sourcedocuments(identifiers, token, demo=False, cache=None, max_workers=4, refresh=False, client=None):
+    """
+
+
+    Parameters
+    ----------
+    identifiers : iterable
+        identifiers of the source documents
+    token : dictionary
+        dictionary with authentication data. keys:
+            - user
+            - pass
+    demo : Bool
+        Defaults to False. If true, the test environment
+        of the bronhouderportaal is selected for data exchange
+    cache : sourcedoc_cache or string, optional
+        cache (or directory of the cache) of source documents. Documents in
+        the cache are not fetched again.
+    max_workers : integer
+        Defaults to 4. Maximum number of concurrent requests.
+    refresh : Bool
+        Defaults to False. If True, all documents are fetched and the cache
+        is updated.
+    client : bhp_client, optional
+        client to use, defaults to the shared client of the environment
+
+    Returns
+    -------
+    dictionary with per identifier the content of the source document
+    (bytes), or the error message if it could not be fetched
+
+    """
+
+    if client is None:
+        client = get_client(demo)
+    if type(cache)==str:
+        cache = sourcedoc_cache(cache)
+
+    def fetch(identifier):
+        try:
+            if cache is not None and not refresh:
+                content = cache.get(client.base_url, identifier)
+                if content is not None:
+                    return(content)
+            res = client.get_sourcedocument(identifier, token)
+            if res.status_code != 200:
+                return('Error: status code {}: {}'.format(res.status_code, res.text))
+            if cache is not None:
+                cache.put(client.base_url, identifier, res.content)
+            return(res.content)
+        except Exception as e:
+            return('Error: {}'.format(e))
+
+    contents = {}
+    if max_workers == 1:
+        for identifier in identifiers:
+            contents[identifier] = fetch(identifier)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for identifier, future in submit_bounded(executor, fetch, identifiers):
+                contents[identifier] = future.result()
+
+    if cache is not None:
+        cache.evict()
+
+    return(contents)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import contextlib
+import copy
+import datetime
+import threading
+import time
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Scheduling of requests to the bronhouderportaal by priority. Every
+# request of a scheduled client waits for a slot of the shared scheduler:
+# urgent requests go first and always have reserved slots, requests of the
+# same priority are shared fairly between bronhouder accounts, and bulk
+# requests can be limited to time-of-day windows.
+#
+#     scheduler = request_scheduler(max_concurrency=8, windows={'bulk':[('19:00','07:00')]})
+#     urgent = scheduler.client(client, priority='urgent')
+#     bulk = scheduler.client(client, priority='bulk')
+
+#%%
+
+priority_classes = ['urgent','normal','bulk']
+
+def in_window(windows, now=None):
+
+    """
+    Returns True if the time of day of now (default the current local time)
+    lies in one of the (start, end) windows, given as 'HH:MM' strings. A
+    window may pass midnight, e.g. ('22:00','06:00').
+    """
+
+    now = (now or datetime.datetime.now()).time()
+
+    for start, end in windows:
+        start = datetime.time.fromisoformat(start)
+        end = datetime.time.fromisoformat(end)
+        if (start <= now < end) if start <= end else (now >= start or now < end):
+            return(True)
+
+    return(False)
+
+class request_scheduler():
+
+    """
+    Scheduler of the requests of one or more clients, see client().
+    """
+
+    def __init__(self, max_concurrency=8, reserved=1, windows=None, classes=None, recheck=30.):
+
+        """
+
+        Parameters
+        ----------
+        max_concurrency : integer
+            maximum number of requests in flight, should be at most the
+            pool_maxsize of the clients
+        reserved : integer
+            number of slots that only requests of the first (most urgent)
+            priority class can use, so urgent requests never wait behind a
+            full pool of bulk requests
+        windows : dictionary, optional
+            per priority class a list of (start, end) times of day ('HH:MM')
+            in which its requests may start, e.g. {'bulk':[('19:00','07:00')]}
+        classes : list, optional
+            priority classes, most urgent first. Defaults to
+            priority_classes ('urgent', 'normal', 'bulk').
+        recheck : float
+            seconds after which waiting requests outside their window check
+            again whether the window opened
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.classes = list(classes) if classes is not None else list(priority_classes)
+        self.max_concurrency = max_concurrency
+        self.reserved = min(reserved, max_concurrency-1)
+        self.windows = windows if windows is not None else {}
+        self.recheck = recheck
+
+        self.condition = threading.Condition()
+        self.inflight = dict((name, 0) for name in self.classes)
+        # Per class the accounts with waiting requests (in turn) and per
+        # account the waiting requests (first come, first served)
+        self.waiting = dict((name, collections.OrderedDict()) for name in self.classes)
+        self.counts = dict((name, {'requests':0, 'wait':0., 'max_wait':0.}) for name in self.classes)
+
+    def client(self, client=None, priority='normal', account=None, demo=False):
+
+        """
+        Returns a copy of client (default the shared client of the
+        environment) whose requests are scheduled with the given priority.
+        The copy shares the connection pool of client. account defaults to
+        the user of the token of each request.
+        """
+
+        if priority not in self.classes:
+            raise Exception("Error: priority should be one of {}".format(self.classes))
+
+        if client is None:
+            from gwmpy.bhp.connector import get_client
+            client = get_client(demo)
+
+        scheduled = copy.copy(client)
+        scheduled.scheduler = self
+        scheduled.priority = priority
+        scheduled.account = account
+
+        return(scheduled)
+
+    # =============================================================================
+    # Slots
+    # =============================================================================
+
+    def capacity(self, priority):
+
+        # Number of slots a class may use
+        if priority == self.classes[0]:
+            return(self.max_concurrency)
+        return(self.max_concurrency-self.reserved)
+
+    def dispatch(self):
+
+        """
+        Grants free slots to waiting requests: classes in order of priority,
+        accounts within a class in turn. Called with the condition held.
+        """
+
+        now = datetime.datetime.now()
+
+        for priority in self.classes:
+            accounts = self.waiting[priority]
+            if len(accounts) == 0:
+                continue
+            if priority in self.windows.keys() and not in_window(self.windows[priority], now):
+                continue
+
+            while len(accounts) > 0 and sum(self.inflight.values()) < self.capacity(priority):
+                # First account in turn, moved to the back afterwards
+                account, requests = next(iter(accounts.items()))
+                waiter = requests.popleft()
+                accounts.pop(account)
+                if len(requests) > 0:
+                    accounts[account] = requests
+                waiter['granted'] = True
+                self.inflight[priority] += 1
+
+        self.condition.notify_all()
+
+    def acquire(self, priority='normal', account=None):
+
+        waiter = {'granted':False}
+        start = time.monotonic()
+
+        with self.condition:
+            self.waiting[priority].setdefault(account, collections.deque()).append(waiter)
+            self.dispatch()
+            while not waiter['granted']:
+                self.condition.wait(self.recheck if priority in self.windows.keys() else None)
+                if not waiter['granted']:
+                    self.dispatch()
+
+            waited = time.monotonic()-start
+            counts = self.counts[priority]
+            counts['requests'] += 1
+            counts['wait'] += waited
+            counts['max_wait'] = max(counts['max_wait'], waited)
+
+    def release(self, priority='normal'):
+
+        with self.condition:
+            self.inflight[priority] -= 1
+            self.dispatch()
+
+    @contextlib.contextmanager
+    def slot(self, priority='normal', account=None):
+
+        self.acquire(priority, account)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self):
+
+        """
+        Returns per priority class the number of requests in flight, waiting
+        and done, and the mean and maximum waiting time.
+        """
+
+        with self.condition:
+            return(dict((priority, {'inflight':self.inflight[priority],
+                                    'waiting':sum(len(requests) for requests in self.waiting[priority].values()),
+                                    'requests':self.counts[priority]['requests'],
+                                    'mean_wait':self.counts[priority]['wait']/max(self.counts[priority]['requests'], 1),
+                                    'max_wait':self.counts[priority]['max_wait']})
+                        for priority in self.classes))
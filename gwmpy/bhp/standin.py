@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.metrics import gen_endpoint
+
+from lxml import etree
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.parse
+import zlib
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Local stand-in for the bronhouderportaal api, for testing and benchmarking
+# the connector offline. It implements the endpoints used by the connector
+# with configurable latency, error rates, throttling and delivery states:
+#
+#     with bhp_standin_server(latency=0.05, error_rate=0.01) as server:
+#         client = bhp_client(base_url=server.url)
+#
+# or from the command line: python -m gwmpy.bhp.standin --port 8080
+
+#%%
+
+# Statuses a delivery passes through, each lasting state_duration seconds.
+# The last status is replaced by 'AFGEKEURD' if a document is not valid XML.
+delivery_states = ['AANGELEVERD','IN_BEHANDELING','DOORGELEVERD']
+
+class bhp_standin_handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+
+        if self.server.standin.verbose:
+            BaseHTTPRequestHandler.log_message(self, *args)
+
+    def send(self, status_code, body=b'', headers=None):
+
+        if type(body) in [dict, list]:
+            body = json.dumps(body).encode('utf8')
+            headers = dict({'Content-Type':'application/json'}, **(headers or {}))
+
+        self.send_response(status_code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        encoding = self.headers.get('Content-Encoding')
+
+        if encoding is None or encoding == 'identity':
+            return(body)
+        if not self.server.standin.compression or encoding not in ['gzip','deflate']:
+            return(None)
+
+        return(zlib.decompress(body, 16+zlib.MAX_WBITS if encoding=='gzip' else zlib.MAX_WBITS))
+
+    def handle_request(self, method):
+
+        standin = self.server.standin
+        path = self.path.split('?')[0]
+
+        body = self.read_body() if method == 'POST' else b''
+        if body is None:
+            return(self.send(415, headers={'Accept-Encoding':'identity'}))
+
+        fault = standin.inject(path)
+        if fault is not None:
+            return(self.send(*fault))
+
+        host = 'http://{}'.format(self.headers.get('Host', '{}:{}'.format(*self.server.server_address)))
+
+        for pattern, endpoint in standin.routes[method]:
+            match = re.fullmatch(pattern, path)
+            if match is not None:
+                return(self.send(*endpoint(host, body, self, *match.groups())))
+
+        self.send(404, {'message':'Not found: {} {}'.format(method, path)})
+
+    def do_GET(self):
+
+        self.handle_request('GET')
+
+    def do_POST(self):
+
+        self.handle_request('POST')
+
+class bhp_standin_server():
+
+    """
+    Local stand-in for the bronhouderportaal api. Implements
+        POST /api/validatie
+        POST /api/uploads
+        POST /api/uploads/{id}/brondocumenten
+        POST /api/leveringen
+        GET  /api/leveringen/{id} (with ETag / If-None-Match)
+        GET  /api/brondocumenten/{id}
+    and stores everything in memory.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0., jitter=0., error_rate=0.,
+                 throttle_rate=None, throttle_burst=10, state_duration=1., compression=True,
+                 seed=None, verbose=False):
+
+        """
+
+        Parameters
+        ----------
+        host : string
+            address to listen on
+        port : integer
+            port to listen on, 0 picks a free port (see url)
+        latency : float or dictionary
+            seconds every request takes, or a dictionary with the latency per
+            endpoint ('validatie', 'uploads', 'brondocumenten', 'leveringen')
+        jitter : float
+            random extra latency, uniform between 0 and jitter seconds
+        error_rate : float or dictionary
+            fraction of requests answered with 500 or 503, or a dictionary
+            with the error rate per endpoint
+        throttle_rate : float, optional
+            maximum number of requests per second. Requests above the rate
+            (and the burst) are answered with 429 and a Retry-After header.
+        throttle_burst : integer
+            number of requests allowed at once above throttle_rate
+        state_duration : float
+            seconds a delivery stays in every status of delivery_states
+        compression : Bool
+            if False, compressed requests (Content-Encoding) are answered
+            with 415
+        seed : integer, optional
+            seed of the random faults and jitter
+        verbose : Bool
+            if True, every request is logged
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.throttle_burst = throttle_burst
+        self.state_duration = state_duration
+        self.compression = compression
+        self.verbose = verbose
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.uploads = {}
+        self.deliveries = {}
+        self.sourcedocs = {}
+        self.requests = {}
+        self.faults = {}
+        self.tokens = throttle_burst
+        self.tokens_time = time.monotonic()
+
+        self.routes = {'POST':[(r'/api/validatie', self.validate),
+                               (r'/api/uploads', self.create_upload),
+                               (r'/api/uploads/(\d+)/brondocumenten', self.add_sourcedoc),
+                               (r'/api/leveringen', self.create_delivery)],
+                       'GET':[(r'/api/leveringen/(\d+)', self.get_delivery),
+                              (r'/api/brondocumenten/(\d+)', self.get_sourcedoc)]}
+
+        self.httpd = ThreadingHTTPServer((host, port), bhp_standin_handler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.thread = None
+
+    @property
+    def url(self):
+
+        """
+        Base url of the api, to be used as base_url of a bhp_client.
+        """
+
+        return('http://{}:{}/api'.format(*self.httpd.server_address[:2]))
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return(self)
+
+    def stop(self):
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+
+        return(self.start())
+
+    def __exit__(self, *args):
+
+        self.stop()
+
+    def stats(self):
+
+        """
+        Returns the number of requests and injected faults per endpoint.
+        """
+
+        with self.lock:
+            return({'requests':dict(self.requests), 'faults':dict(self.faults)})
+
+    # =============================================================================
+    # Latency & faults
+    # =============================================================================
+
+    def setting(self, value, endpoint):
+
+        if type(value)==dict:
+            return(value.get(endpoint, 0))
+        return(value)
+
+    def inject(self, path):
+
+        """
+        Sleeps for the latency of the endpoint and returns the fault to
+        answer with (status code, body, headers), or None.
+        """
+
+        endpoint = gen_endpoint(path)
+
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0)+1
+            delay = self.setting(self.latency, endpoint)+self.jitter*self.random.random()
+            failing = self.random.random() < self.setting(self.error_rate, endpoint)
+            fault_code = self.random.choice([500, 503])
+
+            throttled = False
+            if self.throttle_rate is not None:
+                now = time.monotonic()
+                self.tokens = min(self.throttle_burst, self.tokens+(now-self.tokens_time)*self.throttle_rate)
+                self.tokens_time = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                else:
+                    throttled = True
+                    retry = math.ceil((1-self.tokens)/self.throttle_rate)
+
+            if throttled or failing:
+                fault = '429' if throttled else str(fault_code)
+                self.faults[endpoint+' '+fault] = self.faults.get(endpoint+' '+fault, 0)+1
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if throttled:
+            return((429, {'message':'Too many requests'}, {'Retry-After':str(retry)}))
+        if failing:
+            return((fault_code, {'message':'Injected fault'}))
+
+        return(None)
+
+    # =============================================================================
+    # Endpoints
+    # =============================================================================
+
+    def validate(self, host, body, handler):
+
+        errors = validate_xml(body)
+
+        return((200, {'status':'VALIDE' if len(errors)==0 else 'NIET_VALIDE', 'errors':errors}))
+
+    def create_upload(self, host, body, handler):
+
+        with self.lock:
+            upload_id = next(self.ids)
+            self.uploads[upload_id] = {'brondocumenten':[], 'delivered':False}
+
+        return((201, b'', {'Location':'{}/api/uploads/{}'.format(host, upload_id)}))
+
+    def add_sourcedoc(self, host, body, handler, upload_id):
+
+        filename = urllib.parse.parse_qs(urllib.parse.urlsplit(handler.path).query).get('filename', [None])[0]
+
+        with self.lock:
+            upload = self.uploads.get(int(upload_id))
+            if upload is None:
+                return((404, {'message':'Upload {} not found'.format(upload_id)}))
+            if upload['delivered']:
+                return((409, {'message':'Upload {} already delivered'.format(upload_id)}))
+            sourcedoc_id = next(self.ids)
+            self.sourcedocs[sourcedoc_id] = {'filename':filename, 'content':body, 'valid':len(validate_xml(body))==0}
+            upload['brondocumenten'].append(sourcedoc_id)
+
+        return((201, b'', {'Location':'{}/api/brondocumenten/{}'.format(host, sourcedoc_id)}))
+
+    def create_delivery(self, host, body, handler):
+
+        try:
+            upload_id = int(json.loads(body)['upload'])
+        except (ValueError, KeyError, TypeError):
+            return((400, {'message':'Body should be {"upload": <id>}'}))
+
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                return((404, {'message':'Upload {} not found'.format(upload_id)}))
+            if upload['delivered']:
+                return((409, {'message':'Upload {} already delivered'.format(upload_id)}))
+            upload['delivered'] = True
+            delivery_id = next(self.ids)
+            self.deliveries[delivery_id] = {'upload':upload_id, 'created':time.monotonic()}
+
+        return((201, b'', {'Location':'{}/api/leveringen/{}'.format(host, delivery_id)}))
+
+    def delivery_status(self, delivery_id):
+
+        delivery = self.deliveries[delivery_id]
+        documents = [dict(self.sourcedocs[sourcedoc_id], id=sourcedoc_id)
+                     for sourcedoc_id in self.uploads[delivery['upload']]['brondocumenten']]
+
+        state = int((time.monotonic()-delivery['created'])/self.state_duration) if self.state_duration > 0 else len(delivery_states)
+        finished = state >= len(delivery_states)-1
+        valid = all(document['valid'] for document in documents)
+
+        status = delivery_states[min(state, len(delivery_states)-1)]
+        if finished and not valid:
+            status = 'AFGEKEURD'
+
+        return({'id':delivery_id,
+                'upload':delivery['upload'],
+                'status':status,
+                'brondocumenten':[{'id':document['id'],
+                                   'filename':document['filename'],
+                                   'status':status if not finished else ('OPGENOMEN_LVBRO' if document['valid'] else 'AFGEKEURD')}
+                                  for document in documents]})
+
+    def get_delivery(self, host, body, handler, delivery_id):
+
+        with self.lock:
+            if int(delivery_id) not in self.deliveries.keys():
+                return((404, {'message':'Delivery {} not found'.format(delivery_id)}))
+            status = self.delivery_status(int(delivery_id))
+
+        content = json.dumps(status).encode('utf8')
+        etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+
+        if handler.headers.get('If-None-Match') == etag:
+            return((304, b'', {'ETag':etag}))
+
+        return((200, content, {'Content-Type':'application/json', 'ETag':etag}))
+
+    def get_sourcedoc(self, host, body, handler, sourcedoc_id):
+
+        with self.lock:
+            sourcedoc = self.sourcedocs.get(int(sourcedoc_id))
+
+        if sourcedoc is None:
+            return((404, {'message':'Source document {} not found'.format(sourcedoc_id)}))
+
+        return((200, sourcedoc['content'], {'Content-Type':'application/xml'}))
+
+#%%
+
+def validate_xml(body):
+
+    """
+    Returns the errors of a source document, the stand-in only checks that
+    it is well-formed XML.
+    """
+
+    try:
+        etree.fromstring(body)
+    except etree.XMLSyntaxError as e:
+        return([str(e)])
+
+    return([])
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description='Local stand-in for the bronhouderportaal api')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.)
+    parser.add_argument('--jitter', type=float, default=0.)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--throttle-rate', type=float, default=None)
+    parser.add_argument('--throttle-burst', type=int, default=10)
+    parser.add_argument('--state-duration', type=float, default=1.)
+    parser.add_argument('--no-compression', action='store_true')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(args)
+
+    server = bhp_standin_server(host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                                throttle_burst=args.throttle_burst, state_duration=args.state_duration,
+                                compression=not args.no_compression, seed=args.seed, verbose=True)
+
+    print('Serving the bronhouderportaal stand-in at {}'.format(server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == '__main__':
+    main()
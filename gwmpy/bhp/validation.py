@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.common import submit_bounded
+from gwmpy.bhp.common import sqlite_store
+from gwmpy.bhp.connector import get_client
+
+from lxml import etree
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import time
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Validation of many source documents at once. Results are cached on disk by
+# a hash of the canonicalized XML, so unchanged documents are not sent to
+# the portal again.
+
+#%%
+
+gml_id = '{http://www.opengis.net/gml/3.2}id'
+
+def gen_canonical_hash(sourcedoc, normalize_ids=False):
+
+    """
+
+    Parameters
+    ----------
+    sourcedoc : string, bytes or file object
+        XML of the source document
+    normalize_ids : Bool
+        if True, the values of gml:id attributes (random uuids in generated
+        documents) are replaced by their order of appearance, so documents
+        that only differ in their gml:ids get the same hash
+
+    Returns
+    -------
+    sha256 of the canonical (C14N) XML, or of the raw document if it is not
+    well-formed
+
+    """
+
+    if hasattr(sourcedoc, 'read'):
+        sourcedoc = sourcedoc.read()
+    if type(sourcedoc)==str:
+        sourcedoc = sourcedoc.encode('utf8')
+
+    try:
+        root = etree.fromstring(sourcedoc)
+    except etree.XMLSyntaxError:
+        return(hashlib.sha256(sourcedoc).hexdigest())
+
+    if normalize_ids:
+        ids = {}
+        for element in root.iter():
+            if gml_id in element.attrib:
+                ids.setdefault(element.attrib[gml_id], '_{}'.format(len(ids)))
+                element.attrib[gml_id] = ids[element.attrib[gml_id]]
+
+    return(hashlib.sha256(etree.tostring(root, method='c14n')).hexdigest())
+
+class validation_cache(sqlite_store):
+
+    """
+    SQLite cache of validation results, keyed by the environment (base url
+    of the api) and the canonical hash of the source document, so results
+    of the demo and production environment are kept apart. Entries expire
+    after ttl seconds, and the least recently used entries are removed when
+    the results exceed maxbytes.
+    """
+
+    def __init__(self, path, ttl=7*24*3600, maxbytes=100*1024**2):
+
+        """
+
+        Parameters
+        ----------
+        path : string
+            path of the SQLite database, created if it does not exist
+        ttl : float, optional
+            seconds a result stays valid, None for no expiry
+        maxbytes : integer, optional
+            maximum total size of the cached results, None for no limit
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+
+        tables = ["""CREATE TABLE IF NOT EXISTS results (
+                       base_url TEXT,
+                       hash TEXT,
+                       result TEXT,
+                       size INTEGER,
+                       created REAL,
+                       accessed REAL,
+                       PRIMARY KEY (base_url, hash))""",
+                  'CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)']
+
+        sqlite_store.__init__(self, path, tables)
+
+    def get(self, base_url, hash):
+
+        """
+        Returns the cached result of the document with the given hash,
+        validated by the api at base_url (client.base_url), or None if there
+        is no (valid) result.
+        """
+
+        now = time.time()
+
+        with self.lock:
+            rows = self.connection.execute('SELECT result, created FROM results WHERE base_url=? AND hash=?', (base_url, hash)).fetchall()
+            if len(rows) == 0 or (self.ttl is not None and now-rows[0][1] > self.ttl):
+                self.misses += 1
+                return(None)
+            self.connection.execute('UPDATE results SET accessed=? WHERE base_url=? AND hash=?', (now, base_url, hash))
+            self.hits += 1
+
+        return(json.loads(rows[0][0]))
+
+    def set(self, base_url, hash, result):
+
+        content = json.dumps(result)
+        now = time.time()
+
+        self.execute('INSERT OR REPLACE INTO results (base_url, hash, result, size, created, accessed) VALUES (?,?,?,?,?,?)',
+                     (base_url, hash, content, len(content), now, now))
+
+    def evict(self):
+
+        """
+        Removes expired results, and the least recently used results until
+        the cache is within maxbytes. Returns the number of removed results.
+        """
+
+        with self.transaction() as connection:
+            removed = 0
+            if self.ttl is not None:
+                removed += connection.execute('DELETE FROM results WHERE created < ?', (time.time()-self.ttl,)).rowcount
+            if self.maxbytes is not None:
+                total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+                if total > self.maxbytes:
+                    rowids = []
+                    for rowid, size in connection.execute('SELECT rowid, size FROM results ORDER BY accessed').fetchall():
+                        if total <= self.maxbytes:
+                            break
+                        rowids.append((rowid,))
+                        total -= size
+                    connection.executemany('DELETE FROM results WHERE rowid=?', rowids)
+                    removed += len(rowids)
+
+        return(removed)
+
+    def clear(self):
+
+        self.execute('DELETE FROM results')
+
+#%%
+
+def validate_sourcedoc_cached(client, sourcedoc, token, cache=None, normalize_ids=False):
+
+    """
+    Validates one source document with client, returning its result from
+    cache if the cache holds one for the environment of the client. New
+    results with a status are stored in the cache. sourcedoc may be an XML
+    string, bytes, a file object or a function returning one of these.
+    """
+
+    if callable(sourcedoc):
+        sourcedoc = sourcedoc()
+    if hasattr(sourcedoc, 'read'):
+        with sourcedoc:
+            sourcedoc = sourcedoc.read()
+
+    if cache is not None:
+        hash = gen_canonical_hash(sourcedoc, normalize_ids)
+        result = cache.get(client.base_url, hash)
+        if result is not None:
+            return(result)
+
+    result = client.validate_sourcedoc(sourcedoc, token)
+    if cache is not None and 'status' in result:
+        cache.set(client.base_url, hash, result)
+
+    return(result)
+
+def validate_sourcedocs(sourcedocs, token, demo=False, cache=None, max_workers=4, normalize_ids=False, client=None):
+    """
+
+
+    Parameters
+    ----------
+    sourcedocs : dictionary or iterable
+        filenames with source documents, as dictionary or as (filename,
+        sourcedoc) pairs. A sourcedoc is an XML string, bytes or a file
+        object, or a function without arguments returning one of these.
+    token : dictionary
+        dictionary with authentication data. keys:
+            - user
+            - pass
+    demo : Bool
+        Defaults to False. If true, the test environment
+        of the bronhouderportaal is selected for data exchange
+    cache : validation_cache or string, optional
+        cache (or path of the SQLite cache) of validation results.
+        Documents with a cached result of the same environment are not sent
+        to the portal.
+    max_workers : integer
+        Defaults to 4. Maximum number of concurrent validations.
+    normalize_ids : Bool
+        Defaults to False. If True, documents that only differ in their
+        gml:ids share their cached result (see gen_canonical_hash)
+    client : bhp_client, optional
+        client to use, defaults to the shared client of the environment
+
+    Returns
+    -------
+    dictionary with per filename the validation result (json), or the error
+    message if the validation failed
+
+    """
+
+    if client is None:
+        client = get_client(demo)
+    if type(cache)==str:
+        cache = validation_cache(cache)
+    if type(sourcedocs)==dict:
+        sourcedocs = sourcedocs.items()
+
+    def validate(filename, sourcedoc):
+        try:
+            return(validate_sourcedoc_cached(client, sourcedoc, token, cache, normalize_ids))
+        except Exception as e:
+            return('Error: {}'.format(e))
+
+    results = {}
+    if max_workers == 1:
+        for filename, sourcedoc in sourcedocs:
+            results[filename] = validate(filename, sourcedoc)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for (filename, sourcedoc), future in submit_bounded(executor, lambda item: validate(*item), sourcedocs):
+                results[filename] = future.result()
+
+    if cache is not None:
+        cache.evict()
+
+    return(results)
@@ -1,5 +1,7 @@
 from gwmpy.broxml.gld.requests import *
 from gwmpy.broxml.gld.constructables import *
 from gwmpy.broxml.gld.sourcedocs import *
+from gwmpy.broxml.gld.batch import *
+from gwmpy.broxml.gld.readers import *
 
 
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.broxml.gld.requests import gld_registration_request
+from gwmpy.broxml.gld.constructables import gen_result_columns, gld_point_serializer, point_qualifiers
+from gwmpy.broxml.mappings import ns_regreq_map_gld3, codespace_map_gld1 # mappings
+from gwmpy.common import submit_bounded
+
+from lxml import etree
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import os
+import traceback
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Splitting of long timeseries into multiple GLD_Addition requests, and
+# generation of GLD_Addition requests for many tubes in parallel
+
+#%%
+
+# Number of characters of a time string identifying a calendar period
+calendar_periods = {'year':4,
+                    'month':7,
+                    'day':10}
+
+def gen_result_arrays(data):
+
+    """
+    Returns the columns of data['result'] (see gen_result_columns) as numpy
+    arrays. Columns that already are arrays are used as they are, so slices
+    of the returned columns are views on the input.
+    """
+
+    result = data['result']
+
+    if isinstance(result, pd.DataFrame) and 'metadata' not in result.columns:
+        result = dict((column, result[column].to_numpy()) for column in result.columns)
+        if 'time' not in result.keys():
+            result['time'] = data['result'].index.to_numpy()
+
+    if type(result)==dict and 'metadata' not in result.keys():
+        columns = {}
+        for column in ['time','value']+point_qualifiers:
+            if column in result.keys():
+                if isinstance(result[column], np.ndarray):
+                    columns[column] = result[column]
+                else:
+                    columns[column] = np.asarray(result[column], dtype=object)
+        return(columns)
+    else:
+        columns = gen_result_columns(data)
+        return(dict((column, np.asarray(columns[column], dtype=object)) for column in columns.keys()))
+
+def gen_period_keys(time, align):
+
+    if align == 'quarter':
+        return([str(t)[:4]+'Q'+str((int(str(t)[5:7])-1)//3) for t in time])
+    elif align in calendar_periods.keys():
+        return([str(t)[:calendar_periods[align]] for t in time])
+    else:
+        raise Exception("Error: align should be one of {}".format(['quarter']+list(calendar_periods.keys())))
+
+def split_result(columns, maxpoints=None, maxbytes=None, align=None, overhead=0):
+
+    """
+
+    Parameters
+    ----------
+    columns : dictionary
+        columnar timeseries (see gen_result_arrays), sorted by time
+    maxpoints : integer, optional
+        maximum number of points per chunk
+    maxbytes : integer, optional
+        maximum size in bytes of a chunk, including overhead
+    align : string, optional
+        'year', 'quarter', 'month' or 'day'. If given, chunks never cross
+        the boundary of a calendar period (in the local time of the time
+        strings)
+    overhead : integer
+        size in bytes of a request without points
+
+    Returns
+    -------
+    list of (start, stop) index pairs, one per chunk
+
+    """
+
+    npoints = len(columns['time'])
+
+    # Calendar boundaries:
+    if align is not None:
+        keys = gen_period_keys(columns['time'], align)
+        starts = [0]+[i for i in range(1, npoints) if keys[i]!=keys[i-1]]
+    else:
+        starts = [0]
+    segments = list(zip(starts, starts[1:]+[npoints]))
+
+    # Point sizes, only when a byte budget is given. They are computed from
+    # the qualifier templates, the points themselves are not rendered:
+    if maxbytes is not None:
+        serializer = gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1)
+        sizes = list(serializer.sizes(gen_result_columns({'result':columns})))
+
+    chunks = []
+    for start, stop in segments:
+        chunkstart = start
+        chunkbytes = overhead
+        for i in range(start, stop):
+            if maxpoints is not None and i-chunkstart >= maxpoints:
+                chunks.append((chunkstart, i))
+                chunkstart, chunkbytes = i, overhead
+            if maxbytes is not None:
+                if chunkbytes+sizes[i] > maxbytes and i > chunkstart:
+                    chunks.append((chunkstart, i))
+                    chunkstart, chunkbytes = i, overhead
+                chunkbytes += sizes[i]
+        if stop > chunkstart:
+            chunks.append((chunkstart, stop))
+
+    return(chunks)
+
+#%%
+
+def gld_addition_requests(maxpoints=None, maxbytes=None, align=None, **kwargs):
+
+    """
+    Splits one long timeseries for a tube into multiple GLD_Addition
+    registration requests.
+
+    Parameters
+    ----------
+    maxpoints : integer, optional
+        maximum number of points per request
+    maxbytes : integer, optional
+        maximum size in bytes of a generated request
+    align : string, optional
+        'year', 'quarter', 'month' or 'day'. If given, requests never cross
+        the boundary of a calendar period
+    **kwargs : -
+        arguments of gld_registration_request. The requestReference of each
+        request gets the suffix _1, _2, ... The phenomenonTime of each request
+        is derived from its own chunk of the timeseries.
+
+    Returns
+    -------
+    list of gld_registration_request objects (not yet generated). The
+    results of the requests are views on the input columns, no point data
+    is copied.
+
+    """
+
+    srcdocdata = kwargs['srcdocdata']
+    columns = gen_result_arrays(srcdocdata)
+
+    # Request without points, with the longest requestReference possible
+    base = gld_registration_request('GLD_Addition', **dict(kwargs,
+                                    requestReference='{}_{}'.format(kwargs['requestReference'], len(columns['time']))))
+
+    overhead = 0
+    if maxbytes is not None:
+        header = base.gen_request(dict(srcdocdata, result={'time':[columns['time'][0]]*2}), gen_timeseries=False)
+        header.find('.//{%s}MeasurementTimeseries' % ns_regreq_map_gld3['wml2']).append(etree.Comment('points'))
+        overhead = len(etree.tostring(etree.ElementTree(header), encoding='utf8', method='xml'))-len('<!--points-->')
+
+    chunks = split_result(columns, maxpoints, maxbytes, align, overhead)
+
+    requests = []
+    for number, (start, stop) in enumerate(chunks):
+        chunkdata = dict(srcdocdata, result=dict((column, columns[column][start:stop]) for column in columns.keys()))
+        requests.append(gld_registration_request('GLD_Addition', **dict(kwargs,
+                                                 requestReference='{}_{}'.format(kwargs['requestReference'], number+1),
+                                                 srcdocdata=chunkdata)))
+
+    return(requests)
+
+def write_gld_additions(output_dir, maxpoints=None, maxbytes=None, align=None, **kwargs):
+
+    """
+    Splits one long timeseries (see gld_addition_requests) and streams every
+    request to output_dir, with the requestReference as filename.
+
+    Returns
+    -------
+    list of filenames
+
+    """
+
+    filenames = []
+    for request in gld_addition_requests(maxpoints, maxbytes, align, **kwargs):
+        filename = os.path.join(output_dir, '{}.xml'.format(request.kwargs['requestReference']))
+        request.write_stream(filename)
+        filenames.append(filename)
+
+    return(filenames)
+
+#%%
+
+# =============================================================================
+# Batch generation over many tubes
+# =============================================================================
+
+def generate_addition_job(job, kwargs, output_dir=None):
+
+    """
+    Generates one GLD_Addition request, runs in a worker process of
+    generate_gld_additions. Exceptions are returned instead of raised, so
+    that one bad tube does not stop the batch.
+    """
+
+    if type(job)==dict:
+        jobkwargs = dict(kwargs, **job)
+    else:
+        broId, srcdocdata = job[0], job[1]
+        jobkwargs = dict(kwargs, broId=broId, srcdocdata=srcdocdata)
+        if len(job) > 2:
+            jobkwargs['requestReference'] = job[2]
+
+    # Only '{broId}' is substituted, other braces are kept as they are
+    jobkwargs['requestReference'] = jobkwargs.get('requestReference', 'GLD_Addition_{broId}').replace('{broId}', str(jobkwargs.get('broId')))
+
+    result = {'broId':jobkwargs.get('broId'),
+              'requestReference':jobkwargs['requestReference'],
+              'request':None,
+              'filename':None,
+              'error':None}
+
+    try:
+        request = gld_registration_request('GLD_Addition', **jobkwargs)
+        if output_dir is None:
+            request.generate()
+            result['request'] = request.request
+        else:
+            result['filename'] = os.path.join(output_dir, '{}.xml'.format(jobkwargs['requestReference']))
+            request.write_stream(result['filename'])
+    except Exception:
+        result['error'] = traceback.format_exc()
+
+    return(result)
+
+def generate_gld_additions(jobs, max_workers=None, output_dir=None, executor=None, **kwargs):
+
+    """
+    Generates GLD_Addition requests for many tubes in parallel processes.
+
+    Parameters
+    ----------
+    jobs : iterable
+        one job per request, consumed lazily. A job is either a tuple
+        (broId, srcdocdata) or (broId, srcdocdata, requestReference), or a
+        dictionary with gld_registration_request arguments.
+    max_workers : integer, optional
+        number of worker processes, defaults to the number of processors.
+        Ignored if executor is given.
+    output_dir : string, optional
+        if given, requests are streamed to '<requestReference>.xml' in this
+        directory instead of returned as bytes
+    executor : concurrent.futures.Executor, optional
+        executor to submit the jobs to, e.g. a ProcessPoolExecutor with a
+        specific mp_context. It is not shut down afterwards.
+    **kwargs : -
+        gld_registration_request arguments shared by all jobs
+        (qualityRegime, deliveryAccountableParty, ...). requestReference may
+        contain '{broId}', it defaults to 'GLD_Addition_{broId}'.
+
+    Returns
+    -------
+    generator yielding one dictionary per job in order of completion, with
+    keys 'broId', 'requestReference', 'request' (bytes), 'filename' and
+    'error' (traceback string, None if the job succeeded)
+
+    """
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            yield from generate_gld_additions(jobs, output_dir=output_dir, executor=executor, **kwargs)
+        return
+
+    for job, future in submit_bounded(executor, generate_addition_job, jobs, kwargs, output_dir):
+        try:
+            yield(future.result())
+        except Exception: # the worker itself failed, e.g. killed process
+            yield({'broId':job.get('broId') if type(job)==dict else job[0],
+                   'requestReference':None,
+                   'request':None,
+                   'filename':None,
+                   'error':traceback.format_exc()})
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 
 from gwmpy import check_missing_args
-from gwmpy.broxml.mappings import ns_regreq_map_gld1,ns_regreq_map_gld2,ns_regreq_map_gld3, xsi_regreq_map_gld1, codespace_map_gld1 # mappings
+from gwmpy.broxml.mappings import ns_regreq_map_gld3, codespace_map_gld1 # mappings
 
 from lxml import etree
-import uuid
+from xml.sax.saxutils import escape, quoteattr
+import collections
+import copy
+import itertools
+import json
+import threading
 import datetime
+import numpy as np
 import pandas as pd
 import uuid as uuid_gen
 
@@ -218,11 +224,16 @@ def gen_metadata(data, nsmap, codespacemap):
 #%%
 
 
-def gen_phenomenontime(data, nsmap, codespacemap, count):
+def gen_phenomenontime(data, nsmap, codespacemap, count, columns=None):
 
+    # columns: columnar timeseries (see gen_result_columns), derived from
+    # data['result'] if not given
+    
     try:
-        beginPosition = str(pd.DataFrame(data['result'])['time'][0])[:10]             
-        endPosition = str(pd.DataFrame(data['result'])['time'][len(pd.DataFrame(data['result']))-1])[:10]    
+        if columns is None:
+            columns = gen_result_columns(data)
+        beginPosition = str(columns['time'][0])[:10]
+        endPosition = str(columns['time'][-1])[:10]
     except:
         raise Exception('Error: phenomenonTime cannot be derived from timeseries')
     
@@ -390,122 +401,509 @@ def gen_procedure(data, nsmap, codespacemap):
             #raise Exception('Error: failed to compile procedure parameters')
             
     return(procedure)
-        
+
 #%%
 
-def gen_point_metadata_qualifiers(data, rec, nsmap, codespacemap, count):
-    
-   
-    qualifierlist = {}
-          
-    metadata = list(rec['metadata'].keys())
+class fragment_cache():
+
+    """
+    Size bounded LRU cache of generated subtrees (ObservationMetadata,
+    ObservationProcess), keyed by their normalized input. Additions in one
+    batch mostly share these, so the builders only run once per distinct
+    input; every request gets a copy of the cached subtree.
+    """
+
+    def __init__(self, maxsize=256):
+
+        self.maxsize = maxsize
+        self.fragments = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, builder):
+
+        """
+        Returns a copy of the subtree cached under key, after building and
+        caching it with builder() if not cached yet.
+        """
+
+        with self.lock:
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                self.fragments.move_to_end(key)
+                self.hits += 1
+
+        if fragment is None:
+            fragment = builder()
+            with self.lock:
+                self.misses += 1
+                self.fragments[key] = fragment
+                while len(self.fragments) > self.maxsize:
+                    self.fragments.popitem(last=False)
+
+        return(copy.deepcopy(fragment))
+
+    def clear(self):
+
+        with self.lock:
+            self.fragments.clear()
+            self.hits = 0
+            self.misses = 0
+
+observation_fragment_cache = fragment_cache()
+
+def gen_fragment_key(*args):
+
+    # Normalized input dictionaries as hashable key
+    return(json.dumps(args, sort_keys=True, default=str))
+
+def gen_metadata_cached(data, nsmap, codespacemap, cache=observation_fragment_cache):
+
+    """
+    Cached counterpart of gen_metadata, with equal output.
+    """
+
+    metadata = dict(data['metadata'])
+    if 'dateStamp' not in metadata.keys():
+        # the default dateStamp is today, so it is part of the key
+        metadata['dateStamp'] = str(datetime.datetime.now().date())
+
+    key = gen_fragment_key('metadata', metadata, nsmap, codespacemap)
+    return(cache.get(key, lambda: gen_metadata({'metadata':metadata}, nsmap, codespacemap)))
+
+def gen_procedure_cached(data, nsmap, codespacemap, cache=observation_fragment_cache):
+
+    """
+    Cached counterpart of gen_procedure, with equal output. Every copy gets
+    a new unique gml:id for its ObservationProcess.
+    """
+
+    key = gen_fragment_key('procedure', data['procedure'], nsmap, codespacemap)
+    procedure = cache.get(key, lambda: gen_procedure({'procedure':data['procedure']}, nsmap, codespacemap))
+
+    procedure[0].set(("{%s}" % nsmap['gml'])+'id', '_{}'.format(uuid_gen.uuid4()))
+
+    return(procedure)
 
-    if 'StatusQualityControl' in metadata:
-        qualifierlist['StatusQualityControl']=etree.Element(("{%s}" % nsmap['wml2']) + 'qualifier', nsmap=nsmap) 
-        StatusQualityControl_category = etree.SubElement(qualifierlist['StatusQualityControl'],("{%s}" % nsmap['swe']) + 'Category', nsmap=nsmap) 
-        StatusQualityControl_codeSpace =  etree.SubElement(StatusQualityControl_category,("{%s}" % nsmap['swe']) + 'codeSpace', nsmap=nsmap,
-                                                         attrib = {
-                                                                     ("{%s}" % nsmap['xlink'])+'href':codespace_map_gld1["StatusQualityControl"]                                                               
-                                                             })
-        
-        StatusQualityControl_value = etree.SubElement(StatusQualityControl_category,("{%s}" % nsmap['swe']) + 'value', nsmap=nsmap) 
-        StatusQualityControl_value.text = str(rec['metadata']['StatusQualityControl'])
-    
-    if 'censoringLimitvalue' in metadata:
-        
-        qualifierlist['censoringLimitvalue']=etree.Element(("{%s}" % nsmap['wml2']) + 'qualifier', nsmap=nsmap) 
-        censoringLimitvalue_category = etree.SubElement(qualifierlist['censoringLimitvalue'],("{%s}" % nsmap['swe']) + 'Category', nsmap=nsmap) 
-        censoringLimitvalue_codeSpace =  etree.SubElement(censoringLimitvalue_category,("{%s}" % nsmap['swe']) + 'codeSpace', nsmap=nsmap,
-                                                         attrib = {
-                                                                     ("{%s}" % nsmap['xlink'])+'href':codespace_map_gld1["censoringLimitvalue"]                                                               
-                                                             })
-        
-        censoringLimitvalue_value = etree.SubElement(censoringLimitvalue_category,("{%s}" % nsmap['swe']) + 'value', nsmap=nsmap) 
-        censoringLimitvalue_value.text = str(rec['metadata']['censoringLimitvalue'])
-        
-    return(qualifierlist)
-        
-        
-        
-        
 #%%
-    
 
-def gen_point_metadata(data, rec, nsmap, codespacemap, count):
-    
-    metadata = etree.Element(("{%s}" % nsmap['wml2']) + 'metadata', nsmap=nsmap) 
-    TVPMeasurementMetadata  = etree.SubElement(metadata, ("{%s}" % nsmap['wml2']) + 'TVPMeasurementMetadata', nsmap=nsmap) 
-    
-    if 'StatusQualityControl' not in rec['metadata'].keys():
+# =============================================================================
+# Addition, columnar result generation
+# =============================================================================
+
+# Qualifier columns of a columnar timeseries, in the order in which they are
+# written to the TVPMeasurementMetadata of a point
+point_qualifiers = ['StatusQualityControl','interpolationType','censoringLimitvalue','censoredReason']
+
+def is_missing(value):
+
+    # None and NaN both mark an empty cell in a column
+    return(value is None or (isinstance(value, float) and value != value))
+
+def gen_value_list(values):
+
+    """
+    Returns the value column as a list. As in a numeric DataFrame column,
+    integers are written as floats (1.0) if the column also holds floats
+    or empty cells, so that equal input gives equal xml regardless of the
+    input format. Single precision floats are written with their shortest
+    representation (1.1, not 1.100000023841858).
+    """
+
+    dtype = getattr(values, 'dtype', None)
+    if isinstance(dtype, np.dtype) and dtype.kind == 'f' and dtype.itemsize < 8:
+        values = np.asarray(values).astype(str).astype(np.float64)
+
+    values = values.tolist() if hasattr(values, 'tolist') else list(values)
+    values = [float(str(value)) if isinstance(value, np.floating) and not isinstance(value, float) else value for value in values]
+
+    numeric = all(is_missing(value) or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in values)
+    if numeric and any(is_missing(value) or isinstance(value, float) for value in values):
+        values = [float(value) if type(value)==int else value for value in values]
+
+    return(values)
+
+def gen_time_string(time):
+
+    # One datetime value as %Y-%m-%dT%H:%M:%S(+offset), fractions of
+    # seconds are dropped
+    if isinstance(time, datetime.datetime):
+        return(time.isoformat(timespec='seconds'))
+    elif isinstance(time, np.datetime64):
+        return(np.datetime_as_string(time, unit='s'))
+    return(time)
+
+def gen_time_strings(time):
+
+    """
+    Returns the time column as a list of strings. Datetime values (numpy
+    datetime64, pandas Timestamps, datetime objects) are formatted as
+    %Y-%m-%dT%H:%M:%S, followed by the UTC offset if timezone aware.
+    Fractions of seconds are dropped for all of them. Strings are kept as
+    given.
+    """
+
+    if isinstance(time, (pd.Series, pd.Index)) and pd.api.types.is_datetime64_any_dtype(time):
+        return([t.isoformat(timespec='seconds') for t in time])
+    elif isinstance(time, np.ndarray) and np.issubdtype(time.dtype, np.datetime64):
+        return(np.datetime_as_string(time, unit='s').tolist())
+
+    time = time.tolist() if hasattr(time, 'tolist') else list(time)
+    return([t if type(t)==str else gen_time_string(t) for t in time])
+
+def gen_result_columns(data):
+
+    """
+
+    Parameters
+    ----------
+    data : dictionary, with result item. The result item is either:
+        - a list of dictionaries with keys 'time', 'value' and 'metadata'
+          (one dictionary per point, metadata holds the qualifiers)
+        - a dictionary of equally long columns (lists or numpy arrays)
+          with keys 'time', 'value', 'StatusQualityControl',
+          'interpolationType' and optionally 'censoringLimitvalue' and
+          'censoredReason'
+        - a pandas DataFrame with either of the above as columns. If the
+          DataFrame has no 'time' column, its (datetime) index is used.
+        Empty cells in the optional columns are marked with None or NaN.
+        Times are strings with format %Y-%m-%dT%H:%M:%S(+offset) or
+        datetime values.
+
+    Returns
+    -------
+    dictionary with a list for 'time', 'value' and every point qualifier.
+    This is the only conversion of the input, the result is shared by
+    validation, phenomenonTime and result generation.
+
+    """
+
+    result = data['result']
+
+    if isinstance(result, pd.DataFrame):
+        if 'time' not in result.columns:
+            result = dict([('time', result.index)]+[(column, result[column]) for column in result.columns])
+        else:
+            result = dict((column, result[column]) for column in result.columns)
+
+    if type(result)==dict and 'metadata' not in result.keys():
+
+        for column in ['time','value','StatusQualityControl','interpolationType']:
+            if column not in result.keys():
+                raise Exception("Error: column '{}' missing in columnar result".format(column))
+
+        columns = {}
+        columns['time'] = gen_time_strings(result['time'])
+        for column in ['value']+point_qualifiers:
+            if column in result.keys():
+                values = result[column]
+                if column == 'value':
+                    columns[column] = gen_value_list(values)
+                else:
+                    columns[column] = values.tolist() if hasattr(values, 'tolist') else list(values)
+            else:
+                columns[column] = [None]*len(columns['time'])
+
+            if len(columns[column])!=len(columns['time']):
+                raise Exception("Error: columns in columnar result should have equal length")
+
+    elif type(result)==dict:
+
+        # dictionary of 'time', 'value' and 'metadata' columns
+        if sorted(result.keys())!=['metadata','time','value']:
+            raise Exception("Error: invalid input fields for result, fields should be ['time','value','metadata']")
+
+        columns = {}
+        columns['time'] = gen_time_strings(result['time'])
+        columns['value'] = gen_value_list(result['value'])
+
+        metadata = result['metadata'].tolist() if hasattr(result['metadata'], 'tolist') else list(result['metadata'])
+        for qualifier in point_qualifiers:
+            columns[qualifier] = [rec.get(qualifier) for rec in metadata]
+
+    elif type(result)==list:
+
+        if any(len(rec)!=3 for rec in result):
+            raise Exception("Error: invalid input fields for result, fields should be ['time','value','metadata']")
+
+        try:
+            columns = {}
+            columns['time'] = gen_time_strings([rec['time'] for rec in result])
+            columns['value'] = gen_value_list([rec['value'] for rec in result])
+
+            for qualifier in point_qualifiers:
+                columns[qualifier] = [rec['metadata'].get(qualifier) for rec in result]
+        except KeyError:
+            raise Exception("Error: invalid input fields for result, fields should be ['time','value','metadata']")
+
+    else:
+        raise Exception("Error: invalid input type for result, should be list with dictionaries, dictionary with columns or DataFrame")
+
+    # NaN never equals itself, mark empty cells with None so equal qualifier
+    # combinations share one template in gld_point_serializer
+    for qualifier in ['censoringLimitvalue','censoredReason']:
+        columns[qualifier] = [None if is_missing(rec) else rec for rec in columns[qualifier]]
+
+    if any(is_missing(rec) for rec in columns['StatusQualityControl']):
         raise Exception('Error: StatusQualityControl should be in qualifiers')
-    if 'interpolationType' not in rec['metadata'].keys():
+    if any(is_missing(rec) for rec in columns['interpolationType']):
         raise Exception('Error: interpolationType should be in qualifiers')
-    else:
-        #try:        
-            qualifiers = gen_point_metadata_qualifiers(data, rec, nsmap, codespacemap, count)
-            for qualifier in list(qualifiers.keys()):
-                TVPMeasurementMetadata.append(qualifiers[qualifier])  
-                
-            if 'interpolationType' in rec['metadata'].keys():
-                interpolationType  = etree.SubElement(TVPMeasurementMetadata, ("{%s}" % nsmap['wml2']) + 'interpolationType', nsmap=nsmap,
-                                                                 attrib = {
-                                                                             ("{%s}" % nsmap['xlink'])+'href':"http://www.opengis.net/def/waterml/2.0/interpolationType/{}".format(rec['metadata']['interpolationType'])                                                               
-                                                                     }) 
-            if 'censoredReason' in rec['metadata'].keys():
-                censoredReason  = etree.SubElement(TVPMeasurementMetadata, ("{%s}" % nsmap['wml2']) + 'censoredReason', nsmap=nsmap,
-                                                                 attrib = {
-                                                                             ("{%s}" % nsmap['xlink'])+'href':"http://www.opengis.net/def/nil/OGC/0/{}".format(rec['metadata']['censoredReason'])                                                               
-                                                                     })                
-        #except:
-            #raise Exception('Error: failed to compile point metadata parameters')
-            
-    return(metadata, count)
 
-#%%
+    return(columns)
 
-def gen_point(data, rec, nsmap, codespacemap, count):
-    point = etree.Element(("{%s}" % nsmap['wml2']) + 'point', nsmap=nsmap) 
-    MeasurementTVP  = etree.SubElement(point, ("{%s}" % nsmap['wml2']) + 'MeasurementTVP', nsmap=nsmap) 
+# Namespaces used in the xml string of a point
+point_namespaces = ['wml2','swe','xlink','xsi']
 
-    time  = etree.SubElement(MeasurementTVP, ("{%s}" % nsmap['wml2']) + 'time', nsmap=nsmap)
-    time.text = rec['time']
-    
-    if rec['value'] != 'None':
-        value  = etree.SubElement(MeasurementTVP, ("{%s}" % nsmap['wml2']) + 'value', nsmap=nsmap,
-													attrib = {'uom':'m'})
-        value.text = str(rec['value'])
-    else:
-        # Note, mogelijk nog aanpassen
-        value  = etree.SubElement(MeasurementTVP, ("{%s}" % nsmap['wml2']) + 'value', nsmap=nsmap,
-                                                    attrib = {
-                                                                ("{%s}" % nsmap['xsi'])+'nil':"true"                                                              
-                                                        }) 
-                                                        
-    # Generate metadata from qualifiers:    
-    metadata, count = gen_point_metadata(data, rec, nsmap, codespacemap, count)
-    MeasurementTVP.append(metadata)         
-    return(point, count)
-    
+def gen_point_prefixes(nsmap):
 
-#%%
-def gen_result(data, nsmap, codespacemap, count):
+    """
+    Returns per namespace of a point (point_namespaces) the prefix under
+    which nsmap declares its uri, so that the xml strings of points use the
+    prefixes of the document they are written to.
+    """
+
+    prefixes = {}
+    for namespace in point_namespaces:
+        uri = ns_regreq_map_gld3[namespace]
+        prefix = next((prefix for prefix, value in nsmap.items() if value == uri), None)
+        if prefix is None:
+            raise Exception("Error: namespace {} ({}) missing in nsmap".format(namespace, uri))
+        prefixes[namespace] = prefix
+
+    return(prefixes)
+
+def gen_point_metadata_fragment(qualifiers, nsmap, codespacemap):
+
+    """
+    Renders the wml2:metadata element of a point as an xml string, with
+    qualifiers a tuple ordered as point_qualifiers. Empty (None or NaN)
+    censoringLimitvalue and censoredReason qualifiers are left out.
+    """
+
+    StatusQualityControl, interpolationType, censoringLimitvalue, censoredReason = qualifiers
+
+    prefixes = gen_point_prefixes(nsmap)
+    qualifier = ('<{wml2}:qualifier><{swe}:Category><{swe}:codeSpace {xlink}:href={{}}/><{swe}:value>{{}}</{swe}:value></{swe}:Category></{wml2}:qualifier>'
+                 .format(**prefixes))
+
+    fragment = '<{wml2}:metadata><{wml2}:TVPMeasurementMetadata>'.format(**prefixes)
+
+    fragment += qualifier.format(quoteattr(codespacemap["StatusQualityControl"]), escape(str(StatusQualityControl)))
+
+    if not is_missing(censoringLimitvalue):
+        fragment += qualifier.format(quoteattr(codespacemap["censoringLimitvalue"]), escape(str(censoringLimitvalue)))
+
+    fragment += ('<{wml2}:interpolationType {xlink}:href={href}/>'
+                 .format(href=quoteattr("http://www.opengis.net/def/waterml/2.0/interpolationType/{}".format(interpolationType)), **prefixes))
+
+    if not is_missing(censoredReason):
+        fragment += ('<{wml2}:censoredReason {xlink}:href={href}/>'
+                     .format(href=quoteattr("http://www.opengis.net/def/nil/OGC/0/{}".format(censoredReason)), **prefixes))
+
+    fragment += '</{wml2}:TVPMeasurementMetadata></{wml2}:metadata>'.format(**prefixes)
+
+    return(fragment)
+
+def gen_utf8_size(text):
+
+    return(len(text) if text.isascii() else len(text.encode('utf8')))
+
+class gld_point_serializer():
+
+    """
+    Renders wml2:point xml strings. The wml2:metadata of a point only
+    depends on its qualifiers, so it is rendered once for every distinct
+    combination of qualifiers and reused; per point only the time and value
+    are spliced in. Empty (None or NaN) values are written as
+    xsi:nil="true".
+    """
+
+    def __init__(self, nsmap, codespacemap, maxtemplates=1024):
+
+        """
+
+        Parameters
+        ----------
+        nsmap : dictionary
+            namespace mapping
+        codespacemap : dictionary
+            codespace mapping
+        maxtemplates : integer
+            maximum number of cached qualifier combinations. Combinations
+            beyond this number are rendered for every point.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.nsmap = nsmap
+        self.codespacemap = codespacemap
+        self.maxtemplates = maxtemplates
+        self.templates = {}
+
+        # Fixed parts of a point, with the prefixes of nsmap
+        prefixes = gen_point_prefixes(nsmap)
+        self.head = '<{wml2}:point><{wml2}:MeasurementTVP><{wml2}:time>'.format(**prefixes)
+        self.value = '</{wml2}:time><{wml2}:value uom="m">'.format(**prefixes)
+        self.valueend = '</{wml2}:value>'.format(**prefixes)
+        self.nil = '</{wml2}:time><{wml2}:value {xsi}:nil="true"/>'.format(**prefixes)
+        self.tail = '</{wml2}:MeasurementTVP></{wml2}:point>'.format(**prefixes)
+
+    def template(self, qualifiers):
+
+        # Everything of a point after its value, for the given qualifiers.
+        # Templates are keyed on the types too, as 0, 0.0 and False (or 1
+        # and True) are equal keys but render differently.
+        key = tuple((type(qualifier), qualifier) for qualifier in qualifiers)
+        try:
+            return(self.templates[key])
+        except KeyError:
+            template = gen_point_metadata_fragment(qualifiers, self.nsmap, self.codespacemap)+self.tail
+            if len(self.templates) < self.maxtemplates:
+                self.templates[key] = template
+            return(template)
+        except TypeError: # unhashable qualifier values
+            return(gen_point_metadata_fragment(qualifiers, self.nsmap, self.codespacemap)+self.tail)
+
+    def value_text(self, value):
+
+        # Text of the wml2:value element, None for an empty (nil) value
+        if type(value)==float and value == value:
+            return(str(value))
+        elif value != 'None' and not is_missing(value):
+            return(escape(str(value)))
+        return(None)
+
+    def point(self, time, value, qualifiers):
+
+        value = self.value_text(value)
+        value = self.nil if value is None else self.value+value+self.valueend
+
+        return(self.head+escape(str(time))+value+self.template(qualifiers))
+
+    def sizes(self, columns):
+
+        """
+        Generator yielding the size in bytes (utf8) of every wml2:point of
+        columns(columns), without rendering the points: the sizes of the
+        fixed parts and of the template of every qualifier combination are
+        computed once, per point only the time and value are measured.
+        """
 
-    result = etree.Element(("{%s}" % nsmap['om']) + 'result', nsmap=nsmap) 
+        head = gen_utf8_size(self.head)
+        value = gen_utf8_size(self.value)+gen_utf8_size(self.valueend)
+        nil = gen_utf8_size(self.nil)
+        templates = {}
+
+        qualifiers = zip(*[columns[qualifier] for qualifier in point_qualifiers])
+
+        for time, text, qualifier in zip(columns['time'], columns['value'], qualifiers):
+
+            try:
+                key = tuple((type(item), item) for item in qualifier)
+                template = templates.get(key)
+                if template is None:
+                    template = templates[key] = gen_utf8_size(self.template(qualifier))
+            except TypeError: # unhashable qualifier values
+                template = gen_utf8_size(self.template(qualifier))
+
+            text = self.value_text(text)
+            size = nil if text is None else value+gen_utf8_size(text)
+
+            yield(head+gen_utf8_size(escape(str(time)))+size+template)
+
+    def columns(self, columns):
+
+        """
+        Generator yielding every wml2:point of a columnar timeseries (see
+        gen_result_columns) as an xml string.
+        """
+
+        qualifiers = zip(*[columns[qualifier] for qualifier in point_qualifiers])
+        point = self.point
+
+        for time, value, qualifier in zip(columns['time'], columns['value'], qualifiers):
+            yield(point(time, value, qualifier))
+
+    def records(self, records):
+
+        """
+        Generator yielding a wml2:point xml string for every point in an
+        iterable of dictionaries with keys 'time', 'value' and 'metadata'
+        (the list format of data['result']). The iterable is consumed lazily,
+        so values are written as given (see gen_value_list for columns).
+        """
+
+        for rec in records:
+
+            if 'StatusQualityControl' not in rec['metadata'].keys():
+                raise Exception('Error: StatusQualityControl should be in qualifiers')
+            if 'interpolationType' not in rec['metadata'].keys():
+                raise Exception('Error: interpolationType should be in qualifiers')
+
+            time = rec['time'] if type(rec['time'])==str else gen_time_string(rec['time'])
+            qualifiers = tuple(rec['metadata'].get(qualifier) for qualifier in point_qualifiers)
+            yield(self.point(time, rec['value'], qualifiers))
+
+def gen_point_fragments(columns, nsmap, codespacemap):
+
+    """
+    Generator yielding every wml2:point of a columnar timeseries (see
+    gen_result_columns) as an xml string.
+    """
+
+    return(gld_point_serializer(nsmap, codespacemap).columns(columns))
+
+def gen_record_fragments(records, nsmap, codespacemap):
+
+    """
+    Generator yielding a wml2:point xml string for every point in an
+    iterable of dictionaries with keys 'time', 'value' and 'metadata' (the
+    list format of data['result']). The iterable is consumed lazily.
+    """
+
+    return(gld_point_serializer(nsmap, codespacemap).records(records))
+
+def gen_points_columnar(columns, nsmap, codespacemap, chunksize=10000):
+
+    """
+    Generator yielding lists of (at most chunksize) wml2:point elements of a
+    columnar timeseries. Each chunk is parsed by lxml in one go, instead of
+    building every point with separate SubElement calls.
+    """
+
+    wrapper = '<points {}>'.format(' '.join('xmlns:{}="{}"'.format(prefix, uri) for prefix, uri in nsmap.items()))
+
+    fragments = gen_point_fragments(columns, nsmap, codespacemap)
+
+    while True:
+        chunk = list(itertools.islice(fragments, chunksize))
+        if len(chunk)==0:
+            break
+        yield(list(etree.fromstring(wrapper+''.join(chunk)+'</points>')))
+
+def gen_result_columnar(data, nsmap, codespacemap, count, columns=None):
+
+    """
+    Generates the om:result of a GLD_Addition. The
+    timeseries is taken from columns (see gen_result_columns) or, if not
+    given, from data['result'].
+    """
+
+    if columns is None:
+        columns = gen_result_columns(data)
+
+    result = etree.Element(("{%s}" % nsmap['om']) + 'result', nsmap=nsmap)
     MeasurementTimeseries  = etree.SubElement(result, ("{%s}" % nsmap['wml2']) + 'MeasurementTimeseries', nsmap=nsmap,
                                            attrib={
                                                ("{%s}" % nsmap['gml'])+'id':'_{}'.format(uuid_gen.uuid4())
                                                }
-                                           )      
-    
-    timeseriesdata = pd.DataFrame(data['result'])
-    timeseriesdata.index = range(len(timeseriesdata))
-    
-    # Generate points out of timeseriesdata
-    points = {}
-    
-    for point in range(len(timeseriesdata)):
-        points['points_{}'.format(str(point))], count = gen_point(data, timeseriesdata.iloc[point], nsmap, codespacemap, count)
-        MeasurementTimeseries.append(points['points_{}'.format(str(point))])        
-    
+                                           )
+
+    for points in gen_points_columnar(columns, nsmap, codespacemap):
+        MeasurementTimeseries.extend(points)
+
     return(result,count)
-  
\ No newline at end of file
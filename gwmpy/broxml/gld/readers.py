@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.broxml.gld.constructables import point_qualifiers
+
+import numpy as np
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Readers for GLD timeseries stored as Apache Arrow tables or Parquet files.
+# pyarrow is an optional dependency (pip install gwmpy[arrow]), it is only
+# imported when one of the readers is used.
+
+#%%
+
+def import_pyarrow():
+
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("Error: reading Arrow tables or Parquet files requires pyarrow, install it with 'pip install pyarrow'")
+
+    return(pyarrow)
+
+def read_arrow_result(table, columns=None):
+
+    """
+
+    Parameters
+    ----------
+    table : pyarrow.Table
+        table with one row per point
+    columns : dictionary, optional
+        mapping of result columns ('time', 'value', 'StatusQualityControl',
+        'interpolationType', 'censoringLimitvalue', 'censoredReason') to
+        column names in the table. Defaults to equal names. Optional
+        qualifiers missing in the table are left out.
+
+    Returns
+    -------
+    dictionary of numpy arrays, to be used as srcdocdata['result'].
+    Numeric and timezone naive timestamp columns without nulls that consist
+    of one chunk share their buffer with the table. This only saves the
+    copy into numpy: gen_result_columns converts every column to a list of
+    Python values (and times to strings) before the points are written, so
+    generating a document copies the data once. Timezone aware timestamps
+    become object arrays of aware datetime objects, as numpy datetime64 has
+    no timezone. String columns and integer columns with nulls become
+    object arrays.
+
+    """
+
+    pa = import_pyarrow()
+
+    if columns is None:
+        columns = {}
+
+    result = {}
+    for column in ['time','value']+point_qualifiers:
+
+        name = columns.get(column, column)
+
+        if name not in table.column_names:
+            if column in ['censoringLimitvalue','censoredReason']:
+                continue
+            raise Exception("Error: column '{}' for '{}' not found in table".format(name, column))
+
+        data = table.column(name)
+
+        if pa.types.is_timestamp(data.type) and data.type.tz is not None:
+            # numpy has no timezones, keep the local time and offset
+            result[column] = np.array(data.to_pylist(), dtype=object)
+        elif pa.types.is_integer(data.type) and data.null_count > 0:
+            # numpy would turn the integers into floats to hold NaN
+            result[column] = np.array(data.to_pylist(), dtype=object)
+        else:
+            result[column] = data.to_numpy()
+
+    return(result)
+
+def read_parquet_result(source, columns=None, filters=None):
+
+    """
+
+    Parameters
+    ----------
+    source : string or file-like object
+        Parquet file (or partitioned dataset directory)
+    columns : dictionary, optional
+        mapping of result columns to column names in the file (see
+        read_arrow_result)
+    filters : list, optional
+        pyarrow row filters, e.g. [('broId', '==', 'GLD000000000153')]
+
+    Returns
+    -------
+    dictionary of numpy arrays, to be used as srcdocdata['result']
+
+    """
+
+    pa = import_pyarrow()
+
+    if columns is None:
+        columns = {}
+
+    dataset = pa.parquet.ParquetDataset(source, filters=filters, memory_map=True)
+
+    # Only read the result columns, optional qualifiers may be absent
+    names = [columns.get(column, column) for column in ['time','value']+point_qualifiers]
+    table = dataset.read(columns=[name for name in names if name in dataset.schema.names])
+
+    return(read_arrow_result(table, columns))
@@ -5,6 +5,7 @@ from gwmpy.broxml.mappings import ns_regreq_map_gld1,ns_regreq_map_gld2,ns_regre
 from gwmpy.checks import check_missing_args
 
 from lxml import etree
+import itertools
 import os
 
 
@@ -66,7 +67,18 @@ class gld_registration_request():
         check_missing_args(self.kwargs, arglist, 'gmw_registration with method initialize')
          
     def generate(self):
-               
+
+        req = self.gen_request()
+
+        self.requesttree = etree.ElementTree(req)
+        self.request = etree.tostring(self.requesttree, encoding='utf8', method='xml')
+        #print(etree.tostring(req, pretty_print=True,encoding='unicode'))
+
+    def gen_request(self, srcdocdata=None, gen_timeseries=True):
+
+        if srcdocdata is None:
+            srcdocdata = self.kwargs['srcdocdata']
+
         # Generate xml document base:
         if self.srcdoc == 'GLD_StartRegistration':
             
@@ -112,7 +124,7 @@ class gld_registration_request():
             if 'broId' in list(self.kwargs.keys()):
                 raise Exception("Registration request argument 'broId' not allowed in combination with given sourcedocument")
             else:
-                sourceDocument=gen_gld_startregistration(self.kwargs['srcdocdata'], ns_regreq_map_gld2, codespace_map_gld1)
+                sourceDocument=gen_gld_startregistration(srcdocdata, ns_regreq_map_gld2, codespace_map_gld1)
                 req.append(sourceDocument)
 
         elif self.srcdoc == 'GLD_Addition':
@@ -120,20 +132,90 @@ class gld_registration_request():
             if 'broId' not in list(self.kwargs.keys()):
                 raise Exception("Registration request argument 'broId' required in combination with given sourcedocument")
             else:
-                sourceDocument=gen_gld_addition(self.kwargs['srcdocdata'], ns_regreq_map_gld3, codespace_map_gld1)
+                sourceDocument=gen_gld_addition(srcdocdata, ns_regreq_map_gld3, codespace_map_gld1, gen_timeseries=gen_timeseries)
                 req.append(sourceDocument)
-        
-        self.requesttree = etree.ElementTree(req)
-        self.request = etree.tostring(self.requesttree, encoding='utf8', method='xml')
-        #print(etree.tostring(req, pretty_print=True,encoding='unicode'))
+
+        return(req)
 
     def write_xml(self, filename, output_dir=None):
-    
+
         if output_dir == None:
             self.requesttree.write(filename, pretty_print = True)
         else:
             self.requesttree.write(os.path.join(output_dir,filename), pretty_print=True)
 
+    def write_stream(self, target, result=None, phenomenonTime=None, chunksize=10000):
+
+        """
+        Streaming counterpart of generate and write_xml for GLD_Addition.
+        The request header, observation metadata and procedure are written
+        once, after which the points are written chunk by chunk. Neither the
+        full tree nor the full xml string is held in memory. Output equals
+        self.request after generate.
+
+        Parameters
+        ----------
+        target : string or file-like object
+            filename, or object with a write method accepting bytes (open
+            binary file, socket.makefile('wb'), ...)
+        result : iterable, optional
+            iterable of dictionaries with keys 'time', 'value' and 'metadata'
+            (the list format of srcdocdata['result']), consumed lazily.
+            Defaults to srcdocdata['result'].
+        phenomenonTime : tuple, optional
+            (beginPosition, endPosition). Obligated if result is given, as
+            the phenomenonTime precedes the points in the document.
+        chunksize : integer
+            number of points rendered per write
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if self.srcdoc != 'GLD_Addition':
+            raise Exception("Streaming is only available for sourcedocument 'GLD_Addition'")
+
+        srcdocdata = self.kwargs['srcdocdata']
+
+        if result is None:
+            columns = gen_result_columns(srcdocdata)
+            fragments = gen_point_fragments(columns, ns_regreq_map_gld3, codespace_map_gld1)
+            phenomenonTime = (columns['time'][0], columns['time'][-1])
+        elif phenomenonTime is None:
+            raise Exception("Argument 'phenomenonTime' obligated when streaming points from an iterable")
+        else:
+            fragments = gen_record_fragments(result, ns_regreq_map_gld3, codespace_map_gld1)
+
+        # the header only needs the first and last time of the series
+        srcdocdata = dict(srcdocdata, result={'time':list(phenomenonTime)})
+
+        req = self.gen_request(srcdocdata, gen_timeseries=False)
+
+        # Split the serialized request at the (empty) MeasurementTimeseries
+        MeasurementTimeseries = req.find('.//{%s}MeasurementTimeseries' % ns_regreq_map_gld3['wml2'])
+        MeasurementTimeseries.append(etree.Comment('points'))
+        head, tail = etree.tostring(etree.ElementTree(req), encoding='utf8', method='xml').split(b'<!--points-->')
+
+        if isinstance(target, str):
+            with open(target, 'wb') as file:
+                write_fragments(file, head, fragments, tail, chunksize)
+        else:
+            write_fragments(target, head, fragments, tail, chunksize)
+
+#%%
+
+def write_fragments(file, head, fragments, tail, chunksize):
+
+    file.write(head)
+    while True:
+        chunk = list(itertools.islice(fragments, chunksize))
+        if len(chunk)==0:
+            break
+        file.write(''.join(chunk).encode('utf8'))
+    file.write(tail)
+
 #%% gld replace request
 
 
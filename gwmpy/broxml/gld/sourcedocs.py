@@ -5,7 +5,6 @@ from gwmpy import check_missing_args
 
 from lxml import etree
 import uuid as uuid_gen
-import pandas as pd
 
 # =============================================================================
 # General info
@@ -70,7 +69,10 @@ def gen_gld_startregistration(data, nsmap, codespacemap):
     
 #%%
 
-def gen_gld_addition(data, nsmap, codespacemap):
+def gen_gld_addition(data, nsmap, codespacemap, gen_timeseries=True):
+    
+    # gen_timeseries: if False, the MeasurementTimeseries is left empty so 
+    # that points can be streamed into it (see write_stream)
     
     count = 2
     
@@ -80,7 +82,7 @@ def gen_gld_addition(data, nsmap, codespacemap):
                 'procedure':'obligated',
                 'observedProperty':'fixed',
                 'featureOfInterest':'fixed',
-                'result':'obligated', # Note, timeseries input in datetime string with format %Y-%m-%dT%H:%M:%S
+                'result':'obligated', # Note, timeseries input in datetime string with format %Y-%m-%dT%H:%M:%S, see gen_result_columns for input types
                 }      
     
     # Note: mapSheetCode is a valid optional argument that hasn't been included yet
@@ -90,6 +92,12 @@ def gen_gld_addition(data, nsmap, codespacemap):
     # Check wether all obligated arguments are in data
     check_missing_args(data, arglist, 'gen_gld_addition')
     
+    # Timeseries converted once, shared by phenomenonTime and result
+    if gen_timeseries == False:
+        columns = {'time':data['result']['time']} # only first and last time are used
+    else:
+        columns = gen_result_columns(data)
+    
     sourceDocument = etree.Element("sourceDocument") 
     GLD_Addition  = etree.SubElement(sourceDocument, "GLD_Addition", 
                                         attrib = {            
@@ -115,10 +123,10 @@ def gen_gld_addition(data, nsmap, codespacemap):
         if arg in data.keys():
 
             if arg == 'metadata':
-                OM_Observation_subelements['metadata'] = gen_metadata(data, nsmap, codespacemap)
+                OM_Observation_subelements['metadata'] = gen_metadata_cached(data, nsmap, codespacemap)
                 OM_Observation.append(OM_Observation_subelements['metadata'])
             elif arg == 'phenomenonTime':
-                OM_Observation_subelements['phenomenonTime'], count = gen_phenomenontime(data, nsmap, codespacemap, count)
+                OM_Observation_subelements['phenomenonTime'], count = gen_phenomenontime(data, nsmap, codespacemap, count, columns=columns)
                 OM_Observation.append(OM_Observation_subelements['phenomenonTime'])
             elif arg == 'resultTime':
                 OM_Observation_subelements['resultTime'],count = gen_resulttime(data, nsmap, codespacemap, count)
@@ -135,7 +143,7 @@ def gen_gld_addition(data, nsmap, codespacemap):
                 # 2: creation of new procedure with given input
                 
                 elif type(data['procedure'])==dict:
-                    OM_Observation_subelements['procedure'] = gen_procedure(data, nsmap, codespacemap)
+                    OM_Observation_subelements['procedure'] = gen_procedure_cached(data, nsmap, codespacemap)
                     OM_Observation.append(OM_Observation_subelements['procedure'])   
                 else:
                     raise Exception("Error: invalid input type for procedure, should be 'dict' or 'str' ")
@@ -146,13 +154,10 @@ def gen_gld_addition(data, nsmap, codespacemap):
                 observedProperty  = etree.SubElement(OM_Observation, ("{%s}" % nsmap['om']) + 'featureOfInterest', nsmap=nsmap) 
             elif arg == 'result':
                 #try:
-                    if type(data['result'])!=list:
-                        raise Exception("Error: invalid input type for result, should be list with dictionaries")
-                    elif list(pd.DataFrame(data['result']).columns)!=['time','value','metadata']:
-                        raise Exception("Error: invalid input fields for result, fields should be ['time','value','qualifiers']")
-                    else:
-                        OM_Observation_subelements['result'], count = gen_result(data, nsmap, codespacemap, count)
-                        OM_Observation.append(OM_Observation_subelements['result'])    
+                    if gen_timeseries == False:
+                        columns = dict((column, []) for column in ['time','value']+point_qualifiers)
+                    OM_Observation_subelements['result'], count = gen_result_columnar(data, nsmap, codespacemap, count, columns=columns)
+                    OM_Observation.append(OM_Observation_subelements['result'])
                 #except:
                     #raise Exception("Error: failed to compose timeseriesdata, probably due to input format")
                     
@@ -162,7 +167,7 @@ def gen_gld_addition(data, nsmap, codespacemap):
         else: # fixed arguments (in case not in data)
         
             if arg == 'phenomenonTime':
-                OM_Observation_subelements['phenomenonTime'], count = gen_phenomenontime(data, nsmap, codespacemap, count)
+                OM_Observation_subelements['phenomenonTime'], count = gen_phenomenontime(data, nsmap, codespacemap, count, columns=columns)
                 OM_Observation.append(OM_Observation_subelements['phenomenonTime'])
             elif arg == 'resultTime':
                 OM_Observation_subelements['resultTime'], count = gen_resulttime(data, nsmap, codespacemap, count)
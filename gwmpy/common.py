@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import wait, FIRST_COMPLETED
+import itertools
+import os
+
+# =============================================================================
+# General info
+# =============================================================================
+
+# Helpers shared by the xml generation (broxml) and the connector (bhp), for
+# functions that spread work over a pool of threads or processes. This
+# module imports nothing from gwmpy.
+
+#%%
+
+def submit_bounded(executor, function, items, *args, max_pending=None):
+
+    """
+    Submits function(item, *args) to executor for every item, with at most
+    max_pending (default twice the number of workers) submitted at the same
+    time, so that an iterator of items is consumed lazily. Yields (item,
+    future) pairs in order of completion.
+    """
+
+    if max_pending is None:
+        max_pending = 2*getattr(executor, '_max_workers', os.cpu_count() or 1)
+
+    items = iter(items)
+    pending = {}
+    while True:
+        for item in itertools.islice(items, max(max_pending-len(pending), 0)):
+            pending[executor.submit(function, item, *args)] = item
+        if len(pending)==0:
+            break
+
+        done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+        for future in done:
+            yield((pending.pop(future), future))
@@ -23,6 +23,8 @@ setup(
           description='this package contains some tools for data exchange with the BRO, specificly for the groundwatermonitoring domain',
           author='',
           packages=find_packages(exclude=['tests','examples']),
-          install_requires=['requests>=2.24.0','lxml>=4.6.1','uuid']
+          install_requires=['requests>=2.24.0','lxml>=4.6.1','uuid'],
+          extras_require={'arrow':['pyarrow'],
+                          'async':['aiohttp']}
           
           )
\ No newline at end of file
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import bhp_client
+from gwmpy.bhp.standin import bhp_standin_server
+
+import pytest
+
+@pytest.fixture
+def token():
+
+    return({'user':'user', 'pass':'pass'})
+
+@pytest.fixture
+def standin():
+
+    with bhp_standin_server(state_duration=0.) as server:
+        yield(server)
+
+@pytest.fixture
+def client(standin):
+
+    client = bhp_client(base_url=standin.url, pool_connections=1, pool_maxsize=8, max_retries=0)
+    yield(client)
+    client.close()
+
+@pytest.fixture
+def other_client():
+
+    # Client of a second environment, e.g. demo next to production
+    with bhp_standin_server(state_duration=0.) as server:
+        client = bhp_client(base_url=server.url, pool_connections=1, pool_maxsize=8, max_retries=0)
+        client.standin = server
+        yield(client)
+        client.close()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.asyncconnector import bhp_async_client, gen_basic_auth
+
+import asyncio
+import io
+
+import pytest
+import requests
+
+pytest.importorskip('aiohttp')
+
+def test_add_sourcedocs_bounded(standin, token):
+
+    counts = {'open':0, 'max_open':0, 'generated':0}
+
+    class counted_file(io.BytesIO):
+        def close(self):
+            if not self.closed:
+                counts['open'] -= 1
+            io.BytesIO.close(self)
+
+    def open_sourcedoc():
+        counts['open'] += 1
+        counts['max_open'] = max(counts['max_open'], counts['open'])
+        return(counted_file(b'<a/>'))
+
+    def gen_sourcedocs():
+        for i in range(50):
+            counts['generated'] += 1
+            # At most one document taken per worker ahead of the uploads
+            assert counts['generated']-len(standin.sourcedocs) <= 4
+            yield(('{}.xml'.format(i), open_sourcedoc))
+
+    async def run():
+        async with bhp_async_client(base_url=standin.url, max_concurrency=4) as client:
+            upload_url = await client.create_upload(token)
+            return(await client.add_sourcedocs(upload_url, gen_sourcedocs(), token))
+
+    codes = asyncio.run(run())
+
+    assert len(codes) == 50
+    assert set(codes.values()) == {201}
+    assert counts['open'] == 0
+    assert counts['max_open'] <= 4
+
+def test_basic_auth():
+
+    # Equal to the header of the connector (requests)
+    for token in [{'user':'user', 'pass':'pass'}, {'user':'gebruiker', 'pass':'wächtwoord:1'}]:
+        prepared = requests.Request('GET', 'http://localhost', auth=(token['user'], token['pass'])).prepare()
+        assert gen_basic_auth(token) == prepared.headers['Authorization']
+
+@pytest.mark.filterwarnings('error::DeprecationWarning')
+def test_request_headers(standin, token):
+
+    async def run():
+        async with bhp_async_client(base_url=standin.url) as client:
+            return(await client.validate_sourcedoc('<a/>', token))
+
+    assert asyncio.run(run())['status'] == 'VALIDE'
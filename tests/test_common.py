@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.common import submit_bounded
+from gwmpy.bhp.common import sqlite_store
+
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+
+import pytest
+
+def test_submit_bounded_is_lazy():
+
+    taken = []
+
+    def gen_items():
+        for i in itertools.count():
+            taken.append(i)
+            yield(i)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = []
+        for item, future in submit_bounded(executor, lambda item, factor: item*factor, gen_items(), 10):
+            results.append(future.result())
+            if len(results) == 5:
+                break
+
+    # At most twice the number of workers submitted ahead
+    assert len(taken) <= 5+4
+    assert all(result % 10 == 0 for result in results)
+
+def test_submit_bounded_all_items():
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = dict((item, future.result()) for item, future in submit_bounded(executor, abs, range(-20, 0)))
+
+    assert results == dict((i, -i) for i in range(-20, 0))
+
+def test_sqlite_store_transaction(tmp_path):
+
+    store = sqlite_store(str(tmp_path/'store.sqlite'), ['CREATE TABLE IF NOT EXISTS items (item INTEGER)'])
+
+    with store.transaction() as connection:
+        connection.executemany('INSERT INTO items VALUES (?)', [(1,), (2,)])
+    with pytest.raises(ValueError):
+        with store.transaction() as connection:
+            connection.execute('INSERT INTO items VALUES (3)')
+            raise ValueError()
+
+    assert store.execute('SELECT item FROM items ORDER BY item') == [(1,), (2,)]
+    store.close()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import bhp_client, sourcedoc_added
+from gwmpy.bhp.common import sqlite_store
+from gwmpy.bhp.journal import upload_journal
+from gwmpy.bhp.ledger import delivery_ledger
+from gwmpy.bhp.standin import bhp_standin_server
+
+import io
+
+import pytest
+import requests
+
+def gen_sourcedocs(n):
+
+    return(dict(('{}.xml'.format(i), '<a>{}</a>'.format('<b>{}</b>'.format(i)*50)) for i in range(n)))
+
+# =============================================================================
+# Compression
+# =============================================================================
+
+@pytest.mark.parametrize('compression', ['gzip', 'deflate'])
+def test_compression(standin, token, compression):
+
+    client = bhp_client(base_url=standin.url, pool_connections=1, pool_maxsize=1, max_retries=0, compression=compression)
+
+    assert client.validate_sourcedoc('<a>'+'x'*1000+'</a>', token)['status'] == 'VALIDE'
+    assert client.upload_sourcedocs(gen_sourcedocs(3), token).json()['status'] == 'DOORGELEVERD'
+
+    stats = client.transfer_stats()
+    assert stats['documents'] == 4
+    assert stats['compressed'] == 4
+    assert stats['fallbacks'] == 0
+    assert stats['bytes_sent'] < stats['bytes']
+
+def test_compression_fallback(token):
+
+    with bhp_standin_server(state_duration=0., compression=False) as standin:
+        client = bhp_client(base_url=standin.url, pool_connections=1, pool_maxsize=1, max_retries=0, compression='gzip')
+        delivery = client.upload_sourcedocs(dict((name, io.BytesIO(sourcedoc.encode())) for name, sourcedoc in gen_sourcedocs(3).items()), token)
+
+        assert delivery.json()['status'] == 'DOORGELEVERD'
+        # The rejected document was sent again uncompressed, the others
+        # were not compressed anymore
+        assert client.transfer_stats()['fallbacks'] == 1
+        assert client.transfer_stats()['compressed'] == 0
+        assert client.compression_supported == {'brondocumenten':False}
+        assert [standin.sourcedocs[id]['content'] for id in sorted(standin.sourcedocs)] == [sourcedoc.encode() for sourcedoc in gen_sourcedocs(3).values()]
+
+def gen_response(status_code, text):
+
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = text.encode()
+    return(response)
+
+@pytest.mark.parametrize('status_code, text, fallback', [
+    # Errors about the document are returned, not sent again
+    (400, '{"message":"Invalid xml"}', False),
+    (500, '{"message":"Content-Encoding"}', False),
+    # Explicit rejections of the encoding
+    (415, '', True),
+    (400, '{"message":"Unsupported Content-Encoding"}', True),
+    (400, '{"message":"gzip not supported"}', True)])
+def test_compression_rejected(token, monkeypatch, status_code, text, fallback):
+
+    client = bhp_client(base_url='http://localhost', compression='gzip')
+    sent = []
+
+    def request(method, url, token, **kwargs):
+        sent.append(kwargs['headers'].get('Content-Encoding'))
+        return(gen_response(status_code, text) if len(sent) == 1 else gen_response(201, ''))
+
+    monkeypatch.setattr(client, 'request', request)
+    res = client.post_sourcedoc('http://localhost/api/validatie', 'validatie', '<a/>', token)
+
+    if fallback:
+        assert sent == ['gzip', None] and res.status_code == 201
+        assert client.compression_supported == {'validatie':False}
+    else:
+        assert sent == ['gzip'] and res.status_code == status_code
+        assert client.compression_supported == {'validatie':True}
+    assert client.transfer_stats()['fallbacks'] == int(fallback)
+
+# =============================================================================
+# Journal
+# =============================================================================
+
+def test_journal_resume(standin, client, token, tmp_path):
+
+    journal = upload_journal(str(tmp_path/'journal.sqlite'))
+    sourcedocs = gen_sourcedocs(5)
+
+    def broken():
+        raise IOError('disk error')
+
+    first = dict(sourcedocs, **{'3.xml':broken})
+    assert client.upload_sourcedocs(first, token, journal=journal, name='job', max_workers=2) == 'Error'
+    assert len(standin.sourcedocs) == 4
+    assert len(journal.documents('job')) == 4
+    assert journal.delivery_url('job') is None
+
+    # Only the missing document is added on the re-run
+    delivery = client.upload_sourcedocs(sourcedocs, token, journal=journal, name='job', max_workers=2)
+    assert delivery.json()['status'] == 'DOORGELEVERD'
+    assert len(standin.sourcedocs) == 5
+    assert len(standin.uploads) == 1
+    assert journal.delivery_id('job') == str(delivery.json()['id'])
+
+    # A delivered upload is not delivered again
+    again = client.upload_sourcedocs(sourcedocs, token, journal=journal, name='job')
+    assert again.json()['id'] == delivery.json()['id']
+    assert len(standin.deliveries) == 1
+
+def test_journal_default_name(standin, client, token, tmp_path):
+
+    journal = upload_journal(str(tmp_path/'journal.sqlite'))
+
+    delivery = client.upload_sourcedocs(iter(gen_sourcedocs(3).items()), token, journal=journal)
+    again = client.upload_sourcedocs(gen_sourcedocs(3), token, journal=journal)
+
+    assert again.json()['id'] == delivery.json()['id']
+
+def test_journal_streams_named_iterator(standin, client, token, tmp_path):
+
+    journal = upload_journal(str(tmp_path/'journal.sqlite'))
+    taken = []
+
+    def gen_iterator():
+        for filename, sourcedoc in gen_sourcedocs(20).items():
+            # Never far ahead of the documents added
+            assert len(taken)-len(standin.sourcedocs) <= 2*2
+            taken.append(filename)
+            yield((filename, sourcedoc))
+
+    delivery = client.upload_sourcedocs(gen_iterator(), token, journal=journal, name='job', max_workers=2)
+
+    assert delivery.json()['status'] == 'DOORGELEVERD'
+    assert len(journal.documents('job')) == 20
+
+def test_add_sourcedocs_status(client, token):
+
+    upload_url = client.create_upload(token)
+    status = client.add_sourcedocs(upload_url, {'a.xml':'<a/>', 'b.xml':lambda: io.BytesIO(b'<b/>')}, token, max_workers=2)
+
+    assert status == {'a.xml':201, 'b.xml':201}
+    assert all(sourcedoc_added(code) for code in status.values())
+
+def test_filenames_decoded(standin, client, token):
+
+    # Spaces, reserved and non-ASCII characters are quoted in the url
+    filenames = ['meting 1.xml', 'a&b=c.xml', 'peilbuis ø+é.xml']
+    delivery = client.upload_sourcedocs(dict((filename, '<a/>') for filename in filenames), token)
+
+    assert sorted(document['filename'] for document in delivery.json()['brondocumenten']) == sorted(filenames)
+
+def test_stores_from_paths_closed(client, token, tmp_path, monkeypatch):
+
+    closed = []
+    close = sqlite_store.close
+    monkeypatch.setattr(sqlite_store, 'close', lambda self: closed.append(type(self).__name__) or close(self))
+
+    delivery = client.upload_sourcedocs(gen_sourcedocs(2), token, journal=str(tmp_path/'journal.sqlite'), ledger=str(tmp_path/'ledger.sqlite'))
+
+    assert delivery.json()['status'] == 'DOORGELEVERD'
+    assert sorted(closed) == ['delivery_ledger', 'upload_journal']
+    assert len(delivery_ledger(str(tmp_path/'ledger.sqlite')).documents()) == 2
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.broxml.gld.constructables import gld_point_serializer, gen_points_columnar, gen_result_columns
+from gwmpy.broxml.gld.constructables import fragment_cache, gen_metadata, gen_metadata_cached, gen_procedure, gen_procedure_cached
+from gwmpy.broxml.mappings import ns_regreq_map_gld3, codespace_map_gld1
+
+from lxml import etree
+import datetime
+import numpy as np
+import pandas as pd
+
+import pytest
+
+records = [{'time':'2020-01-01T00:00:00+01:00', 'value':1.25, 'metadata':{'StatusQualityControl':'goedgekeurd', 'interpolationType':'Discontinuous'}},
+           {'time':'2020-01-01T01:00:00+01:00', 'value':'None', 'metadata':{'StatusQualityControl':'afgekeurd', 'interpolationType':'Discontinuous', 'censoredReason':'BELOWDETECTIONRANGE', 'censoringLimitvalue':0.5}},
+           {'time':'2020-01-01T02:00:00+01:00', 'value':-0.5, 'metadata':{'StatusQualityControl':'onbeslist', 'interpolationType':'Discontinuous', 'censoringLimitvalue':'<&>'}}]
+
+def gen_expected(time, value, StatusQualityControl, censoringLimitvalue=None, censoredReason=None):
+
+    # xml of a point as written by the element-wise generation (gen_point)
+    # of earlier versions
+    qualifier = ('<wml2:qualifier><swe:Category><swe:codeSpace xlink:href="urn:bro:gld:{}"/>'
+                 '<swe:value>{}</swe:value></swe:Category></wml2:qualifier>')
+    value = '<wml2:value uom="m">{}</wml2:value>'.format(value) if value is not None else '<wml2:value xsi:nil="true"/>'
+
+    return('<wml2:point><wml2:MeasurementTVP><wml2:time>{}</wml2:time>{}'.format(time, value)+
+           '<wml2:metadata><wml2:TVPMeasurementMetadata>'+qualifier.format('StatusQualityControl', StatusQualityControl)+
+           (qualifier.format('censoringLimitvalue', censoringLimitvalue) if censoringLimitvalue is not None else '')+
+           '<wml2:interpolationType xlink:href="http://www.opengis.net/def/waterml/2.0/interpolationType/Discontinuous"/>'+
+           ('<wml2:censoredReason xlink:href="http://www.opengis.net/def/nil/OGC/0/{}"/>'.format(censoredReason) if censoredReason is not None else '')+
+           '</wml2:TVPMeasurementMetadata></wml2:metadata></wml2:MeasurementTVP></wml2:point>')
+
+expected = [gen_expected('2020-01-01T00:00:00+01:00', 1.25, 'goedgekeurd'),
+            gen_expected('2020-01-01T01:00:00+01:00', None, 'afgekeurd', 0.5, 'BELOWDETECTIONRANGE'),
+            gen_expected('2020-01-01T02:00:00+01:00', -0.5, 'onbeslist', '&lt;&amp;&gt;')]
+
+def test_serializer_output():
+
+    serializer = gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1)
+
+    assert list(serializer.records(records)) == expected
+    assert list(serializer.columns(gen_result_columns({'result':records}))) == expected
+
+def test_serializer_prefixes():
+
+    # Prefixes come from nsmap, not from the default mapping
+    nsmap = dict(('ns_'+prefix, uri) for prefix, uri in ns_regreq_map_gld3.items())
+    columns = gen_result_columns({'result':records})
+
+    points = [point for chunk in gen_points_columnar(columns, nsmap, codespace_map_gld1, chunksize=2) for point in chunk]
+
+    assert [etree.tostring(point).decode().replace('ns_', '').split('>', 1)[1] for point in points] == [point.split('>', 1)[1] for point in expected]
+    assert b'<ns_wml2:point' in etree.tostring(points[0])
+
+def gen_record(value, **metadata):
+
+    return({'time':'t', 'value':value, 'metadata':dict({'StatusQualityControl':'goedgekeurd', 'interpolationType':'Discontinuous'}, **metadata)})
+
+@pytest.mark.parametrize('values, rendered', [
+    # As in a numeric DataFrame column, integers next to floats are floats
+    ([1, 1.5], ['1.0', '1.5']),
+    ([1, 2], ['1', '2']),
+    ([1, None], ['1.0', None]),
+    (['None', 1], [None, '1']),
+    ([True, 1.5], ['True', '1.5']),
+    # Empty values are nil, where earlier versions wrote 'nan' or 'None'
+    ([None, 1.5], [None, '1.5']),
+    ([float('nan')], [None]),
+    ([None], [None])])
+def test_serializer_values(values, rendered):
+
+    points = list(gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1).columns(gen_result_columns({'result':[gen_record(value) for value in values]})))
+
+    assert points == [gen_expected('t', value, 'goedgekeurd') for value in rendered]
+
+def test_serializer_empty_qualifiers():
+
+    # Empty censoringLimitvalue and censoredReason are left out, where
+    # earlier versions wrote 'None'
+    points = list(gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1).records([gen_record(1.5, censoringLimitvalue=None, censoredReason=None),
+                                                                                         gen_record(1.5, censoringLimitvalue=0, censoredReason='BELOWDETECTIONRANGE')]))
+
+    assert points == [gen_expected('t', 1.5, 'goedgekeurd'), gen_expected('t', 1.5, 'goedgekeurd', 0, 'BELOWDETECTIONRANGE')]
+
+def test_serializer_codespaces():
+
+    codespacemap = dict(codespace_map_gld1, StatusQualityControl='urn:test:StatusQualityControl')
+    fragment = next(gld_point_serializer(ns_regreq_map_gld3, codespacemap).records(records))
+
+    assert 'urn:test:StatusQualityControl' in fragment
+
+def test_serializer_missing_namespace():
+
+    nsmap = dict(ns_regreq_map_gld3)
+    del nsmap['swe']
+    with pytest.raises(Exception, match='swe'):
+        gld_point_serializer(nsmap, codespace_map_gld1)
+
+def test_serializer_templates_by_type():
+
+    # 0 == 0.0 == False and 1 == True, but they render differently
+    serializer = gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1)
+    values = [0, 0.0, False, 1, True, 1.0]
+    fragments = [serializer.point('2020-01-01T00:00:00+01:00', 1., (value, 'Discontinuous', None, None)) for value in values]
+
+    for value, fragment in zip(values, fragments):
+        assert '<swe:value>{}</swe:value>'.format(value) in fragment
+    assert len(serializer.templates) == len(values)
+
+times = ['2020-01-01T00:00:00', '2020-01-01T00:00:01', '2020-01-01T00:00:02']
+fractional = pd.to_datetime(['2020-01-01T00:00:00.5', '2020-01-01T00:00:01.25', '2020-01-01T00:00:02.999'])
+
+@pytest.mark.parametrize('time', [
+    fractional, pd.Series(fractional), fractional.values, list(fractional),
+    list(fractional.values), list(fractional.to_pydatetime()), times])
+def test_result_columns_times(time):
+
+    # Every datetime input gives the same string, without fractions of seconds
+    columns = gen_result_columns({'result':{'time':time, 'value':[1., 2., 3.],
+                                            'StatusQualityControl':['goedgekeurd']*3, 'interpolationType':['Discontinuous']*3}})
+
+    assert columns['time'] == times
+
+def test_result_columns_timezone():
+
+    time = pd.date_range('2020-01-01 00:00:00.5', periods=2, freq='h', tz='Europe/Amsterdam')
+    columns = gen_result_columns({'result':{'time':time, 'value':[1., 2.],
+                                            'StatusQualityControl':['goedgekeurd']*2, 'interpolationType':['Discontinuous']*2}})
+
+    assert columns['time'] == ['2020-01-01T00:00:00+01:00', '2020-01-01T01:00:00+01:00']
+
+    record = dict(gen_record(1.), time=datetime.datetime(2020, 1, 1, 0, 0, 0, 500000, tzinfo=datetime.timezone.utc))
+    points = list(gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1).records([record]))
+    assert '<wml2:time>2020-01-01T00:00:00+00:00</wml2:time>' in points[0]
+
+def test_result_columns_dataframe():
+
+    # Datetime index as time, NaN as empty cell
+    df = pd.DataFrame({'value':[1., np.nan, 3.],
+                       'StatusQualityControl':['goedgekeurd', 'onbeslist', 'goedgekeurd'],
+                       'interpolationType':['Discontinuous']*3,
+                       'censoringLimitvalue':[np.nan, 0.5, np.nan]},
+                      index=pd.to_datetime(times))
+    columns = gen_result_columns({'result':df})
+
+    assert columns['time'] == times
+    assert columns['value'][0] == 1. and columns['value'][1] != columns['value'][1]
+    assert columns['censoringLimitvalue'] == [None, 0.5, None]
+    assert columns['censoredReason'] == [None]*3
+
+    points = list(gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1).columns(columns))
+    assert points[1] == gen_expected(times[1], None, 'onbeslist', 0.5)
+
+def test_result_columns_dataframe_records():
+
+    # Records-style columns (time, value, metadata) equal the list of records
+    records = [dict(gen_record(value), time=time) for time, value in zip(times, [1, 2.5, None])]
+    serializer = gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1)
+
+    points = list(serializer.columns(gen_result_columns({'result':pd.DataFrame(records)})))
+
+    assert points == list(serializer.columns(gen_result_columns({'result':records})))
+    assert points == [gen_expected(time, value, 'goedgekeurd') for time, value in zip(times, ['1.0', '2.5', None])]
+
+@pytest.mark.parametrize('values', [
+    np.array([1.1, 2.5, np.nan], dtype=np.float32),
+    pd.Series([1.1, 2.5, np.nan], dtype=np.float32),
+    [np.float32(1.1), np.float32(2.5), None]])
+def test_result_columns_float32(values):
+
+    columns = gen_result_columns({'result':{'time':times, 'value':values,
+                                            'StatusQualityControl':['goedgekeurd']*3, 'interpolationType':['Discontinuous']*3}})
+    points = list(gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1).columns(columns))
+
+    assert points == [gen_expected(time, value, 'goedgekeurd') for time, value in zip(times, ['1.1', '2.5', None])]
+
+observation = {'metadata':{'status':'voorlopig', 'dateStamp':'2020-01-01',
+                           'parameters':{'principalInvestigator':{'europeanCompanyRegistrationNumber':'DEB8537.HRB66039'},
+                                         'observationType':'reguliereMeting'}},
+               'procedure':{'parameters':{'airPressureCompensationType':'KNMImeting', 'evaluationProcedure':'oordeelDeskundige',
+                                          'measurementInstrumentType':'akoestischeSensor'}}}
+
+def gen_ids(element):
+
+    return([value for node in element.iter() for name, value in node.attrib.items() if name == '{%s}id' % ns_regreq_map_gld3['gml']])
+
+def test_fragment_cache():
+
+    cache = fragment_cache(maxsize=2)
+    built = []
+
+    def builder(key):
+        return(lambda: built.append(key) or etree.Element(key))
+
+    first = cache.get('a', builder('a'))
+    second = cache.get('a', builder('a'))
+
+    # Built once, every request gets its own copy
+    assert built == ['a'] and (cache.hits, cache.misses) == (1, 1)
+    assert first is not second and first.tag == second.tag == 'a'
+    first.set('changed', '1')
+    assert cache.get('a', builder('a')).get('changed') is None
+
+    # Least recently used key is dropped beyond maxsize
+    cache.get('b', builder('b'))
+    cache.get('a', builder('a'))
+    cache.get('c', builder('c'))
+    assert list(cache.fragments.keys()) == ['a', 'c']
+    cache.get('b', builder('b'))
+    assert built == ['a', 'b', 'c', 'b'] and len(cache.fragments) == 2
+
+    cache.clear()
+    assert (cache.hits, cache.misses, len(cache.fragments)) == (0, 0, 0)
+
+def test_gen_metadata_cached():
+
+    cache = fragment_cache()
+    fragments = [gen_metadata_cached(observation, ns_regreq_map_gld3, codespace_map_gld1, cache) for i in range(2)]
+
+    assert [etree.tostring(fragment) for fragment in fragments] == [etree.tostring(gen_metadata(observation, ns_regreq_map_gld3, codespace_map_gld1))]*2
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Other input is another key
+    other = {'metadata':dict(observation['metadata'], status='volledigBeoordeeld')}
+    gen_metadata_cached(other, ns_regreq_map_gld3, codespace_map_gld1, cache)
+    gen_metadata_cached(observation, ns_regreq_map_gld3, dict(codespace_map_gld1, status='urn:other'), cache)
+    assert (cache.hits, cache.misses) == (1, 3)
+
+def test_gen_procedure_cached():
+
+    cache = fragment_cache()
+    fragments = [gen_procedure_cached(observation, ns_regreq_map_gld3, codespace_map_gld1, cache) for i in range(3)]
+    expected = gen_procedure(observation, ns_regreq_map_gld3, codespace_map_gld1)
+
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # Equal output with a fresh gml:id for every copy
+    ids = [gen_ids(fragment) for fragment in fragments]
+    assert all(len(fragment_ids) == 1 for fragment_ids in ids)
+    assert len(set(fragment_ids[0] for fragment_ids in ids)) == 3
+    normalized = [etree.tostring(fragment).replace(fragment_ids[0].encode(), b'_id') for fragment, fragment_ids in zip(fragments, ids)]
+    assert normalized == [etree.tostring(expected).replace(gen_ids(expected)[0].encode(), b'_id')]*3
+
+def test_serializer_sizes():
+
+    # Equal to the rendered points, also for non-ascii and unhashable values
+    values = [1.25, None, 'é<', 2, float('nan')]
+    qualifiers = [{}, {'censoringLimitvalue':0.5, 'censoredReason':'BELOWDETECTIONRANGE'}, {'censoringLimitvalue':'ö&'},
+                  {'censoringLimitvalue':[1]}, {}]
+    columns = gen_result_columns({'result':[dict(gen_record(value, **metadata), time='2020-01-01T00:00:00+01:00')
+                                            for value, metadata in zip(values, qualifiers)]})
+
+    serializer = gld_point_serializer(ns_regreq_map_gld3, codespace_map_gld1)
+    sizes = list(serializer.sizes(columns))
+
+    assert sizes == [len(point.encode('utf8')) for point in serializer.columns(columns)]
+    assert len(set(sizes)) > 1
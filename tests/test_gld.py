@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.broxml.gld.requests import gld_registration_request
+from gwmpy.broxml.gld.batch import gen_result_arrays, split_result, write_gld_additions, generate_gld_additions, generate_addition_job
+from gwmpy.broxml.gld import batch
+
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import re
+import time
+
+import pandas as pd
+import pytest
+
+def gen_results(n):
+
+    time = pd.date_range('2018-01-01', periods=n, freq='6h', tz='Europe/Amsterdam')
+    return([{'time':t.isoformat(),
+             'value':'None' if i%7==3 else round(-4.+i/1000, 3),
+             'metadata':dict({'StatusQualityControl':'afgekeurd' if i%7==3 else 'goedgekeurd', 'interpolationType':'Discontinuous'},
+                             **({'censoringLimitvalue':0, 'censoredReason':'BelowDetectionRange'} if i%7==3 else {}))}
+            for i, t in enumerate(time)])
+
+def gen_kwargs(results):
+
+    return({'requestReference':'ref', 'deliveryAccountableParty':'27376655', 'qualityRegime':'IMBRO', 'broId':'GLD000000000153',
+            'srcdocdata':{'metadata':{'status':'voorlopig', 'parameters':{'principalInvestigator':{'europeanCompanyRegistrationNumber':'DEB8537.HRB66039'},
+                                                                          'observationType':'reguliereMeting'}},
+                          'procedure':{'parameters':{'airPressureCompensationType':'KNMImeting', 'evaluationProcedure':'oordeelDeskundige',
+                                                     'measurementInstrumentType':'akoestischeSensor'}},
+                          'resultTime':results[-1]['time'],
+                          'result':results}})
+
+def normalize(xml):
+
+    # gml:ids are random uuids
+    return(re.sub(rb'_[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', b'_id', xml))
+
+@pytest.mark.parametrize('chunksize', [1, 7, 10000])
+def test_write_stream_equals_generate(chunksize):
+
+    request = gld_registration_request('GLD_Addition', **gen_kwargs(gen_results(50)))
+    request.generate()
+
+    target = io.BytesIO()
+    request.write_stream(target, chunksize=chunksize)
+
+    assert normalize(target.getvalue()) == normalize(request.request)
+
+def test_write_stream_iterable(tmp_path):
+
+    results = gen_results(20)
+    request = gld_registration_request('GLD_Addition', **gen_kwargs(results))
+    request.generate()
+
+    filename = str(tmp_path/'request.xml')
+    request.write_stream(filename, result=iter(results), phenomenonTime=(results[0]['time'], results[-1]['time']))
+
+    with open(filename, 'rb') as file:
+        assert normalize(file.read()) == normalize(request.request)
+
+def test_write_stream_iterable_needs_phenomenontime():
+
+    results = gen_results(2)
+    with pytest.raises(Exception, match='phenomenonTime'):
+        gld_registration_request('GLD_Addition', **gen_kwargs(results)).write_stream(io.BytesIO(), result=iter(results))
+
+# =============================================================================
+# Splitting long series
+# =============================================================================
+
+def test_split_result_maxpoints():
+
+    columns = gen_result_arrays({'result':gen_results(25)})
+
+    assert split_result(columns, maxpoints=10) == [(0, 10), (10, 20), (20, 25)]
+    assert split_result(columns) == [(0, 25)]
+
+def test_split_result_align():
+
+    # 4 points a day from 1 January, months never share a chunk
+    columns = gen_result_arrays({'result':gen_results(4*70)})
+    chunks = split_result(columns, maxpoints=100, align='month')
+
+    assert chunks == [(0, 100), (100, 124), (124, 224), (224, 236), (236, 280)]
+    for start, stop in chunks:
+        assert len(set(str(t)[:7] for t in columns['time'][start:stop])) == 1
+
+@pytest.mark.parametrize('maxpoints, maxbytes', [(None, 20000), (30, 20000), (None, 50000)])
+def test_write_gld_additions(tmp_path, maxpoints, maxbytes):
+
+    results = gen_results(200)
+    filenames = write_gld_additions(str(tmp_path), maxpoints=maxpoints, maxbytes=maxbytes, **gen_kwargs(results))
+
+    assert [os.path.basename(filename) for filename in filenames] == ['ref_{}.xml'.format(i+1) for i in range(len(filenames))]
+    assert all(os.path.getsize(filename) <= maxbytes for filename in filenames)
+
+    # Every point is written once, in order
+    times = []
+    for filename in filenames:
+        with open(filename, 'rb') as file:
+            times += re.findall(rb'<wml2:time>([^<]*)</wml2:time>', file.read())
+    assert times == [result['time'].encode() for result in results]
+    if maxpoints is not None:
+        assert len(filenames) >= 200/maxpoints
+
+# =============================================================================
+# Batch generation
+# =============================================================================
+
+def gen_jobs(n, points=10):
+
+    return([('GLD00000000{:04d}'.format(i), gen_kwargs(gen_results(points))['srcdocdata']) for i in range(n)])
+
+def gen_shared_kwargs():
+
+    return(dict((key, value) for key, value in gen_kwargs(gen_results(1)).items() if key not in ['srcdocdata', 'broId', 'requestReference']))
+
+def test_generate_gld_additions_bad_job():
+
+    jobs = gen_jobs(3)
+    jobs[1] = (jobs[1][0], dict(jobs[1][1], result=[{'time':'2018-01-01T00:00:00+01:00'}]))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = dict((result['broId'], result) for result in generate_gld_additions(jobs, executor=executor, **gen_shared_kwargs()))
+
+    assert sorted(results.keys()) == [broId for broId, srcdocdata in jobs]
+    assert results[jobs[1][0]]['error'] is not None and results[jobs[1][0]]['request'] is None
+    for broId in [jobs[0][0], jobs[2][0]]:
+        assert results[broId]['error'] is None
+        assert results[broId]['requestReference'] == 'GLD_Addition_{}'.format(broId)
+        assert broId.encode() in results[broId]['request']
+
+def test_generate_gld_additions_output_dir(tmp_path):
+
+    jobs = gen_jobs(4)
+    # Braces other than {broId} are kept in the reference
+    results = list(generate_gld_additions(jobs, max_workers=2, output_dir=str(tmp_path),
+                                          requestReference='{broId}_{x}', **gen_shared_kwargs()))
+
+    assert all(result['error'] is None and result['request'] is None for result in results)
+    assert sorted(os.path.basename(result['filename']) for result in results) == ['{}_{{x}}.xml'.format(broId) for broId, srcdocdata in jobs]
+    for result in results:
+        with open(result['filename'], 'rb') as file:
+            assert b'<wml2:point>' in file.read()
+
+def test_generate_gld_additions_completion_order(monkeypatch):
+
+    # The first job is the slowest, results are yielded when they complete
+    def slow_job(job, kwargs, output_dir=None):
+        if job[0] == 'GLD000000000000':
+            time.sleep(0.5)
+        return(generate_addition_job(job, kwargs, output_dir))
+
+    monkeypatch.setattr(batch, 'generate_addition_job', slow_job)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        order = [result['broId'] for result in generate_gld_additions(gen_jobs(4), executor=executor, **gen_shared_kwargs())]
+
+    assert order[-1] == 'GLD000000000000'
+    assert sorted(order) == [broId for broId, srcdocdata in gen_jobs(4)]
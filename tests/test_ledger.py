@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import bhp_client
+from gwmpy.bhp.ledger import delivery_ledger, gen_sourcedoc_info
+from gwmpy.bhp.poller import delivery_poller
+from gwmpy.bhp.standin import bhp_standin_server
+
+import os
+
+examples = os.path.join(os.path.dirname(__file__), '..', 'examples', 'output', 'gld')
+
+def read_example(name):
+
+    with open(os.path.join(examples, name), 'rb') as file:
+        return(file.read())
+
+def test_startregistration_ids():
+
+    info = gen_sourcedoc_info('start.xml', read_example('registration_request_gld_startregistration_test.xml'))
+
+    # A new GLD has no broId yet, the nets and tube are references
+    assert info['broId'] is None
+    assert info['requestReference'] == '10_GLD_StartRegistration'
+    assert info['references'] == ['GMN000000000083', 'GMN000000000084', 'GMW000000016118']
+
+def test_addition_ids():
+
+    with open(os.path.join(examples, 'registration_request_gld_addition_controle_test.xml'), 'rb') as file:
+        info = gen_sourcedoc_info('addition.xml', file)
+        assert file.tell() == 0
+
+    assert info['broId'] == 'GLD000000000153'
+    assert info['requestReference'] == '11_GLD_Addition_sensorisch'
+    assert info['references'] == []
+
+def test_record_and_poll(token, tmp_path):
+
+    ledger = delivery_ledger(str(tmp_path/'ledger.sqlite'))
+    sourcedocs = {'start.xml':read_example('registration_request_gld_startregistration_test.xml'),
+                  'addition.xml':read_example('registration_request_gld_addition_controle_test.xml')}
+
+    with bhp_standin_server(state_duration=0.2) as standin:
+        client = bhp_client(base_url=standin.url, pool_connections=1, pool_maxsize=1, max_retries=0)
+        delivery = client.upload_sourcedocs(sourcedocs, token, ledger=ledger)
+        delivery_id = str(delivery.json()['id'])
+
+        assert ledger.unfinished() == [delivery_id]
+        assert ledger.unfinished_broids() == ['GLD000000000153']
+        assert 'GMW000000016118' in ledger.unfinished_broids(referenced=True)
+        assert [row['delivery_id'] for row in ledger.deliveries(broId='GMW000000016118', referenced=True)] == [delivery_id]
+        assert ledger.deliveries(broId='GMW000000016118') == []
+
+        poller = delivery_poller(token, client=client, interval=0.05, ledger=ledger, timeout=5.)
+        poller.add(ledger.unfinished())
+        assert [result['status'] for result in poller.run()] == ['DOORGELEVERD']
+
+    assert ledger.unfinished() == []
+    assert ledger.status_counts() == {'DOORGELEVERD':1}
+    assert set(document['status'] for document in ledger.documents(delivery_id=delivery_id)) == {'OPGENOMEN_LVBRO'}
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import bhp_client
+from gwmpy.bhp.metrics import request_metrics, gen_endpoint, gen_response_size
+
+import pytest
+import requests
+
+def gen_span(duration, method='POST', endpoint='validatie', status=200, bytes_sent=10, bytes_received=5, retries=0):
+
+    return({'method':method, 'endpoint':endpoint, 'status':status, 'error':None, 'duration':duration,
+            'bytes_sent':bytes_sent, 'bytes_received':bytes_received, 'retries':retries})
+
+def test_endpoint():
+
+    assert gen_endpoint('https://host/api/uploads/12/brondocumenten?filename=a.xml') == 'brondocumenten'
+    assert gen_endpoint('https://host/api/leveringen/3') == 'leveringen'
+
+def test_quantiles():
+
+    metrics = request_metrics(buckets=[0.1, 0.2, 0.5])
+    for duration in [0.05, 0.05, 0.15, 0.15]:
+        metrics.request_end(gen_span(duration))
+
+    assert metrics.quantile(0.5) == pytest.approx(0.1)
+    assert metrics.quantile(0.75) == pytest.approx(0.15)
+    assert metrics.quantile(0.5, endpoint='uploads') is None
+
+    # Durations beyond the last bucket are estimated at its bound
+    metrics.request_end(gen_span(2., status=503))
+    assert metrics.quantile(1.) == 0.5
+    assert metrics.quantile(0.5, status='503') == 0.5
+
+    summary = metrics.summary()
+    assert summary[('POST', 'validatie', '200')]['count'] == 4
+    assert summary[('POST', 'validatie', '200')]['mean'] == pytest.approx(0.1)
+    assert summary[('POST', 'validatie', '503')]['bytes_sent'] == 10
+
+def test_prometheus():
+
+    metrics = request_metrics(buckets=[0.1, 0.5], prefix='test')
+    metrics.request_end(gen_span(0.05, retries=2))
+    metrics.request_end(gen_span(0.3))
+    metrics.request_end(dict(gen_span(1., method='GET', endpoint='leveringen', bytes_sent=0), status=None, error='Connection"Error'))
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert '# TYPE test_request_duration_seconds histogram' in lines
+    labels = 'method="POST",endpoint="validatie",status="200"'
+    assert [line for line in lines if line.startswith('test_request_duration_seconds') and labels in line] == [
+        'test_request_duration_seconds_bucket{'+labels+',le="0.1"} 1',
+        'test_request_duration_seconds_bucket{'+labels+',le="0.5"} 2',
+        'test_request_duration_seconds_bucket{'+labels+',le="+Inf"} 2',
+        'test_request_duration_seconds_sum{'+labels+'} 0.35',
+        'test_request_duration_seconds_count{'+labels+'} 2']
+    assert 'test_request_retries_total{'+labels+'} 2' in lines
+    assert 'test_request_bytes_sent_total{'+labels+'} 20' in lines
+    # Errors take the place of the status, quotes are escaped
+    assert 'test_request_duration_seconds_count{method="GET",endpoint="leveringen",status="Connection\\"Error"} 1' in lines
+
+def test_response_size():
+
+    response = requests.Response()
+    response._content = b'abc'
+    assert gen_response_size(response) == 3
+
+    response.headers['Content-Length'] = '10'
+    assert gen_response_size(response, streamed=True) == 10
+
+    # A streamed body without length is not read
+    streamed = requests.Response()
+    streamed.raw = None
+    assert gen_response_size(streamed, streamed=True) == 0
+
+def test_client_metrics(standin, token):
+
+    metrics = request_metrics()
+    client = bhp_client(base_url=standin.url, pool_connections=1, pool_maxsize=1, max_retries=0, instruments=[metrics])
+
+    client.validate_sourcedoc('<a/>', token)
+    client.validate_sourcedoc_summary('<a/>', token)
+
+    series = metrics.summary()[('POST', 'validatie', '200')]
+    assert series['count'] == 2
+    assert series['bytes_sent'] == 8
+    assert series['bytes_received'] > 0
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.pipeline import delivery_pipeline, run_pipeline
+from gwmpy.bhp.validation import validation_cache, gen_canonical_hash
+
+from concurrent.futures import ThreadPoolExecutor
+import uuid
+
+import pytest
+
+class broken_request():
+
+    # Request object without the requestReference that names its file
+    kwargs = {}
+
+    def generate(self):
+
+        raise ValueError('broken')
+
+@pytest.mark.parametrize('validate', [None, 'local', 'remote'])
+def test_pipeline(standin, client, token, validate):
+
+    jobs = [('{}.xml'.format(i), '<a>{}</a>'.format(i)) for i in range(10)]+[('bad.xml', '<a>')]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        report = delivery_pipeline(token, client=client, executor=executor, validate=validate, upload_size=4).run(jobs)
+
+    assert report['stages']['generate']['documents'] == 11
+    if validate is None:
+        # The invalid document is only rejected by the portal
+        assert report['stages']['upload']['documents'] == 11
+    else:
+        assert list(report['failed'].keys()) == ['bad.xml']
+        assert report['stages']['upload']['documents'] == 10
+        assert all(delivery['delivered'] for delivery in report['deliveries'])
+
+def test_failures_without_filename(client, token):
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        report = run_pipeline([broken_request(), ('a.xml', '<a/>'), broken_request()], token, client=client, executor=executor)
+
+    assert sorted(report['failed'].keys()) == ['job 0', 'job 2']
+    assert report['stages']['upload']['documents'] == 1
+
+def gen_generated(n):
+
+    # Documents that only differ in their random gml:ids
+    return([('{}.xml'.format(i), '<a xmlns:gml="http://www.opengis.net/gml/3.2"><b gml:id="_{}">1</b></a>'.format(uuid.uuid4()))
+            for i in range(n)])
+
+def test_cached_invalid_without_errors(client, token, tmp_path):
+
+    cache = validation_cache(str(tmp_path/'cache.sqlite'))
+    jobs = gen_generated(2)
+    cache.set(client.base_url, gen_canonical_hash(jobs[0][1], normalize_ids=True), {'status':'NIET_VALIDE', 'errors':[]})
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        report = run_pipeline(jobs, token, client=client, executor=executor, validate='remote', cache=cache)
+
+    # Every document hashes like the cached one, none is uploaded
+    assert sorted(report['failed'].keys()) == ['0.xml', '1.xml']
+    assert all('NIET_VALIDE' in reason for reason in report['failed'].values())
+    assert report['stages']['upload']['documents'] == 0
+
+def test_cache_hits_generated_documents(standin, client, token, tmp_path):
+
+    cache = validation_cache(str(tmp_path/'cache.sqlite'))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for run in range(2):
+            report = run_pipeline(gen_generated(3), token, client=client, executor=executor, validate='remote', cache=cache, max_validators=1)
+            assert report['stages']['upload']['documents'] == 3
+
+    assert standin.requests['validatie'] == 1
+    assert cache.hits == 5
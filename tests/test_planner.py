@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.planner import plan_uploads, upload_sourcedocs_planned, gen_sourcedoc_broid
+
+import os
+
+import pytest
+
+def gen_request(broId=None, reference=None, size=0):
+
+    request = '<registrationRequest><requestReference>r</requestReference>'
+    if broId is not None:
+        request += '<broId>{}</broId>'.format(broId)
+    request += '<sourceDocument>'
+    if reference is not None:
+        request += '<GroundwaterMonitoringNet><broId>{}</broId></GroundwaterMonitoringNet>'.format(reference)
+    return(request+'x'*size+'</sourceDocument></registrationRequest>')
+
+def filenames(uploads):
+
+    return([[filename for filename, sourcedoc in upload] for upload in uploads])
+
+def test_group_by_request_broid():
+
+    assert gen_sourcedoc_broid('a.xml', gen_request('GLD1', 'GMN1')) == 'GLD1'
+    # A new object is its own group, not the group of the net it refers to
+    assert gen_sourcedoc_broid('start.xml', gen_request(None, 'GMN1')) == 'start.xml'
+
+    sourcedocs = [('start.xml', gen_request(None, 'GMN1')),
+                  ('a1.xml', gen_request('GMN1')),
+                  ('b1.xml', gen_request('GLD2')),
+                  ('a2.xml', gen_request('GMN1'))]
+    assert filenames(plan_uploads(sourcedocs, maxdocs=2)) == [['start.xml', 'b1.xml'], ['a1.xml', 'a2.xml']]
+
+def test_oversized_group_is_split():
+
+    sourcedocs = [('a{}.xml'.format(i), gen_request('GLD1')) for i in range(5)]+[('b.xml', gen_request('GLD2'))]
+    uploads = plan_uploads(sourcedocs, maxdocs=2)
+
+    assert filenames(uploads) == [['a0.xml', 'a1.xml'], ['a2.xml', 'a3.xml'], ['a4.xml', 'b.xml']]
+    assert all(len(upload) <= 2 for upload in uploads)
+
+def test_oversized_document():
+
+    with pytest.raises(Exception, match='larger than maxbytes'):
+        plan_uploads({'a.xml':gen_request('GLD1', size=1000)}, maxbytes=500)
+
+def test_files_not_read(tmp_path):
+
+    opened = []
+
+    class head_file():
+        # File that fails if more than the head is read
+        def __init__(self, path):
+            self.file = open(path, 'rb')
+            opened.append(self)
+        def read(self, size=-1):
+            assert 0 < size <= 1024
+            return(self.file.read(size))
+        def __getattr__(self, name):
+            return(getattr(self.file, name))
+
+    sourcedocs = []
+    for i in range(4):
+        path = str(tmp_path/'{}.xml'.format(i))
+        with open(path, 'w') as file:
+            file.write(gen_request('GLD{}'.format(i % 2), size=10000))
+        sourcedocs.append((os.path.basename(path), lambda path=path: head_file(path)))
+
+    uploads = plan_uploads(sourcedocs, maxbytes=25000, headsize=1024)
+
+    assert filenames(uploads) == [['0.xml', '2.xml'], ['1.xml', '3.xml']]
+    assert all(document.closed for document in opened)
+    # Documents are returned unread
+    assert all(callable(sourcedoc) for upload in uploads for filename, sourcedoc in upload)
+
+def test_upload_planned(client, token, tmp_path):
+
+    paths = []
+    for i in range(6):
+        paths.append(str(tmp_path/'{}.xml'.format(i)))
+        with open(paths[-1], 'w') as file:
+            file.write(gen_request('GLD{}'.format(i % 3)))
+
+    sourcedocs = [(os.path.basename(path), lambda path=path: open(path, 'rb')) for path in paths]
+    result = upload_sourcedocs_planned(sourcedocs, token, maxdocs=2, client=client)
+
+    assert len(result['uploads']) == 3
+    assert sorted(result['delivered']) == sorted(os.path.basename(path) for path in paths)
+    assert result['failed'] == []
+    assert all(upload['bytes'] == 2*os.path.getsize(paths[0]) for upload in result['uploads'])
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import bhp_client
+from gwmpy.bhp.poller import delivery_poller, poll_deliveries
+from gwmpy.bhp.standin import bhp_standin_server
+
+import time
+
+def test_first_poll_after_interval(client, token):
+
+    delivery_id = client.upload_sourcedocs({'a.xml':'<a/>'}, token).json()['id']
+    poller = delivery_poller(token, client=client, interval=0.3, jitter=0.)
+
+    start = time.monotonic()
+    poller.add(delivery_id)
+    results = poller.run()
+
+    assert time.monotonic()-start >= 0.3
+    assert results[0]['polls'] == 1
+    assert results[0]['status'] == 'DOORGELEVERD'
+
+def test_poll_until_finished(token):
+
+    with bhp_standin_server(state_duration=0.2) as standin:
+        client = bhp_client(base_url=standin.url, pool_connections=1, pool_maxsize=4, max_retries=0)
+        identifiers = [client.upload_sourcedocs({'a.xml':'<a/>'}, token).json()['id'],
+                       client.upload_sourcedocs({'b.xml':'<b>'}, token).json()['id']]
+
+        results = list(poll_deliveries(identifiers, token, client=client, interval=0.05, max_interval=0.1, max_workers=2))
+
+    assert dict((result['identifier'], result['status']) for result in results) == {identifiers[0]:'DOORGELEVERD',
+                                                                                      identifiers[1]:'AFGEKEURD'}
+    assert all(result['error'] is None for result in results)
+
+def test_unknown_delivery(client, token):
+
+    poller = delivery_poller(token, client=client, interval=0.01)
+    poller.add(12345)
+    assert poller.run()[0]['error'].startswith('Error: status code 404')
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.connector import bhp_client
+from gwmpy.bhp.ratelimit import adaptive_limiter
+from gwmpy.bhp.standin import bhp_standin_server
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+class fake_response():
+
+    def __init__(self, status_code, headers=None):
+
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+
+        self.closed = True
+
+def test_throttled_responses_closed():
+
+    limiter = adaptive_limiter(retries=3, backoff=0.01)
+    responses = [fake_response(429, {'Retry-After':'0'}), fake_response(503), fake_response(200)]
+    sent = iter(responses)
+
+    assert limiter.send('GET leveringen', lambda: next(sent)) is responses[-1]
+    assert [response.closed for response in responses] == [True, True, False]
+    assert limiter.stats()['retries'] == 2
+    assert limiter.stats()['throttled'] == 2
+
+def test_last_throttled_response_returned():
+
+    limiter = adaptive_limiter(retries=1, backoff=0.01)
+    response = limiter.send('GET leveringen', lambda: fake_response(429))
+
+    assert response.status_code == 429
+    assert not response.closed
+
+def test_concurrency_limit():
+
+    limiter = adaptive_limiter(concurrency=2, min_concurrency=2, max_concurrency=2)
+    inflight = []
+    lock = threading.Lock()
+
+    def send():
+        with lock:
+            inflight.append(limiter.stats()['inflight'])
+        time.sleep(0.01)
+        return(fake_response(200))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda i: limiter.send('POST validatie', send), range(32)))
+
+    assert max(inflight) <= 2
+    assert limiter.stats()['requests'] == 32
+
+def test_throttling_standin(token):
+
+    with bhp_standin_server(throttle_rate=50, throttle_burst=5) as standin:
+        client = bhp_client(base_url=standin.url, pool_connections=1, pool_maxsize=8, max_retries=0,
+                            limiter=adaptive_limiter(rate=40, burst=5, concurrency=8))
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda i: client.validate_sourcedoc('<a/>', token), range(40)))
+
+    assert all(result['status'] == 'VALIDE' for result in results)
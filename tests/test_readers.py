@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.broxml.gld.readers import read_arrow_result, read_parquet_result
+from gwmpy.broxml.gld.constructables import gen_result_columns
+
+import datetime
+import numpy as np
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.parquet
+
+cet = datetime.timezone(datetime.timedelta(hours=1))
+
+def gen_table(time):
+
+    return(pa.table({'time':time,
+                     'value':pa.array([1.5, None, -0.25]),
+                     'StatusQualityControl':['goedgekeurd','afgekeurd','onbeslist'],
+                     'interpolationType':['Discontinuous']*3,
+                     'censoringLimitvalue':pa.array([None, 1, None], pa.int64())}))
+
+@pytest.mark.parametrize('time, expected', [
+    (pa.array([datetime.datetime(2020,1,1,h) for h in range(3)], pa.timestamp('s')),
+     ['2020-01-01T0{}:00:00'.format(h) for h in range(3)]),
+    (pa.array([datetime.datetime(2020,1,1,h,tzinfo=cet) for h in range(3)], pa.timestamp('s', tz='+01:00')),
+     ['2020-01-01T0{}:00:00+01:00'.format(h) for h in range(3)]),
+    (pa.array(['2020-01-01T0{}:00:00+01:00'.format(h) for h in range(3)]),
+     ['2020-01-01T0{}:00:00+01:00'.format(h) for h in range(3)])])
+def test_read_arrow_result(time, expected):
+
+    table = gen_table(time)
+    result = read_arrow_result(table)
+
+    assert all(isinstance(values, np.ndarray) for values in result.values())
+    assert 'censoredReason' not in result.keys()
+
+    columns = gen_result_columns({'result':result})
+    assert columns['time'] == expected
+    assert columns['value'][0] == 1.5 and np.isnan(columns['value'][1])
+    assert columns['censoringLimitvalue'] == [None, 1, None]
+
+def test_read_arrow_result_shared_buffers():
+
+    table = gen_table(pa.array([datetime.datetime(2020,1,1,h) for h in range(3)], pa.timestamp('s')))
+    table = table.set_column(1, 'value', pa.array([1.5, 2., -0.25]))
+    result = read_arrow_result(table)
+
+    for column in ['time','value']:
+        assert np.shares_memory(result[column], table.column(column).chunk(0).to_numpy())
+
+def test_read_parquet_result(tmp_path):
+
+    time = pa.array([datetime.datetime(2020,1,1,h,tzinfo=cet) for h in range(3)], pa.timestamp('s', tz='+01:00'))
+    pa.parquet.write_table(gen_table(time).rename_columns(['t','v','StatusQualityControl','interpolationType','censoringLimitvalue']), tmp_path / 'result.parquet')
+
+    result = read_parquet_result(str(tmp_path / 'result.parquet'), columns={'time':'t', 'value':'v'})
+
+    assert gen_result_columns({'result':result})['time'][-1] == '2020-01-01T02:00:00+01:00'
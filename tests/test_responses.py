@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.responses import json_stream, gen_chunks, parse_validation_response, parse_delivery_response, error_table, validation_error
+
+import io
+import json
+
+import pytest
+
+report = {'status':'NIET_VALIDE',
+          'errors':['cvc-type.3.1.3: The value "x" of element "value" is not valid.',
+                    {'code':'GLD-001', 'xpath':'/registrationRequest/broId', 'message':'Unknown broId'},
+                    {'foutcode':'GLD-002', 'locatie':{'regel':12}, 'omschrijving':'Tijd ontbreekt \\"time\\" ø'},
+                    'no code here'],
+          'id':42,
+          'valid':False,
+          'extra':{'a':[1, 2.5e3, None, True]}}
+
+def gen_split(text, size):
+
+    return([text[i:i+size] for i in range(0, len(text), size)])
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 100000])
+def test_json_stream_chunks(size):
+
+    # Chunks split keys, strings, escapes and numbers
+    text = json.dumps(report, ensure_ascii=False)
+    stream = json_stream(gen_chunks(gen_split(text, size)))
+
+    assert dict((key, list(value) if key == 'errors' else value) for key, value in stream.members(['errors'])) == report
+
+def test_json_stream_number_at_end():
+
+    assert json_stream(gen_chunks(['12', '34'])).value() == 1234
+    assert json_stream(gen_chunks(['[1', '0 , 2', '0]'])).value() == [10, 20]
+
+def test_json_stream_invalid():
+
+    with pytest.raises(Exception, match='invalid json'):
+        json_stream(gen_chunks(['{"a": [1, 2'])).value()
+    with pytest.raises(Exception, match='invalid json'):
+        list(json_stream(gen_chunks(['{"a" 1}'])).members([]))
+
+def test_json_stream_large_value():
+
+    # A value of many chunks is collected, not decoded again per chunk
+    text = json.dumps({'errors':['x'*1000]*2000})
+    stream = json_stream(gen_chunks(gen_split(text, 512)))
+
+    assert len(next(iter(stream.members([])))[1]) == 2000
+
+@pytest.mark.parametrize('source', [
+    lambda text: text,
+    lambda text: text.encode('utf8'),
+    lambda text: io.BytesIO(text.encode('utf8')),
+    lambda text: io.StringIO(text),
+    lambda text: gen_split(text.encode('utf8'), 5)]) # splits multibyte characters
+def test_parse_validation_response(source):
+
+    summary = parse_validation_response(source(json.dumps(report, ensure_ascii=False)), max_errors=3, max_message=20)
+
+    assert summary['status'] == 'NIET_VALIDE'
+    assert summary['count'] == 4
+    assert summary['fields'] == {'id':42, 'valid':False, 'extra':report['extra']}
+    assert summary['errors'] == [validation_error('cvc-type.3.1.3', None, 'The value "x" of ele...'),
+                                 validation_error('GLD-001', '/registrationRequest/broId', 'Unknown broId'),
+                                 validation_error('GLD-002', '{"regel": 12}', 'Tijd ontbreekt \\"tim...')]
+
+def test_parse_validation_response_string_errors():
+
+    summary = parse_validation_response('{"errors": ["no code here"], "status": "NIET_VALIDE"}')
+
+    assert summary['errors'] == [validation_error(None, None, 'no code here')]
+
+def test_parse_delivery_response():
+
+    delivery = {'id':7, 'status':'AFGEKEURD',
+                'brondocumenten':[{'id':1, 'filename':'a.xml', 'status':'OPGENOMEN_LVBRO', 'errors':[]},
+                                  {'id':2, 'bestandsnaam':'b.xml', 'status':'AFGEKEURD', 'fouten':['e1: x', 'e2: y', 'e3: z']}]}
+
+    summary = parse_delivery_response(gen_split(json.dumps(delivery), 4), max_errors=2)
+
+    assert summary['status'] == 'AFGEKEURD'
+    assert summary['fields'] == {'id':7}
+    assert [(document['filename'], document['count'], len(document['errors'])) for document in summary['brondocumenten']] == [('a.xml', 0, 0), ('b.xml', 3, 2)]
+
+def test_error_table():
+
+    table = error_table()
+    table.add('a.xml', parse_validation_response(json.dumps(report)))
+    table.extend({'b.xml':parse_validation_response('{"status": "NIET_VALIDE", "errors": [{"code": "GLD-001", "message": "m"}]}'),
+                  'c.xml':parse_validation_response('{"status": "VALIDE", "errors": []}')})
+
+    assert table.documents['c.xml'] == {'status':'VALIDE', 'count':0}
+    assert len(table.records()) == 5
+    assert table.counts() == {'GLD-001':{'errors':2, 'documents':2},
+                              'cvc-type.3.1.3':{'errors':1, 'documents':1},
+                              'GLD-002':{'errors':1, 'documents':1},
+                              None:{'errors':1, 'documents':1}}
+    assert list(table.counts().keys())[0] == 'GLD-001'
+    assert list(table.to_dataframe().columns) == error_table.columns
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.retrieval import sourcedoc_cache, fetch_sourcedocuments
+
+def upload(client, token, sourcedocs):
+
+    delivery = client.upload_sourcedocs(sourcedocs, token)
+    return([document['id'] for document in delivery.json()['brondocumenten']])
+
+def test_fetch_cached(standin, client, token, tmp_path):
+
+    identifiers = upload(client, token, dict(('{}.xml'.format(i), '<a>{}</a>'.format(i)) for i in range(10)))
+    cache = sourcedoc_cache(str(tmp_path/'cache'))
+
+    contents = fetch_sourcedocuments(identifiers, token, cache=cache, client=client)
+    assert [contents[identifier] for identifier in identifiers] == ['<a>{}</a>'.format(i).encode() for i in range(10)]
+    assert standin.stats()['requests']['brondocumenten'] == 10+10
+
+    assert fetch_sourcedocuments(identifiers, token, cache=cache, client=client, max_workers=1) == contents
+    assert standin.stats()['requests']['brondocumenten'] == 10+10
+    assert cache.hits == 10
+
+def test_fetch_unknown(client, token):
+
+    contents = fetch_sourcedocuments([12345], token, client=client)
+    assert contents[12345].startswith('Error: status code 404')
+
+def test_cache_separates_environments(client, other_client, token, tmp_path):
+
+    # The same identifiers in both environments, with different contents
+    identifiers = upload(client, token, {'a.xml':'<a>production</a>'})
+    assert upload(other_client, token, {'a.xml':'<a>demo</a>'}) == identifiers
+    cache = sourcedoc_cache(str(tmp_path/'cache'))
+
+    first = fetch_sourcedocuments(identifiers, token, cache=cache, client=client)
+    second = fetch_sourcedocuments(identifiers, token, cache=cache, client=other_client)
+
+    assert first[identifiers[0]] == b'<a>production</a>'
+    assert second[identifiers[0]] == b'<a>demo</a>'
+    assert cache.get(client.base_url, identifiers[0]) == b'<a>production</a>'
+
+def test_cache_eviction(tmp_path):
+
+    cache = sourcedoc_cache(str(tmp_path/'cache'), maxbytes=None)
+    for i in range(10):
+        cache.put('http://localhost/api', i, '<a>{}</a>'.format(i).encode()*100)
+    cache.maxbytes = cache.size()//2
+
+    assert cache.evict() > 0
+    assert cache.size() <= cache.maxbytes
+    assert cache.get('http://localhost/api', 9) is not None
+    assert cache.get('http://localhost/api', 0) is None
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.ratelimit import adaptive_limiter
+from gwmpy.bhp.scheduler import request_scheduler, in_window
+
+import datetime
+import threading
+import time
+
+def gen_closed_window():
+
+    # A window of one hour starting two hours from now
+    now = datetime.datetime.now()
+    start = (now+datetime.timedelta(hours=2)).strftime('%H:%M')
+    end = (now+datetime.timedelta(hours=3)).strftime('%H:%M')
+    assert not in_window([(start, end)], now)
+    return([(start, end)])
+
+def test_in_window_past_midnight():
+
+    assert in_window([('22:00','06:00')], datetime.datetime(2024, 1, 1, 23, 30))
+    assert in_window([('22:00','06:00')], datetime.datetime(2024, 1, 1, 5, 59))
+    assert not in_window([('22:00','06:00')], datetime.datetime(2024, 1, 1, 12, 0))
+
+def test_urgent_not_blocked_by_bulk_outside_window(client, token):
+
+    client.limiter = adaptive_limiter(concurrency=2, min_concurrency=2, max_concurrency=2)
+    scheduler = request_scheduler(max_concurrency=4, reserved=1, windows={'bulk':gen_closed_window()}, recheck=0.1)
+    bulk = scheduler.client(client, priority='bulk')
+    urgent = scheduler.client(client, priority='urgent')
+
+    bulk_results = []
+    threads = [threading.Thread(target=lambda: bulk_results.append(bulk.validate_sourcedoc('<a/>', token)), daemon=True)
+               for i in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.3)
+    assert scheduler.stats()['bulk']['waiting'] == 2
+    assert client.limiter.stats()['inflight'] == 0
+
+    start = time.monotonic()
+    assert urgent.validate_sourcedoc('<a/>', token)['status'] == 'VALIDE'
+    assert time.monotonic()-start < 2.
+    assert len(bulk_results) == 0
+
+    # Opening the window lets the bulk requests through
+    with scheduler.condition:
+        scheduler.windows = {}
+        scheduler.dispatch()
+    for thread in threads:
+        thread.join(5.)
+    assert [result['status'] for result in bulk_results] == ['VALIDE', 'VALIDE']
+
+def test_urgent_before_bulk(client, token):
+
+    scheduler = request_scheduler(max_concurrency=1, reserved=0)
+    order = []
+
+    # Hold the only slot, queue bulk before urgent requests
+    scheduler.acquire('normal', 'holder')
+    bulk = scheduler.client(client, priority='bulk')
+    urgent = scheduler.client(client, priority='urgent')
+    threads = [threading.Thread(target=lambda: (bulk.validate_sourcedoc('<a/>', token), order.append('bulk'))),
+               threading.Thread(target=lambda: (urgent.validate_sourcedoc('<a/>', token), order.append('urgent')))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.1)
+    scheduler.release('normal')
+    for thread in threads:
+        thread.join(5.)
+
+    assert order == ['urgent', 'bulk']
+    assert scheduler.stats()['urgent']['requests'] == 1
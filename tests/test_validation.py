@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from gwmpy.bhp.validation import validation_cache, validate_sourcedocs, gen_canonical_hash
+
+sourcedocs = {'valid.xml':'<a xmlns:gml="http://www.opengis.net/gml/3.2"><b gml:id="id1">1</b></a>',
+              'invalid.xml':'<a><b></a>'}
+
+def test_canonical_hash():
+
+    assert gen_canonical_hash('<a  x="1" y="2"/>') == gen_canonical_hash(b'<a y="2" x="1"></a>')
+    assert gen_canonical_hash(sourcedocs['valid.xml']) != gen_canonical_hash(sourcedocs['valid.xml'].replace('id1', 'id2'))
+    assert gen_canonical_hash(sourcedocs['valid.xml'], True) == gen_canonical_hash(sourcedocs['valid.xml'].replace('id1', 'id2'), True)
+
+def test_cached_results(standin, client, token, tmp_path):
+
+    cache = validation_cache(str(tmp_path/'validation.sqlite'))
+
+    results = validate_sourcedocs(sourcedocs, token, cache=cache, client=client)
+    assert results['valid.xml']['status'] == 'VALIDE'
+    assert results['invalid.xml']['status'] == 'NIET_VALIDE'
+    assert standin.stats()['requests']['validatie'] == 2
+
+    assert validate_sourcedocs(sourcedocs, token, cache=cache, client=client, max_workers=1) == results
+    assert standin.stats()['requests']['validatie'] == 2
+    assert cache.hits == 2
+
+def test_cache_separates_environments(standin, client, other_client, token, tmp_path):
+
+    cache = validation_cache(str(tmp_path/'validation.sqlite'))
+
+    validate_sourcedocs(sourcedocs, token, cache=cache, client=client)
+    validate_sourcedocs(sourcedocs, token, cache=cache, client=other_client)
+
+    # Every environment validated the documents itself
+    assert standin.stats()['requests']['validatie'] == 2
+    assert other_client.standin.stats()['requests']['validatie'] == 2
+    assert cache.execute('SELECT COUNT(DISTINCT base_url) FROM results')[0][0] == 2